@@ -0,0 +1,36 @@
+"""add consultation input hashes
+
+Revision ID: a2b3c4d5e6f7
+Revises: f0a1b2c3d4e5
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "a2b3c4d5e6f7"
+down_revision: Union[str, None] = "f0a1b2c3d4e5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default: existing rows are not rewritten, and their fields
+    # count as stale until regenerated once
+    op.add_column(
+        "consultations",
+        sa.Column(
+            "input_hashes",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+            server_default=sa.text("'{}'::jsonb"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("consultations", "input_hashes")
@@ -0,0 +1,106 @@
+"""add chat sessions
+
+Revision ID: a5b6c7d8e9f0
+Revises: f4a5b6c7d8e9
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "a5b6c7d8e9f0"
+down_revision: Union[str, None] = "f4a5b6c7d8e9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 5000
+
+# Aggregates one batch of (patient_id, session_id) keys into chat_sessions;
+# title, preview and consultation follow app/services/chat_sessions.py
+BACKFILL_SQL = sa.text("""
+    INSERT INTO chat_sessions (
+        id, owner_id, session_id, title, consultation_id,
+        message_count, last_message_at, preview, created_at
+    )
+    SELECT
+        gen_random_uuid(),
+        m.patient_id,
+        m.session_id,
+        left(split_part(btrim((array_agg(m.content ORDER BY m.created_at)
+            FILTER (WHERE m.role = 'user'))[1]), E'\\n', 1), 80),
+        (array_agg(m.consultation_id ORDER BY m.created_at DESC)
+            FILTER (WHERE m.consultation_id IS NOT NULL))[1],
+        count(*),
+        max(m.created_at),
+        left((array_agg(m.content ORDER BY m.created_at DESC))[1], 200),
+        min(m.created_at)
+    FROM chat_messages m
+    WHERE (m.patient_id, m.session_id) > (:after_patient, :after_session)
+      AND (m.patient_id, m.session_id) <= (:upto_patient, :upto_session)
+    GROUP BY m.patient_id, m.session_id
+    ON CONFLICT (owner_id, session_id) DO NOTHING
+""")
+
+NEXT_KEYS_SQL = sa.text("""
+    SELECT patient_id, session_id FROM (
+        SELECT DISTINCT patient_id, session_id FROM chat_messages
+        WHERE (patient_id, session_id) > (:after_patient, :after_session)
+        ORDER BY patient_id, session_id
+        LIMIT :batch
+    ) keys
+    ORDER BY patient_id DESC, session_id DESC
+    LIMIT 1
+""")
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_chat_messages_patient_session_created",
+        "chat_messages",
+        ["patient_id", "session_id", "created_at"],
+    )
+    op.create_table(
+        "chat_sessions",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("owner_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("session_id", sa.String(length=255), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=True),
+        sa.Column(
+            "consultation_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("consultations.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+        sa.Column("message_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("last_message_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("preview", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.UniqueConstraint("owner_id", "session_id", name="uq_chat_sessions_owner_session"),
+    )
+    op.create_index(
+        "ix_chat_sessions_owner_last_message",
+        "chat_sessions",
+        ["owner_id", "last_message_at", "id"],
+    )
+
+    # Backfill in keyset-ordered batches of sessions so no single statement
+    # aggregates the whole chat_messages table
+    conn = op.get_bind()
+    after = {"after_patient": uuid.UUID(int=0), "after_session": ""}
+    while True:
+        upto = conn.execute(NEXT_KEYS_SQL, {**after, "batch": BACKFILL_BATCH}).first()
+        if upto is None:
+            break
+        conn.execute(BACKFILL_SQL, {**after, "upto_patient": upto.patient_id, "upto_session": upto.session_id})
+        after = {"after_patient": upto.patient_id, "after_session": upto.session_id}
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_sessions_owner_last_message", table_name="chat_sessions")
+    op.drop_table("chat_sessions")
+    op.drop_index("ix_chat_messages_patient_session_created", table_name="chat_messages")
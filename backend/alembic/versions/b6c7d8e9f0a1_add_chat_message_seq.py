@@ -0,0 +1,90 @@
+"""add chat message seq
+
+Revision ID: b6c7d8e9f0a1
+Revises: a5b6c7d8e9f0
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b6c7d8e9f0a1"
+down_revision: Union[str, None] = "a5b6c7d8e9f0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 5000
+
+NEXT_KEYS_SQL = sa.text("""
+    SELECT patient_id, session_id FROM (
+        SELECT DISTINCT patient_id, session_id FROM chat_messages
+        WHERE (patient_id, session_id) > (:after_patient, :after_session)
+        ORDER BY patient_id, session_id
+        LIMIT :batch
+    ) keys
+    ORDER BY patient_id DESC, session_id DESC
+    LIMIT 1
+""")
+
+# Numbers one batch of sessions. Only the order within a session matters,
+# so seq follows created_at per session and batches take consecutive ranges.
+BACKFILL_SQL = sa.text("""
+    WITH numbered AS (
+        SELECT id, row_number() OVER (ORDER BY patient_id, session_id, created_at, id) AS rn
+        FROM chat_messages
+        WHERE (patient_id, session_id) > (:after_patient, :after_session)
+          AND (patient_id, session_id) <= (:upto_patient, :upto_session)
+    )
+    UPDATE chat_messages m SET seq = :base + n.rn
+    FROM numbered n
+    WHERE m.id = n.id
+""")
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE chat_messages_seq_seq")
+    op.add_column("chat_messages", sa.Column("seq", sa.BigInteger(), nullable=True))
+
+    conn = op.get_bind()
+    after = {"after_patient": uuid.UUID(int=0), "after_session": ""}
+    base = 0
+    while True:
+        upto = conn.execute(NEXT_KEYS_SQL, {**after, "batch": BACKFILL_BATCH}).first()
+        if upto is None:
+            break
+        result = conn.execute(
+            BACKFILL_SQL,
+            {**after, "upto_patient": upto.patient_id, "upto_session": upto.session_id, "base": base},
+        )
+        base += result.rowcount
+        after = {"after_patient": upto.patient_id, "after_session": upto.session_id}
+
+    # New messages continue after every backfilled one
+    op.execute(sa.text("SELECT setval('chat_messages_seq_seq', :next, false)").bindparams(next=base + 1))
+    op.execute("ALTER SEQUENCE chat_messages_seq_seq OWNED BY chat_messages.seq")
+    op.alter_column(
+        "chat_messages", "seq",
+        nullable=False, server_default=sa.text("nextval('chat_messages_seq_seq')"),
+    )
+
+    op.create_index(
+        "ix_chat_messages_patient_session_seq",
+        "chat_messages",
+        ["patient_id", "session_id", "seq"],
+    )
+    op.drop_index("ix_chat_messages_patient_session_created", table_name="chat_messages")
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_chat_messages_patient_session_created",
+        "chat_messages",
+        ["patient_id", "session_id", "created_at"],
+    )
+    op.drop_index("ix_chat_messages_patient_session_seq", table_name="chat_messages")
+    # Dropping the column also drops the sequence it owns
+    op.drop_column("chat_messages", "seq")
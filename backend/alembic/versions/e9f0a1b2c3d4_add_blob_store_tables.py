@@ -0,0 +1,54 @@
+"""add blob store tables
+
+Revision ID: e9f0a1b2c3d4
+Revises: d8e9f0a1b2c3
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "e9f0a1b2c3d4"
+down_revision: Union[str, None] = "d8e9f0a1b2c3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(length=64), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("last_linked_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.create_table(
+        "consultation_blobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "consultation_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("consultations.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("sha256", sa.String(length=64), sa.ForeignKey("blobs.sha256"), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("mime_type", sa.String(length=100), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.UniqueConstraint("consultation_id", "sha256", name="uq_consultation_blobs_consultation_sha256"),
+    )
+    op.create_index("ix_consultation_blobs_consultation_id", "consultation_blobs", ["consultation_id"])
+    # Garbage collection looks for blobs with no links
+    op.create_index("ix_consultation_blobs_sha256", "consultation_blobs", ["sha256"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_consultation_blobs_sha256", table_name="consultation_blobs")
+    op.drop_index("ix_consultation_blobs_consultation_id", table_name="consultation_blobs")
+    op.drop_table("consultation_blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,29 @@
+"""index prescriptions consultation_id
+
+Revision ID: f4a5b6c7d8e9
+Revises: e3f4a5b6c7d8
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a5b6c7d8e9"
+down_revision: Union[str, None] = "e3f4a5b6c7d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # selectinload(Consultation.prescriptions) filters on this column
+    op.create_index(
+        "ix_prescriptions_consultation_id",
+        "prescriptions",
+        ["consultation_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_prescriptions_consultation_id", table_name="prescriptions")
@@ -1,4 +1,4 @@
-from app.core.security import get_current_user
+from app.core.security import get_admin_user, get_current_user
 from app.database.session import get_db
 
-__all__ = ["get_current_user", "get_db"]
+__all__ = ["get_admin_user", "get_current_user", "get_db"]
@@ -0,0 +1,144 @@
+"""``Idempotency-Key`` support for expensive POST endpoints.
+
+An endpoint opts in with ``dependencies=[Depends(idempotent)]`` on a router
+whose ``route_class`` is :class:`IdempotentRoute`. A request without the
+header runs as usual. With it, the key is scoped to the signed-in user and
+bound to a fingerprint of the request; see ``app.services.idempotency``
+for how retries are replayed or made to wait. Replayed responses carry
+``Idempotent-Replayed: true``.
+"""
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import UploadFile
+
+from app.api.deps import get_current_user, get_db
+from app.database.session import async_session
+from app.schemas.user import CurrentUser
+from app.services.idempotency import (
+    Claim,
+    KeyInProgressError,
+    KeyReusedError,
+    StoredResponse,
+    claim_key,
+    complete_key,
+    release_key,
+)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+_HASH_CHUNK = 1024 * 1024
+
+
+class _Replay(Exception):
+    def __init__(self, stored: StoredResponse) -> None:
+        self.stored = stored
+
+
+def _feed(digest: "hashlib._Hash", *parts: str | bytes) -> None:
+    for part in parts:
+        data = part.encode() if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+
+
+async def request_fingerprint(request: Request) -> str:
+    """SHA-256 of what the request asks for.
+
+    Form bodies are hashed field by field, file contents included, so a
+    retry that only changes the multipart boundary still matches.
+    """
+    digest = hashlib.sha256()
+    _feed(digest, request.method, request.url.path, str(sorted(request.query_params.multi_items())))
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        # Already parsed for the endpoint; the cached form is returned
+        form = await request.form()
+        for name, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                _feed(digest, name, value.filename or "", value.content_type or "")
+                while chunk := await value.read(_HASH_CHUNK):
+                    digest.update(chunk)
+                await value.seek(0)
+            else:
+                _feed(digest, name, value)
+    else:
+        _feed(digest, await request.body())
+    return digest.hexdigest()
+
+
+async def idempotent(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> None:
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters",
+        )
+    fingerprint = await request_fingerprint(request)
+    # Hand the connection used for authentication back to the pool: a
+    # retry may wait here a long time for the original attempt
+    await db.rollback()
+    try:
+        outcome = await claim_key(async_session, current_user.id, key, fingerprint)
+    except KeyReusedError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"{IDEMPOTENCY_HEADER} was already used for a different request",
+        )
+    except KeyInProgressError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+        )
+    if isinstance(outcome, StoredResponse):
+        raise _Replay(outcome)
+    request.state.idempotency_claim = outcome
+
+
+class IdempotentRoute(APIRoute):
+    """Stores the response of requests that claimed a key, and replays stored ones."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except _Replay as replay:
+                return Response(
+                    content=replay.stored.body,
+                    status_code=replay.stored.status_code,
+                    media_type=replay.stored.media_type,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+            except BaseException:
+                claim: Claim | None = getattr(request.state, "idempotency_claim", None)
+                if claim is not None:
+                    await release_key(async_session, claim)
+                raise
+
+            claim = getattr(request.state, "idempotency_claim", None)
+            if claim is not None:
+                if 200 <= response.status_code < 300 and hasattr(response, "body"):
+                    await complete_key(
+                        async_session,
+                        claim,
+                        StoredResponse(response.status_code, bytes(response.body), response.media_type),
+                    )
+                else:
+                    await release_key(async_session, claim)
+            return response
+
+        return idempotent_handler
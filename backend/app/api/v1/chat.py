@@ -1,20 +1,48 @@
+import asyncio
+import base64
+import json
+import logging
+import time
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.api.deps import get_current_user, get_db
+from app.api.idempotency import IdempotentRoute, idempotent
+from app.core.security import authenticate_websocket
+from app.database.session import async_session
 from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
 from app.models.consultation import Consultation
-from app.schemas.chat import ChatHistoryMessage, ChatRequest, ChatResponse
+from app.schemas.chat import (
+    ChatHistoryMessage,
+    ChatRequest,
+    ChatResponse,
+    ChatSessionPage,
+    ChatSessionResponse,
+)
 from app.schemas.user import CurrentUser
-from app.services.chat_agent import get_chat_response
+from app.services.chat_agent import get_chat_response, stream_chat_response
+from app.services.chat_history import (
+    CachedHistory,
+    StoredMessage,
+    append_history,
+    load_history,
+    load_page,
+    peek_history,
+)
+from app.services.chat_sessions import link_session, record_messages
+from app.services.chat_writer import get_chat_writer
 from app.services.title_agent import generate_title
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=IdempotentRoute)
 
 
 def build_consultation_context(consultation: Consultation) -> str:
@@ -45,7 +73,89 @@ def build_consultation_context(consultation: Consultation) -> str:
     return "\n".join(parts)
 
 
-@router.post("/", response_model=ChatResponse)
+async def _save_message(
+    db: AsyncSession,
+    *,
+    patient_id: uuid.UUID,
+    session_id: str,
+    role: str,
+    content: str,
+    consultation_id: uuid.UUID | None,
+) -> StoredMessage:
+    writer = get_chat_writer()
+    if writer is not None:
+        row = writer.enqueue(
+            patient_id=patient_id, session_id=session_id, role=role,
+            content=content, consultation_id=consultation_id,
+        )
+        # End the transaction anyway: it commits a consultation created for
+        # this chat and hands the connection back before the model call. A
+        # read-only commit writes no WAL, so this costs a round trip only.
+        if db.in_transaction():
+            await db.commit()
+        return StoredMessage(row["id"], None, role, content)
+    msg = ChatMessage(
+        patient_id=patient_id,
+        session_id=session_id,
+        role=role,
+        content=content,
+        consultation_id=consultation_id,
+    )
+    db.add(msg)
+    await db.flush()
+    await record_messages(db, [{
+        "patient_id": patient_id, "session_id": session_id, "role": role,
+        "content": content, "consultation_id": consultation_id, "created_at": msg.created_at,
+    }])
+    await db.commit()
+    return StoredMessage(msg.id, msg.seq, role, content)
+
+
+def _new_chat_consultation(db: AsyncSession, user_id: uuid.UUID, title: str | None) -> Consultation:
+    consultation = Consultation(
+        doctor_id=user_id,
+        patient_id=user_id,
+        title=title,
+        status="chat",
+        consent_given_at=datetime.now(timezone.utc),
+        prescriptions=[],
+    )
+    db.add(consultation)
+    return consultation
+
+
+async def _consultation_context(db: AsyncSession, consultation_id: uuid.UUID, user_id: uuid.UUID) -> str:
+    result = await db.execute(
+        select(Consultation)
+        .where(Consultation.id == consultation_id)
+        .options(selectinload(Consultation.prescriptions))
+    )
+    consultation = result.scalar_one_or_none()
+    if consultation is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
+    if consultation.doctor_id != user_id and consultation.patient_id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    return build_consultation_context(consultation)
+
+
+async def _load_history_apart(user_id: uuid.UUID, session_id: str) -> CachedHistory:
+    # Own session, so it can run alongside a read on the request's session
+    async with async_session() as db:
+        return await load_history(db, user_id, session_id)
+
+
+async def _gather(*aws):
+    """``asyncio.gather`` that cancels the rest once one fails."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+@router.post("/", response_model=ChatResponse, dependencies=[Depends(idempotent)])
 async def chat(
     body: ChatRequest,
     current_user: CurrentUser = Depends(get_current_user),
@@ -54,114 +164,270 @@ async def chat(
     session_id = body.session_id or str(uuid.uuid4())
     user_id = current_user.id
 
-    # Create new consultation from chat if requested
-    new_consultation_id: uuid.UUID | None = None
-    new_title: str | None = None
+    # Create new consultation from chat if requested. Its title comes from a
+    # separate model call, which runs alongside everything up to the reply.
+    new_consultation: Consultation | None = None
+    title_task: asyncio.Task[str] | None = None
     if body.create_consultation and not body.consultation_id:
-        new_title = await generate_title(body.message)
-        new_consultation = Consultation(
-            doctor_id=user_id,
-            patient_id=user_id,
-            title=new_title,
-            status="chat",
-            consent_given_at=datetime.now(timezone.utc),
-        )
-        db.add(new_consultation)
+        title_task = asyncio.create_task(generate_title(body.message))
+        new_consultation = _new_chat_consultation(db, user_id, title=None)
         await db.flush()
-        new_consultation_id = new_consultation.id
-        body.consultation_id = new_consultation_id
-
-    # Build consultation context if requested
-    consultation_context: str | None = None
-    if body.consultation_id:
-        result = await db.execute(
-            select(Consultation)
-            .where(Consultation.id == body.consultation_id)
-            .options(selectinload(Consultation.prescriptions))
-        )
-        consultation = result.scalar_one_or_none()
-        if consultation is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
-        if consultation.doctor_id != user_id and consultation.patient_id != user_id:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-        consultation_context = build_consultation_context(consultation)
-
-    # Load history from DB
-    result = await db.execute(
-        select(ChatMessage)
-        .where(
-            ChatMessage.patient_id == user_id,
-            ChatMessage.session_id == session_id,
-        )
-        .order_by(ChatMessage.created_at.asc())
-    )
-    history_rows = result.scalars().all()
-
-    # Build pydantic-ai message_history from DB rows
-    from pydantic_ai.messages import (
-        ModelRequest,
-        ModelResponse,
-        TextPart,
-        UserPromptPart,
-    )
+        body.consultation_id = new_consultation.id
 
-    message_history: list = []
-    for row in history_rows:
-        if row.role == "user":
-            message_history.append(
-                ModelRequest(parts=[UserPromptPart(content=row.content)])
+    try:
+        # Consultation context (with its access check) and history are
+        # independent reads; both finish before the model is called
+        if new_consultation is not None:
+            consultation_context = build_consultation_context(new_consultation)
+            history = await load_history(db, user_id, session_id)
+        elif body.consultation_id:
+            consultation_context, history = await _gather(
+                _consultation_context(db, body.consultation_id, user_id),
+                _load_history_apart(user_id, session_id),
             )
         else:
-            message_history.append(
-                ModelResponse(parts=[TextPart(content=row.content)])
-            )
+            consultation_context = None
+            history = await load_history(db, user_id, session_id)
 
-    # Persist user message immediately so it's saved even if AI fails
-    user_msg = ChatMessage(
-        patient_id=user_id,
-        session_id=session_id,
-        role="user",
-        content=body.message,
-        consultation_id=body.consultation_id,
-    )
-    db.add(user_msg)
-    await db.commit()
+        # Persist the user message while the model works; it is saved even
+        # if the reply fails
+        reply = asyncio.create_task(get_chat_response(body.message, history.messages, consultation_context))
+        try:
+            user_row = await _save_message(
+                db, patient_id=user_id, session_id=session_id, role="user",
+                content=body.message, consultation_id=body.consultation_id,
+            )
+        except BaseException:
+            reply.cancel()
+            raise
+        response_text = await reply
+    except BaseException:
+        if title_task is not None:
+            title_task.cancel()
+        raise
 
-    # Get AI response
-    response_text = await get_chat_response(body.message, message_history, consultation_context)
+    new_title: str | None = None
+    if new_consultation is not None:
+        try:
+            new_title = await title_task
+        except Exception:
+            # The chat itself succeeded; the consultation just stays untitled
+            logger.exception("Title generation failed for consultation %s", new_consultation.id)
+        new_consultation.title = new_title
+        await link_session(db, user_id, session_id, title=new_title, consultation_id=new_consultation.id)
 
     # Persist assistant message
-    assistant_msg = ChatMessage(
-        patient_id=user_id,
-        session_id=session_id,
-        role="assistant",
-        content=response_text,
-        consultation_id=body.consultation_id,
+    assistant_row = await _save_message(
+        db, patient_id=user_id, session_id=session_id, role="assistant",
+        content=response_text, consultation_id=body.consultation_id,
     )
-    db.add(assistant_msg)
-    await db.commit()
+    await append_history(db, user_id, session_id, history, [user_row, assistant_row])
 
     return ChatResponse(
         response=response_text,
         sessionId=session_id,
-        consultation_id=new_consultation_id,
+        consultation_id=new_consultation.id if new_consultation is not None else None,
+        title=new_title,
+    )
+
+
+# ---------------------------------------------------------------------------
+# WebSocket
+# ---------------------------------------------------------------------------
+
+class _ChatConnection:
+    """What a chat socket remembers between turns.
+
+    Most sockets sit idle, so this is all a connection holds: no database
+    session, and history shared with the history cache where it is enabled.
+    """
+
+    __slots__ = ("user_id", "expires_at", "session_id", "consultation_id", "context", "history")
+
+    def __init__(self, user_id: uuid.UUID, expires_at: float) -> None:
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.session_id: str | None = None
+        self.consultation_id: uuid.UUID | None = None
+        self.context: str | None = None
+        self.history: CachedHistory | None = None
+
+    def switch_session(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.consultation_id = self.context = self.history = None
+
+    async def current_history(self, db: AsyncSession) -> CachedHistory:
+        # Trust our own copy while the shared cache agrees with it; anything
+        # else (another socket or a POST on the same session, an evicted
+        # entry, the cache turned off) means reload
+        if self.history is not None:
+            cached = await peek_history(self.user_id, self.session_id)
+            if cached is not None and cached.last_id == self.history.last_id:
+                return self.history
+        self.history = await load_history(db, self.user_id, self.session_id)
+        return self.history
+
+
+async def _socket_turn(websocket: WebSocket, conn: _ChatConnection, body: ChatRequest) -> None:
+    async with async_session() as db:
+        session_id = body.session_id or conn.session_id or str(uuid.uuid4())
+        if session_id != conn.session_id:
+            conn.switch_session(session_id)
+
+        new_consultation: Consultation | None = None
+        title_task: asyncio.Task[str] | None = None
+        if body.create_consultation and not body.consultation_id:
+            title_task = asyncio.create_task(generate_title(body.message))
+            new_consultation = _new_chat_consultation(db, conn.user_id, title=None)
+            await db.flush()
+            conn.consultation_id = new_consultation.id
+            conn.context = build_consultation_context(new_consultation)
+        try:
+            if body.consultation_id and body.consultation_id != conn.consultation_id:
+                conn.context = await _consultation_context(db, body.consultation_id, conn.user_id)
+                conn.consultation_id = body.consultation_id
+
+            history = await conn.current_history(db)
+            # Each save commits, so the session holds no connection while streaming
+            user_row = await _save_message(
+                db, patient_id=conn.user_id, session_id=session_id, role="user",
+                content=body.message, consultation_id=conn.consultation_id,
+            )
+            # Until the turn completes, our copy lacks the saved user message
+            conn.history = None
+
+            chunks: list[str] = []
+            async for delta in stream_chat_response(body.message, history.messages, conn.context):
+                chunks.append(delta)
+                await websocket.send_json({"type": "token", "delta": delta})
+            response_text = "".join(chunks)
+        except BaseException:
+            if title_task is not None:
+                title_task.cancel()
+            raise
+
+        new_title: str | None = None
+        if new_consultation is not None:
+            try:
+                new_title = await title_task
+            except Exception:
+                logger.exception("Title generation failed for consultation %s", new_consultation.id)
+            new_consultation.title = new_title
+            await link_session(db, conn.user_id, session_id, title=new_title, consultation_id=new_consultation.id)
+
+        assistant_row = await _save_message(
+            db, patient_id=conn.user_id, session_id=session_id, role="assistant",
+            content=response_text, consultation_id=conn.consultation_id,
+        )
+        conn.history = await append_history(db, conn.user_id, session_id, history, [user_row, assistant_row])
+
+    done = ChatResponse(
+        response=response_text,
+        sessionId=session_id,
+        consultation_id=new_consultation.id if new_consultation is not None else None,
         title=new_title,
     )
+    await websocket.send_json({"type": "done", **done.model_dump(mode="json")})
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """Chat over one socket.
+
+    The ``session_token`` cookie is checked once, at the handshake. Each
+    client frame is a ``ChatRequest`` as JSON; ``session_id`` and
+    ``consultation_id`` carry over from earlier frames when omitted. The
+    reply streams back as ``{"type": "token", "delta": ...}`` frames and ends
+    with a ``{"type": "done", ...}`` frame holding the ``ChatResponse``
+    fields. A failed turn sends ``{"type": "error", "status", "detail"}`` and
+    leaves the socket open.
+    """
+    auth = await authenticate_websocket(websocket)
+    if auth is None:
+        return
+    user, expires_at = auth
+
+    await websocket.accept()
+    conn = _ChatConnection(user.id, expires_at)
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            if time.time() >= conn.expires_at:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Session expired")
+                return
+            try:
+                body = ChatRequest.model_validate(json.loads(raw))
+            except (ValueError, ValidationError):
+                await websocket.send_json({
+                    "type": "error", "status": status.HTTP_422_UNPROCESSABLE_CONTENT,
+                    "detail": "Expected a JSON chat request",
+                })
+                continue
+            try:
+                await _socket_turn(websocket, conn, body)
+            except HTTPException as exc:
+                await websocket.send_json({"type": "error", "status": exc.status_code, "detail": exc.detail})
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                logger.exception("Chat turn failed for user %s", conn.user_id)
+                await websocket.send_json({
+                    "type": "error", "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "detail": "Chat turn failed",
+                })
+    except WebSocketDisconnect:
+        return
 
 
 @router.get("/history", response_model=list[ChatHistoryMessage])
 async def get_chat_history(
     session_id: str,
+    before: int | None = Query(None, description="Only messages with seq below this"),
+    after: int | None = Query(None, description="Only messages with seq above this"),
+    limit: int | None = Query(None, ge=1, le=500, description="Page size; omit for the whole session"),
     current_user: CurrentUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(ChatMessage)
-        .where(
-            ChatMessage.patient_id == current_user.id,
-            ChatMessage.session_id == session_id,
+    # Without ``after`` a limited page is the newest messages (below ``before``),
+    # so the UI pages backwards by passing the oldest seq it holds
+    rows = await load_page(db, current_user.id, session_id, before=before, after=after, limit=limit)
+    return [ChatHistoryMessage(seq=r.seq, role=r.role, content=r.content) for r in rows]
+
+
+def _encode_cursor(session: ChatSession) -> str:
+    raw = f"{session.last_message_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        last_at, _, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        return datetime.fromisoformat(last_at), uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+@router.get("/sessions", response_model=ChatSessionPage)
+async def list_chat_sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    query = select(ChatSession).where(
+        ChatSession.owner_id == current_user.id,
+        ChatSession.last_message_at.is_not(None),
+    )
+    if cursor:
+        query = query.where(
+            tuple_(ChatSession.last_message_at, ChatSession.id) < tuple_(*_decode_cursor(cursor))
         )
-        .order_by(ChatMessage.created_at.asc())
+    result = await db.execute(
+        query.order_by(ChatSession.last_message_at.desc(), ChatSession.id.desc()).limit(limit + 1)
+    )
+    sessions = result.scalars().all()
+    page = sessions[:limit]
+    return ChatSessionPage(
+        items=[ChatSessionResponse.model_validate(s) for s in page],
+        next_cursor=_encode_cursor(page[-1]) if len(sessions) > limit else None,
     )
-    messages = result.scalars().all()
-    return [ChatHistoryMessage(role=m.role, content=m.content) for m in messages]
@@ -1,96 +1,118 @@
-import asyncio
+import json
+import logging
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, Form, HTTPException, UploadFile, status
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    Header,
+    HTTPException,
+    Response,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.api.deps import get_current_user, get_db
+from app.api.idempotency import IdempotentRoute, idempotent
+from app.core.config import settings
+from app.core.security import authenticate_websocket
+from app.database.session import async_session
+from app.models.blob import Blob, ConsultationBlob
 from app.models.consultation import Consultation
 from app.models.prescription import Prescription
 from app.models.user import User
 from app.schemas.consultation import (
+    BatchTranscribeItem,
+    BatchTranscribeResponse,
     ConsultationDetailResponse,
     ConsultationResponse,
     ConsultationUpdate,
+    ConsultationUploadResponse,
     KeyPoints,
+    LiveRecordingStart,
     MedicineItem,
     NotesRequest,
     PrescriptionData,
+    RegenerateResponse,
+    SummaryData,
     TranscribeResponse,
 )
 from app.schemas.user import CurrentUser
-from app.services.prescription_agent import extract_prescription
-from app.services.summary_agent import generate_summary
-from app.services.title_agent import generate_title
+from app.services.batch_transcription import BatchItem, transcribe_batch
+from app.services.blob_store import get_blob_backend
+from app.services.deferred_extraction import extract_by_deadlines, finish_in_background, wait_for_update
+from app.services.extraction import EXTRACTED_FIELDS, key_points_from, prescription_row, still_pending
+from app.services.live_transcription import LiveTranscript
+from app.services.rederivation import schedule_rederivation
+from app.services.regeneration import (
+    ConsultationChangedError,
+    FieldsPendingError,
+    NoTranscriptError,
+    regenerate_fields,
+)
 from app.services.transcription import transcribe_audio
+from app.services.uploads import PendingUpload, parse_range, withdraw_uploads
 
-router = APIRouter(prefix="/consultations", tags=["consultations"])
+logger = logging.getLogger(__name__)
 
+router = APIRouter(prefix="/consultations", tags=["consultations"], route_class=IdempotentRoute)
 
-@router.post("/transcribe", response_model=TranscribeResponse)
-async def transcribe(
-    file: UploadFile,
-    patient_id: str | None = Form(None),
-    current_user: CurrentUser = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-):
-    audio_bytes = await file.read()
-    mime_type = file.content_type or "audio/webm"
-
-    transcript = await transcribe_audio(audio_bytes, mime_type)
-
-    prescription_result, summary_result, title = await asyncio.gather(
-        extract_prescription(transcript),
-        generate_summary(transcript),
-        generate_title(transcript),
-    )
-
-    resolved_patient_id = uuid.UUID(patient_id) if patient_id else current_user.id
 
+async def _patient_name(db: AsyncSession, patient_id: uuid.UUID | None, current_user: CurrentUser) -> str:
     # Look up the actual patient name (current_user is the doctor)
     if patient_id:
         patient_result = await db.execute(
-            select(User.name).where(User.id == resolved_patient_id)
+            select(User.name).where(User.id == patient_id)
         )
-        patient_name = patient_result.scalar_one_or_none() or ""
-    else:
-        patient_name = current_user.name or ""
+        return patient_result.scalar_one_or_none() or ""
+    return current_user.name or ""
 
-    key_points_data = KeyPoints(
-        symptoms=prescription_result.symptoms,
-        diagnosis=prescription_result.diagnosis,
-        allergies=prescription_result.allergies,
-        notes=prescription_result.notes,
-    )
 
-    consultation = Consultation(
-        doctor_id=current_user.id,
-        patient_id=resolved_patient_id,
-        transcript=transcript,
-        title=title,
-        status="completed",
-        summary=summary_result.model_dump(),
-        key_points=key_points_data.model_dump(),
-        consent_given_at=datetime.now(timezone.utc),
-    )
-    db.add(consultation)
-    await db.flush()
+async def _extract_into(
+    db: AsyncSession, consultation: Consultation, transcript: str, patient_name: str
+) -> TranscribeResponse:
+    """Run the extraction agents over a transcript and store the results on ``consultation``.
 
-    prescription_record = Prescription(
-        consultation_id=consultation.id,
-        diagnosis=", ".join(prescription_result.diagnosis),
-        medicines=[m.model_dump() for m in prescription_result.medicines],
-        instructions=prescription_result.instructions,
-    )
-    db.add(prescription_record)
-    await db.commit()
+    Agents that miss their deadline carry on in the background; their
+    fields come back empty, listed in ``pending``, and are written to the
+    consultation when ready.
+    """
+    extraction = await extract_by_deadlines(transcript)
+    prescription_result = extraction.prescription
+    key_points_data = key_points_from(prescription_result) if prescription_result else KeyPoints()
+
+    consultation.transcript = transcript
+    consultation.title = extraction.title
+    consultation.status = "processing" if extraction.late else "completed"
+    consultation.summary = extraction.summary.model_dump() if extraction.summary else None
+    consultation.key_points = key_points_data.model_dump() if prescription_result else None
+    consultation.pending_fields = extraction.pending_fields
+    consultation.pending_since = datetime.now(timezone.utc) if extraction.late else None
+    consultation.input_hashes = extraction.input_hashes
+    try:
+        db.add(consultation)
+        await db.flush()
+        if prescription_result:
+            db.add(Prescription(**prescription_row(consultation.id, prescription_result)))
+        await db.commit()
+    except BaseException:
+        extraction.cancel()
+        raise
+    finish_in_background(consultation.id, extraction, async_session)
 
     return TranscribeResponse(
         consultation_id=consultation.id,
         transcript=transcript,
+        title=extraction.title,
         keyPoints=key_points_data,
         prescription=PrescriptionData(
             patientName=patient_name,
@@ -102,14 +124,195 @@ async def transcribe(
                     frequency=m.frequency,
                     duration=m.duration,
                 )
-                for m in prescription_result.medicines
+                for m in (prescription_result.medicines if prescription_result else [])
             ],
-            instructions=prescription_result.instructions,
+            instructions=prescription_result.instructions if prescription_result else [],
         ),
-        summary=summary_result,
+        summary=extraction.summary or SummaryData(),
+        pending=extraction.pending_fields,
+    )
+
+
+@router.post("/transcribe", response_model=TranscribeResponse, dependencies=[Depends(idempotent)])
+async def transcribe(
+    file: UploadFile,
+    patient_id: str | None = Form(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    audio_bytes = await file.read()
+    mime_type = file.content_type or "audio/webm"
+    # Kept alongside the consultation, for reprocessing later
+    upload = PendingUpload(audio_bytes, kind="audio", mime_type=mime_type, filename=file.filename)
+
+    try:
+        transcript = await transcribe_audio(audio_bytes, mime_type)
+
+        patient_uuid = uuid.UUID(patient_id) if patient_id else None
+        patient_name = await _patient_name(db, patient_uuid, current_user)
+
+        consultation = Consultation(
+            doctor_id=current_user.id,
+            patient_id=patient_uuid or current_user.id,
+            consent_given_at=datetime.now(timezone.utc),
+        )
+        response = await _extract_into(db, consultation, transcript, patient_name)
+    except BaseException:
+        await upload.drop()
+        raise
+    await upload.attach(db, response.consultation_id)
+    return response
+
+
+@router.post("/transcribe/batch", response_model=BatchTranscribeResponse)
+async def transcribe_batch_files(
+    files: list[UploadFile],
+    patient_ids: list[str] = Form([]),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """Transcribe many recordings; ``patient_ids[i]`` (optional, may be empty) goes with ``files[i]``.
+
+    Items are processed with bounded concurrency and saved in bulk; each
+    reports its own status, so one bad recording does not fail the batch.
+    """
+    if len(files) > settings.BATCH_TRANSCRIBE_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_TRANSCRIBE_MAX_FILES} files per batch",
+        )
+    if len(patient_ids) > len(files):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="More patient_ids than files")
+    try:
+        patients = [uuid.UUID(p) if p else current_user.id for p in patient_ids]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid patient_id")
+    patients += [current_user.id] * (len(files) - len(patients))
+
+    items = [
+        BatchItem(
+            filename=f.filename or f"file-{i}",
+            mime_type=f.content_type or "audio/webm",
+            patient_id=patient,
+            load=f.read,
+        )
+        for i, (f, patient) in enumerate(zip(files, patients))
+    ]
+    results = await transcribe_batch(
+        items,
+        current_user.id,
+        async_session,
+        whisper_concurrency=settings.BATCH_TRANSCRIBE_WHISPER_CONCURRENCY,
+        extraction_concurrency=settings.BATCH_TRANSCRIBE_EXTRACTION_CONCURRENCY,
+        save_group_size=settings.BATCH_TRANSCRIBE_SAVE_GROUP,
+    )
+    completed = sum(r.status == "completed" for r in results)
+    return BatchTranscribeResponse(
+        completed=completed,
+        failed=len(results) - completed,
+        items=[BatchTranscribeItem.model_validate(r) for r in results],
     )
 
 
+@router.websocket("/live")
+async def live_transcription(websocket: WebSocket):
+    """Transcribe a consultation while it is being recorded.
+
+    The first frame is a ``LiveRecordingStart`` as JSON. It creates a draft
+    consultation, reported back as ``{"type": "started", "consultation_id"}``.
+    Then each binary frame is one self-contained audio segment. Segments are
+    transcribed in the background. As the transcript grows it is saved on
+    the draft and sent as ``{"type": "segments", "first", "texts"}``. A
+    ``{"type": "stop"}`` frame waits for the remaining segments, runs the
+    extraction agents and replies ``{"type": "done", ...}`` with the
+    ``TranscribeResponse`` fields plus ``failed_segments``. A socket that
+    drops before ``stop`` leaves the draft with the transcript so far. While
+    ``LIVE_PENDING_MAX_BYTES`` of audio awaits Whisper, no further frame is read.
+    """
+    auth = await authenticate_websocket(websocket)
+    if auth is None:
+        return
+    current_user, _ = auth
+    await websocket.accept()
+
+    try:
+        start = LiveRecordingStart.model_validate_json(await websocket.receive_text())
+    except ValidationError:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason="Expected a recording start frame")
+        return
+    except WebSocketDisconnect:
+        return
+
+    async with async_session() as db:
+        consultation = Consultation(
+            doctor_id=current_user.id,
+            patient_id=start.patient_id,
+            status="draft",
+            consent_given_at=start.consent_given_at,
+        )
+        db.add(consultation)
+        await db.commit()
+    consultation_id = consultation.id
+
+    async def on_segments(first: int, texts: list[str]) -> None:
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(Consultation)
+                    .where(Consultation.id == consultation_id, Consultation.status == "draft")
+                    .values(transcript=live.transcript)
+                )
+                await db.commit()
+            await websocket.send_json({"type": "segments", "first": first, "texts": texts})
+        except Exception:
+            # The final transcript is written at stop either way
+            logger.warning("Could not report live transcript of %s", consultation_id, exc_info=True)
+
+    live = LiveTranscript(
+        start.mime_type, on_segments,
+        concurrency=settings.LIVE_TRANSCRIPTION_CONCURRENCY,
+        max_pending_bytes=settings.LIVE_PENDING_MAX_BYTES,
+    )
+    await websocket.send_json({"type": "started", "consultation_id": str(consultation_id)})
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            audio = message.get("bytes")
+            if audio is not None:
+                if len(audio) > settings.LIVE_SEGMENT_MAX_BYTES:
+                    await websocket.send_json({"type": "error", "detail": "Segment too large"})
+                else:
+                    # Not reading the next frame until there is room is the backpressure
+                    await live.add(audio)
+                continue
+            try:
+                stop = json.loads(message.get("text") or "").get("type") == "stop"
+            except (ValueError, AttributeError):
+                stop = False
+            if stop:
+                break
+            await websocket.send_json({"type": "error", "detail": "Expected an audio segment or a stop frame"})
+
+        transcript = await live.finish()
+        async with async_session() as db:
+            consultation = await db.get(Consultation, consultation_id)
+            if consultation is None:
+                await websocket.send_json({"type": "error", "detail": "Consultation was deleted"})
+                await websocket.close()
+                return
+            patient_name = await _patient_name(db, start.patient_id, current_user)
+            response = await _extract_into(db, consultation, transcript, patient_name)
+        await websocket.send_json({
+            "type": "done", "failed_segments": live.failed, **response.model_dump(mode="json"),
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        return
+    finally:
+        live.cancel()
+
+
 @router.get("/", response_model=list[ConsultationResponse])
 async def list_consultations(
     current_user: CurrentUser = Depends(get_current_user),
@@ -126,18 +329,22 @@ async def list_consultations(
     return result.scalars().all()
 
 
+async def _load_detail(db: AsyncSession, consultation_id: uuid.UUID) -> Consultation | None:
+    result = await db.execute(
+        select(Consultation)
+        .where(Consultation.id == consultation_id)
+        .options(selectinload(Consultation.prescriptions))
+    )
+    return result.scalar_one_or_none()
+
+
 @router.get("/{consultation_id}", response_model=ConsultationDetailResponse)
 async def get_consultation(
     consultation_id: uuid.UUID,
     current_user: CurrentUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Consultation)
-        .where(Consultation.id == consultation_id)
-        .options(selectinload(Consultation.prescriptions))
-    )
-    consultation = result.scalar_one_or_none()
+    consultation = await _load_detail(db, consultation_id)
     if consultation is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
     user_id = current_user.id
@@ -146,6 +353,194 @@ async def get_consultation(
     return consultation
 
 
+@router.get("/{consultation_id}/events")
+async def consultation_events(
+    consultation_id: uuid.UUID,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Server-sent events for a consultation whose extraction is finishing in the background.
+
+    Sends the consultation, as ``GET /consultations/{id}`` returns it, as an
+    ``update`` event now and again each time a pending field is stored,
+    then a ``done`` event once ``pending_fields`` is empty (or was abandoned
+    by a worker that went away).
+    """
+    consultation = await get_consultation(consultation_id, current_user, db)
+    snapshot = ConsultationDetailResponse.model_validate(consultation)
+    pending = still_pending(consultation)
+    # The stream outlives the request's session
+    await db.rollback()
+
+    async def events():
+        current, waiting = snapshot, pending
+        yield f"event: update\ndata: {current.model_dump_json()}\n\n"
+        while waiting:
+            await wait_for_update(consultation_id, settings.TRANSCRIBE_EVENTS_POLL_S)
+            async with async_session() as fresh:
+                latest = await _load_detail(fresh, consultation_id)
+                if latest is None:
+                    return
+                reloaded = ConsultationDetailResponse.model_validate(latest)
+                waiting = still_pending(latest)
+            if reloaded == current:
+                # Keeps proxies from closing an idle stream
+                yield ": waiting\n\n"
+                continue
+            current = reloaded
+            yield f"event: update\ndata: {current.model_dump_json()}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _authorize_uploads(
+    db: AsyncSession, consultation_id: uuid.UUID, current_user: CurrentUser, *, doctor_only: bool = False
+) -> None:
+    result = await db.execute(
+        select(Consultation.doctor_id, Consultation.patient_id).where(Consultation.id == consultation_id)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
+    allowed = (row.doctor_id,) if doctor_only else (row.doctor_id, row.patient_id)
+    if current_user.id not in allowed:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+
+@router.get("/{consultation_id}/uploads", response_model=list[ConsultationUploadResponse])
+async def list_uploads(
+    consultation_id: uuid.UUID,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """The recordings and images this consultation was made from."""
+    await _authorize_uploads(db, consultation_id, current_user)
+    result = await db.execute(
+        select(
+            ConsultationBlob.sha256,
+            ConsultationBlob.kind,
+            ConsultationBlob.mime_type,
+            ConsultationBlob.filename,
+            ConsultationBlob.created_at,
+            Blob.size,
+        )
+        .join(Blob, Blob.sha256 == ConsultationBlob.sha256)
+        .where(ConsultationBlob.consultation_id == consultation_id)
+        .order_by(ConsultationBlob.created_at)
+    )
+    return [ConsultationUploadResponse.model_validate(row._mapping) for row in result]
+
+
+@router.get("/{consultation_id}/uploads/{sha256}")
+async def download_upload(
+    consultation_id: uuid.UUID,
+    sha256: str,
+    range_header: str | None = Header(None, alias="Range"),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream an upload; a single ``Range`` is answered with 206 so players can seek."""
+    await _authorize_uploads(db, consultation_id, current_user)
+    result = await db.execute(
+        select(ConsultationBlob.mime_type, Blob.size)
+        .join(Blob, Blob.sha256 == ConsultationBlob.sha256)
+        .where(ConsultationBlob.consultation_id == consultation_id, ConsultationBlob.sha256 == sha256)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    # The stream outlives the request's session
+    await db.rollback()
+
+    size = row.size
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{sha256}"'}
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"},
+        )
+    start, end = byte_range or (0, size)
+    headers["Content-Length"] = str(end - start)
+    status_code = status.HTTP_200_OK
+    if byte_range is not None:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(
+        get_blob_backend().read(sha256, start, end),
+        status_code=status_code,
+        media_type=row.mime_type,
+        headers=headers,
+    )
+
+
+@router.delete("/{consultation_id}/uploads", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_uploads(
+    consultation_id: uuid.UUID,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Withdraw the uploads kept for a consultation; the consultation itself stays."""
+    await _authorize_uploads(db, consultation_id, current_user, doctor_only=True)
+    await db.rollback()
+    await withdraw_uploads(async_session, consultation_id)
+
+
+@router.post(
+    "/{consultation_id}/regenerate", response_model=RegenerateResponse, dependencies=[Depends(idempotent)]
+)
+async def regenerate_consultation(
+    consultation_id: uuid.UUID,
+    fields: str = ",".join(EXTRACTED_FIELDS),
+    force: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Re-extract ``fields`` (comma-separated) whose transcript changed since they were produced.
+
+    Only the agents behind those fields run. ``force`` re-runs them even
+    for an unchanged transcript.
+    """
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(requested) - set(EXTRACTED_FIELDS)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"fields must be drawn from {', '.join(EXTRACTED_FIELDS)}",
+        )
+    result = await db.execute(
+        select(Consultation).where(Consultation.id == consultation_id)
+    )
+    consultation = result.scalar_one_or_none()
+    if consultation is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consultation not found")
+    if consultation.doctor_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+    try:
+        outcome = await regenerate_fields(db, consultation, requested, force=force)
+    except NoTranscriptError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No transcript available")
+    except FieldsPendingError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Still being extracted: {exc}")
+    except ConsultationChangedError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The consultation changed while it was being regenerated; try again",
+        )
+    return RegenerateResponse(
+        regenerated=outcome.regenerated,
+        unchanged=outcome.unchanged,
+        consultation=await _load_detail(db, consultation_id),
+    )
+
+
 @router.patch("/{consultation_id}", response_model=ConsultationResponse)
 async def update_consultation(
     consultation_id: uuid.UUID,
@@ -162,12 +557,15 @@ async def update_consultation(
     if consultation.doctor_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
+    transcript_changed = body.transcript is not None and body.transcript != consultation.transcript
     if body.transcript is not None:
         consultation.transcript = body.transcript
     if body.status is not None:
         consultation.status = body.status
     await db.commit()
     await db.refresh(consultation)
+    if transcript_changed and settings.TRANSCRIPT_REDERIVE:
+        schedule_rederivation(consultation.id, async_session)
     return consultation
 
 
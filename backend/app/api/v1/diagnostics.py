@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import get_admin_user
+from app.core import diagnostics
+from app.core.config import settings
+from app.schemas.user import CurrentUser
+
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"])
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_event_loop(
+    seconds: float = Query(10.0, gt=0, le=60, description="Sampling duration"),
+    current_user: CurrentUser = Depends(get_admin_user),
+):
+    """Sample the event-loop thread and return collapsed stacks for a flamegraph."""
+    thread_id = diagnostics.loop_thread_id()
+    if thread_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Diagnostics not started",
+        )
+
+    try:
+        collapsed = await asyncio.to_thread(
+            diagnostics.sample_loop_thread,
+            thread_id,
+            seconds,
+            settings.DIAGNOSTICS_SAMPLE_INTERVAL_MS / 1000,
+        )
+    except diagnostics.ProfilerBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running",
+        )
+    return PlainTextResponse(collapsed)
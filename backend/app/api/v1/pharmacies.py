@@ -23,6 +23,7 @@ async def nearby_locations(
     lat: float | None = Query(None, description="Latitude (fallback if no zipcode)"),
     lon: float | None = Query(None, description="Longitude (fallback if no zipcode)"),
     radius: int = Query(5000, ge=500, le=50000, description="Search radius in meters"),
+    limit: int | None = Query(None, ge=1, le=200, description="Maximum number of nearest results (default: all)"),
     types: str = Query(
         "pharmacy,hospital,clinic",
         description="Comma-separated location types: pharmacy, hospital, clinic",
@@ -63,6 +64,7 @@ async def nearby_locations(
             lon=lon,
             radius=radius,
             location_types=valid_types,
+            limit=limit,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -7,6 +7,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db
+from app.api.idempotency import IdempotentRoute, idempotent
 from app.models.consultation import Consultation
 from app.models.prescription import Prescription
 from app.schemas.consultation import (
@@ -24,8 +25,9 @@ from app.services.image_analysis_agent import (
     generate_title_from_image,
 )
 from app.services.prescription_agent import extract_prescription
+from app.services.uploads import PendingUpload
 
-router = APIRouter(prefix="/prescriptions", tags=["prescriptions"])
+router = APIRouter(prefix="/prescriptions", tags=["prescriptions"], route_class=IdempotentRoute)
 
 
 async def _check_consultation_access(
@@ -35,7 +37,7 @@ async def _check_consultation_access(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
 
-@router.post("/generate", response_model=PrescriptionResponse)
+@router.post("/generate", response_model=PrescriptionResponse, dependencies=[Depends(idempotent)])
 async def generate_prescription(
     consultation_id: uuid.UUID,
     current_user: CurrentUser = Depends(get_current_user),
@@ -118,7 +120,7 @@ async def update_prescription(
     return prescription
 
 
-@router.post("/scan-image", response_model=TranscribeResponse)
+@router.post("/scan-image", response_model=TranscribeResponse, dependencies=[Depends(idempotent)])
 async def scan_prescription_image(
     file: UploadFile,
     current_user: CurrentUser = Depends(get_current_user),
@@ -139,12 +141,17 @@ async def scan_prescription_image(
             detail="Image too large. Maximum size is 10MB.",
         )
 
-    # Run all three vision agents in parallel
-    prescription_result, summary_result, title = await asyncio.gather(
-        extract_prescription_from_image(image_bytes, content_type),
-        generate_summary_from_image(image_bytes, content_type),
-        generate_title_from_image(image_bytes, content_type),
-    )
+    upload = PendingUpload(image_bytes, kind="image", mime_type=content_type, filename=file.filename)
+    try:
+        # Run all three vision agents in parallel
+        prescription_result, summary_result, title = await asyncio.gather(
+            extract_prescription_from_image(image_bytes, content_type),
+            generate_summary_from_image(image_bytes, content_type),
+            generate_title_from_image(image_bytes, content_type),
+        )
+    except BaseException:
+        await upload.drop()
+        raise
 
     key_points_data = KeyPoints(
         symptoms=prescription_result.symptoms,
@@ -175,6 +182,7 @@ async def scan_prescription_image(
     )
     db.add(prescription_record)
     await db.commit()
+    await upload.attach(db, consultation.id)
 
     return TranscribeResponse(
         consultation_id=consultation.id,
@@ -0,0 +1,238 @@
+"""Event-loop diagnostics: blocking detection and sampling profiles.
+
+Everything here runs in helper threads that read the event-loop thread's
+stack via ``sys._current_frames()``; nothing is installed on the request
+path unless the corresponding setting is enabled.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Counter
+from types import FrameType
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+LOOP_BLOCKED = Counter(
+    "helio_event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the lag threshold.",
+)
+
+
+def _collapse(frame: FrameType | None) -> str:
+    """Render a stack as ``outer;...;inner`` (flamegraph collapsed format)."""
+    names: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _format_collapsed(samples: _Counter[str]) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Loop-lag monitor
+# ---------------------------------------------------------------------------
+
+class LoopLagMonitor:
+    """Logs the loop thread's stack whenever a callback blocks past ``threshold``."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, threshold: float) -> None:
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.threshold = threshold
+        self.interval = min(threshold / 2, 0.05)
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._heartbeat_task: asyncio.Task | None = None
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True)
+
+    def start(self) -> None:
+        self._heartbeat_task = self.loop.create_task(self._heartbeat())
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._last_beat - self.interval
+            if lag < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            LOOP_BLOCKED.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            logger.warning("Event loop blocked for %.0f ms so far:\n%s", lag * 1000, stack)
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler
+# ---------------------------------------------------------------------------
+
+class ProfilerBusyError(Exception):
+    """Raised when a sampling profile is already running."""
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_loop_thread(loop_thread_id: int, seconds: float, interval: float) -> str:
+    """Sample the loop thread's stack for ``seconds``; blocking, run in a worker thread.
+
+    Returns collapsed stacks (``frame;frame;frame count`` per line), which
+    flamegraph.pl, speedscope and inferno accept directly.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running")
+    try:
+        samples: _Counter[str] = _Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is not None:
+                samples[_collapse(frame)] += 1
+            time.sleep(interval)
+        return _format_collapsed(samples)
+    finally:
+        _profile_lock.release()
+
+
+# ---------------------------------------------------------------------------
+# Slow-request auto-profiling
+# ---------------------------------------------------------------------------
+
+class _InFlight:
+    __slots__ = ("route", "start", "samples")
+
+    def __init__(self, route: str, start: float) -> None:
+        self.route = route
+        self.start = start
+        self.samples: _Counter[str] = _Counter()
+
+
+class SlowRequestProfiler:
+    """Samples the loop thread while any in-flight request is past the SLO.
+
+    A single background thread serves all requests; the per-request cost is
+    a dict insert and pop in :class:`SlowRequestProfilerMiddleware`.
+    """
+
+    def __init__(self, loop_thread_id: int, slo: float, interval: float) -> None:
+        self.loop_thread_id = loop_thread_id
+        self.slo = slo
+        self.interval = interval
+        self.in_flight: dict[int, _InFlight] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            stack: str | None = None
+            for req in list(self.in_flight.values()):
+                if now - req.start < self.slo:
+                    continue
+                if stack is None:
+                    stack = _collapse(sys._current_frames().get(self.loop_thread_id))
+                req.samples[stack] += 1
+
+    def finish(self, key: int, elapsed: float) -> None:
+        req = self.in_flight.pop(key, None)
+        if req is not None and req.samples:
+            logger.warning(
+                "Slow request %s took %.0f ms (SLO %.0f ms); profile:\n%s",
+                req.route, elapsed * 1000, self.slo * 1000, _format_collapsed(req.samples),
+            )
+
+
+class SlowRequestProfilerMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        profiler = _state.slow_profiler
+        if scope["type"] != "http" or profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = id(scope)
+        start = time.monotonic()
+        profiler.in_flight[key] = _InFlight(f'{scope["method"]} {scope["path"]}', start)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.finish(key, time.monotonic() - start)
+
+
+# ---------------------------------------------------------------------------
+# Lifecycle
+# ---------------------------------------------------------------------------
+
+class _State:
+    loop_thread_id: int | None = None
+    lag_monitor: LoopLagMonitor | None = None
+    slow_profiler: SlowRequestProfiler | None = None
+
+
+_state = _State()
+
+
+def loop_thread_id() -> int | None:
+    return _state.loop_thread_id
+
+
+def start() -> None:
+    """Start the configured monitors; call from the running event loop."""
+    _state.loop_thread_id = threading.get_ident()
+    loop = asyncio.get_running_loop()
+    interval = settings.DIAGNOSTICS_SAMPLE_INTERVAL_MS / 1000
+
+    if settings.DIAGNOSTICS_LOOP_LAG_THRESHOLD_MS > 0:
+        _state.lag_monitor = LoopLagMonitor(
+            loop, _state.loop_thread_id, settings.DIAGNOSTICS_LOOP_LAG_THRESHOLD_MS / 1000
+        )
+        _state.lag_monitor.start()
+
+    if settings.DIAGNOSTICS_SLOW_REQUEST_MS > 0:
+        _state.slow_profiler = SlowRequestProfiler(
+            _state.loop_thread_id, settings.DIAGNOSTICS_SLOW_REQUEST_MS / 1000, interval
+        )
+        _state.slow_profiler.start()
+
+
+def stop() -> None:
+    if _state.lag_monitor is not None:
+        _state.lag_monitor.stop()
+        _state.lag_monitor = None
+    if _state.slow_profiler is not None:
+        _state.slow_profiler.stop()
+        _state.slow_profiler = None
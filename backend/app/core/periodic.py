@@ -0,0 +1,41 @@
+"""Background jobs that run every so often for the life of the process."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Runs ``job`` now and then every ``interval`` seconds until stopped.
+
+    A run that raises is logged and the schedule carries on.
+    """
+
+    def __init__(self, name: str, job: Callable[[], Awaitable[None]], interval: float) -> None:
+        self.name = name
+        self.job = job
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.job()
+            except Exception:
+                logger.exception("%s failed", self.name)
+            await asyncio.sleep(self.interval)
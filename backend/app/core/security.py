@@ -1,13 +1,14 @@
+import hmac
 from datetime import datetime, timedelta, timezone
 
 import bcrypt
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, HTTPException, Request, WebSocket, status
 from jose import JWTError, jwt
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.database.session import get_db
+from app.database.session import async_session, get_db
 from app.schemas.user import CurrentUser
 
 ALGORITHM = "HS256"
@@ -28,11 +29,8 @@ def create_access_token(user_id: str) -> str:
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=ALGORITHM)
 
 
-async def get_current_user(
-    request: Request,
-    db: AsyncSession = Depends(get_db),
-) -> CurrentUser:
-    token = request.cookies.get("session_token")
+def decode_session_token(token: str | None) -> dict:
+    """Validate a ``session_token`` value and return its claims."""
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,7 +50,10 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+    return payload
+
 
+async def load_current_user(user_id: str, db: AsyncSession) -> CurrentUser:
     from app.models.user import User
 
     result = await db.execute(select(User).where(User.id == user_id))
@@ -64,3 +65,52 @@ async def get_current_user(
         )
 
     return CurrentUser(id=user.id, email=user.email, name=user.name)
+
+
+async def get_current_user(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+) -> CurrentUser:
+    payload = decode_session_token(request.cookies.get("session_token"))
+    return await load_current_user(payload["sub"], db)
+
+
+async def authenticate_websocket(websocket: WebSocket) -> tuple[CurrentUser, float] | None:
+    """Check a socket handshake; returns the user and token expiry, or closes it and returns None.
+
+    Browsers attach cookies to cross-site socket handshakes and CORS does not
+    apply to them, so the origin is checked here. The database session is
+    closed again before the socket is accepted.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in settings.CORS_ORIGINS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Origin not allowed")
+        return None
+    try:
+        payload = decode_session_token(websocket.cookies.get("session_token"))
+        async with async_session() as db:
+            user = await load_current_user(payload["sub"], db)
+    except HTTPException as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=exc.detail)
+        return None
+    return user, payload["exp"]
+
+
+async def get_admin_user(
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
+    if current_user.email not in settings.ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return current_user
+
+
+async def require_metrics_access(request: Request, db: AsyncSession = Depends(get_db)) -> None:
+    """Allow scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``, and admins."""
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+        if hmac.compare_digest(request.headers.get("authorization", "").encode(), expected):
+            return
+    await get_admin_user(await get_current_user(request, db))
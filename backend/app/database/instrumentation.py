@@ -0,0 +1,193 @@
+import logging
+import re
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import Gauge, Histogram, observe_stage
+
+logger = logging.getLogger(__name__)
+
+QUERIES_PER_REQUEST = Histogram(
+    "helio_db_queries_per_request",
+    "Number of SQL statements executed per request.",
+    ("route",),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+
+_PARAM_RE = re.compile(r"\$\d+|%\(\w+\)s|\?")
+_PARAM_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_WS_RE = re.compile(r"\s+")
+
+
+# ---------------------------------------------------------------------------
+# Per-request query tracking
+# ---------------------------------------------------------------------------
+
+class QueryStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statement shapes executed at least ``threshold`` times (likely N+1)."""
+        return [(s, n) for s, n in self.statements.most_common() if n >= threshold]
+
+
+# All trackers active in the current context; nested trackers all count
+_active_trackers: ContextVar[tuple[QueryStats, ...]] = ContextVar("active_trackers", default=())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _active_trackers.set((*_active_trackers.get(), stats))
+    try:
+        yield stats
+    finally:
+        _active_trackers.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+    """Fail if the enclosed block runs more than ``limit`` statements.
+
+    Counts statements issued from the current context, so drive the app in
+    the same event loop, e.g. ``httpx.AsyncClient(transport=ASGITransport(app))``.
+    """
+    with track_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        shapes = "\n".join(f"  {n}x {s}" for s, n in stats.statements.most_common())
+        raise AssertionError(f"Expected at most {limit} queries, ran {stats.count}:\n{shapes}")
+
+
+def _normalize(statement: str) -> str:
+    """Collapse whitespace and bind-parameter lists so similar statements match."""
+    statement = _PARAM_RE.sub("?", _WS_RE.sub(" ", statement).strip())
+    return _PARAM_LIST_RE.sub("?, ...", statement)
+
+
+def _param_shape(parameters) -> str:
+    """Describe parameters by type and size only; values may contain PHI."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {_param_shape(v)}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) > 10:
+            return f"{type(parameters).__name__}[{len(parameters)}]"
+        return "(" + ", ".join(_param_shape(v) for v in parameters) + ")"
+    if isinstance(parameters, (str, bytes)):
+        return f"{type(parameters).__name__}[{len(parameters)}]"
+    return type(parameters).__name__
+
+
+class QueryLogMiddleware:
+    """Counts queries per request and warns about likely N+1 patterns."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        # Not websockets: one socket carries many chat turns, so its
+        # statements would add up to false N+1 reports.
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Nor event streams, which re-read the same rows for as long as they are open
+        event_stream = False
+
+        async def send_and_check(message) -> None:
+            nonlocal event_stream
+            if message["type"] == "http.response.start":
+                event_stream = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_and_check)
+        if event_stream:
+            return
+
+        route = getattr(scope.get("route"), "path", "unmatched")
+        QUERIES_PER_REQUEST.observe(stats.count, route)
+        for statement, n in stats.repeated(settings.DB_N_PLUS_ONE_THRESHOLD):
+            logger.warning(
+                "Possible N+1 in %s %s: %d executions of %s",
+                scope["method"], route, n, statement[:500],
+            )
+
+
+# ---------------------------------------------------------------------------
+# Engine hooks
+# ---------------------------------------------------------------------------
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Time and count statements and commits, and expose pool statistics."""
+    sync_engine = engine.sync_engine
+    slow_threshold = settings.DB_SLOW_QUERY_MS / 1000
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        observe_stage("db.execute", elapsed)
+
+        trackers = _active_trackers.get()
+        if trackers:
+            shape = _normalize(statement)
+            for stats in trackers:
+                stats.count += 1
+                stats.total_seconds += elapsed
+                stats.statements[shape] += 1
+
+        if elapsed >= slow_threshold:
+            logger.warning(
+                "Slow query (%.0f ms): %s params=%s",
+                elapsed * 1000, _normalize(statement)[:1000], _param_shape(parameters),
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed_execute(context):
+        # after_cursor_execute does not run for a failed statement
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    pool = sync_engine.pool
+
+    def _pool_stats() -> dict[tuple[str, ...], float]:
+        # Not every pool class (e.g. NullPool) tracks these
+        stats = {}
+        for state in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, state, None)
+            if fn is not None:
+                stats[(state,)] = fn()
+        return stats
+
+    Gauge("helio_db_pool_connections", "Database connection pool state.", ("state",), _pool_stats)
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session: Session) -> None:
+    session.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    start = session.info.pop("commit_start", None)
+    if start is not None:
+        observe_stage("db.commit", time.perf_counter() - start)
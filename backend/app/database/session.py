@@ -3,8 +3,10 @@ from collections.abc import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from app.core.config import settings
+from app.database.instrumentation import instrument_engine
 
 engine = create_async_engine(settings.DATABASE_URL, echo=False)
+instrument_engine(engine)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
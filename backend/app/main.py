@@ -1,10 +1,44 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from app.api.v1.router import api_v1_router
+from app.core import diagnostics
 from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, render_latest
+from app.core.security import require_metrics_access
+from app.database.instrumentation import QueryLogMiddleware
+from app.database.session import async_session
+from app.services.chat_writer import start_chat_writer, stop_chat_writer
+from app.services.deferred_extraction import drain_deferred_extractions
+from app.services.idempotency import start_idempotency_cleanup, stop_idempotency_cleanup
+from app.services.rederivation import drain_rederivations
+from app.services.uploads import start_blob_gc, stop_blob_gc
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    diagnostics.start()
+    if settings.CHAT_WRITE_BEHIND:
+        start_chat_writer(
+            async_session, settings.CHAT_WRITE_BEHIND_FLUSH_MS, settings.CHAT_WRITE_BEHIND_MAX_BATCH
+        )
+    start_idempotency_cleanup(async_session, settings.IDEMPOTENCY_CLEANUP_INTERVAL_S)
+    start_blob_gc(async_session, settings.BLOB_GC_INTERVAL_S)
+    yield
+    await stop_blob_gc()
+    await stop_idempotency_cleanup()
+    # Drain queued chat messages, late extraction results and re-derivations
+    # waiting out their debounce before the process exits
+    await stop_chat_writer()
+    await drain_deferred_extractions(settings.TRANSCRIBE_BACKGROUND_GRACE_S)
+    await drain_rederivations(settings.TRANSCRIBE_BACKGROUND_GRACE_S)
+    diagnostics.stop()
 
-app = FastAPI(title="Helio Med API", version="1.0.0")
+
+app = FastAPI(title="Helio Med API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,7 +46,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Content-Range"],
 )
+app.add_middleware(QueryLogMiddleware)
+if settings.DIAGNOSTICS_SLOW_REQUEST_MS > 0:
+    app.add_middleware(diagnostics.SlowRequestProfilerMiddleware)
+# Added last so it wraps CORS and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_v1_router)
 
@@ -20,3 +60,8 @@ app.include_router(api_v1_router)
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
@@ -10,3 +10,7 @@ from app.models.user_profile import UserProfile  # noqa: E402, F401
 from app.models.consultation import Consultation  # noqa: E402, F401
 from app.models.prescription import Prescription  # noqa: E402, F401
 from app.models.chat_message import ChatMessage  # noqa: E402, F401
+from app.models.chat_session import ChatSession  # noqa: E402, F401
+from app.models.idempotency_key import IdempotencyKey  # noqa: E402, F401
+from app.models.blob import Blob, ConsultationBlob  # noqa: E402, F401
+from app.models.reprocess_run import ReprocessRun  # noqa: E402, F401
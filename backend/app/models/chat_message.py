@@ -1,15 +1,23 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, Text, func
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Sequence, String, Text, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models import Base
 
+CHAT_MESSAGE_SEQ = Sequence("chat_messages_seq_seq", metadata=Base.metadata)
+
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Session history reads and cursor pages walk this
+        Index("ix_chat_messages_patient_session_seq", "patient_id", "session_id", "seq"),
+    )
+    # Fetch seq and created_at with RETURNING on insert; callers use both right away
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     patient_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), index=True)
@@ -20,4 +28,6 @@ class ChatMessage(Base):
         UUID(as_uuid=True), ForeignKey("consultations.id", ondelete="SET NULL"),
         nullable=True, index=True,
     )
+    # Insertion order; orders a session's messages and serves as its history cursor
+    seq: Mapped[int] = mapped_column(BigInteger, server_default=CHAT_MESSAGE_SEQ.next_value(), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, String, Text, func
+from sqlalchemy import DateTime, String, Text, func, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -19,6 +19,12 @@ class Consultation(Base):
     status: Mapped[str] = mapped_column(String(50), default="draft")
     summary: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     key_points: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Fields an extraction agent is still producing in the background
+    pending_fields: Mapped[list[str]] = mapped_column(JSONB, default=list, server_default=text("'[]'::jsonb"))
+    # When pending_fields was set; fields still pending long after were abandoned
+    pending_since: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Field -> SHA-256 of the transcript it was extracted from
+    input_hashes: Mapped[dict[str, str]] = mapped_column(JSONB, default=dict, server_default=text("'{}'::jsonb"))
     consent_given_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -13,7 +13,7 @@ class Prescription(Base):
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     consultation_id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), ForeignKey("consultations.id", ondelete="CASCADE")
+        UUID(as_uuid=True), ForeignKey("consultations.id", ondelete="CASCADE"), index=True
     )
     diagnosis: Mapped[str | None] = mapped_column(Text, nullable=True)
     medicines: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
@@ -0,0 +1,32 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, func, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models import Base
+
+
+class ReprocessRun(Base):
+    """Checkpoint of a bulk reprocessing run, committed with each page it writes."""
+
+    __tablename__ = "reprocess_runs"
+
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    agents: Mapped[list[str]] = mapped_column(JSONB)
+    # Last consultation id of the last page written; the run resumes after it
+    cursor: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    processed: Mapped[int] = mapped_column(Integer, default=0)
+    changed: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    # Consultations whose agents failed, as strings; --retry-failed takes them again
+    failed_ids: Mapped[list[str]] = mapped_column(JSONB, default=list, server_default=text("'[]'::jsonb"))
+    # Transcript edited while its agents ran: left for the edit to settle
+    stale: Mapped[int] = mapped_column(Integer, default=0)
+    # Consultations created after this were produced by the current agents already
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,83 @@
+"""Regenerate stored consultations after an extraction agent changes.
+
+Usage (from backend/):
+
+    python -m app.reprocess --agents summary --run summary-2026-10
+    python -m app.reprocess --agents summary --run summary-2026-10 --retry-failed
+    python -m app.reprocess --agents prescription,title --dry-run --limit 200 > changes.jsonl
+
+``--agents`` picks from prescription (key points and the latest
+prescription), summary and title. A named ``--run`` checkpoints after
+every page it writes; running the same command again after a crash or
+Ctrl-C resumes where it stopped, and a finished run does nothing. The
+consultations a run failed on are kept with it; the same command with
+``--retry-failed`` takes only those again. A dry run writes nothing and
+prints one JSON line per field that would change.
+The run's totals are printed at the end (to stderr in a dry run).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import uuid
+from dataclasses import asdict
+
+from app.core.config import settings
+from app.database.session import async_session, engine
+from app.services.reprocessing import Change, RunConflictError, reprocess
+
+
+def print_change(change: Change) -> None:
+    print(json.dumps(asdict(change), default=str), flush=True)
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    try:
+        report = await reprocess(
+            async_session,
+            [agent.strip() for agent in args.agents.split(",") if agent.strip()],
+            run=args.run,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            dry_run=args.dry_run,
+            limit=args.limit,
+            doctor_id=args.doctor_id,
+            retry_failed=args.retry_failed,
+            on_change=print_change if args.dry_run else None,
+        )
+    finally:
+        await engine.dispose()
+    return asdict(report)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", required=True, help="Comma-separated: prescription, summary, title")
+    parser.add_argument("--run", help="Checkpoint name; required unless --dry-run")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--retry-failed", action="store_true", help="Take only the run's failed consultations")
+    parser.add_argument("--batch-size", type=int, default=settings.REPROCESS_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=settings.REPROCESS_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=settings.REPROCESS_RATE_PER_S, help="Agent calls per second")
+    parser.add_argument("--limit", type=int, help="Consultations to take in this invocation")
+    parser.add_argument("--doctor-id", type=uuid.UUID, help="Only this doctor's consultations")
+    args = parser.parse_args()
+    if not args.dry_run and not args.run:
+        parser.error("--run is required unless --dry-run")
+    if args.retry_failed and (args.dry_run or not args.run):
+        parser.error("--retry-failed needs --run and cannot be combined with --dry-run")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    try:
+        report = asyncio.run(main_async(args))
+    except (ValueError, RunConflictError) as exc:
+        parser.exit(1, f"{exc}\n")
+    print(json.dumps(report, default=str), file=sys.stderr if args.dry_run else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
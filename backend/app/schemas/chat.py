@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime
 
 from pydantic import BaseModel
 
@@ -18,5 +19,23 @@ class ChatResponse(BaseModel):
 
 
 class ChatHistoryMessage(BaseModel):
+    seq: int | None = None  # None while the message is still queued for write-behind
     role: str
     content: str
+
+
+class ChatSessionResponse(BaseModel):
+    session_id: str
+    title: str | None = None
+    consultation_id: uuid.UUID | None = None
+    message_count: int
+    last_message_at: datetime
+    preview: str | None = None
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class ChatSessionPage(BaseModel):
+    items: list[ChatSessionResponse]
+    next_cursor: str | None = None
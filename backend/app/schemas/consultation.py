@@ -42,6 +42,10 @@ class ConsultationCreate(BaseModel):
     consent_given_at: datetime
 
 
+class LiveRecordingStart(ConsultationCreate):
+    mime_type: str = "audio/webm"
+
+
 class ConsultationUpdate(BaseModel):
     transcript: str | None = None
     status: str | None = None
@@ -61,6 +65,7 @@ class ConsultationResponse(BaseModel):
     notes: str | None = None
     summary: dict | None = None
     key_points: dict | None = None
+    pending_fields: list[str] = []
     consent_given_at: datetime
     created_at: datetime
     updated_at: datetime
@@ -82,9 +87,47 @@ class ConsultationDetailResponse(ConsultationResponse):
     prescriptions: list[PrescriptionInline] = []
 
 
+class RegenerateResponse(BaseModel):
+    # Re-run because the transcript changed since they were extracted (or forced)
+    regenerated: list[str]
+    # Already extracted from the current transcript
+    unchanged: list[str]
+    consultation: ConsultationDetailResponse
+
+
 class TranscribeResponse(BaseModel):
     consultation_id: uuid.UUID
     transcript: str
+    title: str | None = None
     keyPoints: KeyPoints
     prescription: PrescriptionData
     summary: SummaryData
+    # Still being produced ("title", "summary", "key_points", "prescription");
+    # these carry empty values here and are filled in on the consultation
+    pending: list[str] = []
+
+
+class BatchTranscribeItem(BaseModel):
+    index: int
+    filename: str
+    status: str
+    consultation_id: uuid.UUID | None = None
+    title: str | None = None
+    error: str | None = None
+
+    model_config = {"from_attributes": True}
+
+
+class BatchTranscribeResponse(BaseModel):
+    completed: int
+    failed: int
+    items: list[BatchTranscribeItem]
+
+
+class ConsultationUploadResponse(BaseModel):
+    sha256: str
+    kind: str
+    mime_type: str
+    filename: str | None = None
+    size: int
+    created_at: datetime
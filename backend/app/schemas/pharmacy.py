@@ -24,3 +24,4 @@ class NearbySearchResponse(BaseModel):
     radius_m: int
     count: int
     results: list[NearbyLocationResponse]
+    stale: bool = False  # served from cache because Overpass was unavailable
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack
+from typing import Any
+
+from pydantic import TypeAdapter
+from pydantic_ai import Agent
+
+from app.core.metrics import observe_stage, record_token_usage, stage
+from app.services import cassettes, model_routing
+
+
+async def run_agent(name: str, agent: Agent, user_prompt: Any, **kwargs: Any) -> Any:
+    """Run ``agent`` and return its output, recording latency and token usage under ``name``.
+
+    The model comes from ``name``'s route in ``MODEL_ROUTES``, falling back
+    as the route allows. Honours ``CASSETTE_MODE``: recordings are keyed on the prompt, message
+    history and deps, so replays are deterministic.
+    """
+    fp = None
+    if cassettes.is_recording() or cassettes.is_replaying():
+        fp = cassettes.fingerprint(name, {"prompt": user_prompt, **kwargs})
+
+    with stage(f"agent.{name}"):
+        if cassettes.is_replaying():
+            entry = await cassettes.replay(name, fp)
+            usage = entry["usage"]
+            record_token_usage(name, usage["input_tokens"], usage["output_tokens"])
+            return TypeAdapter(agent.output_type).validate_python(entry["output"])
+
+        chosen = model_routing.route(name, model_routing.input_tokens(user_prompt, **kwargs))
+        start = time.perf_counter()
+        model, result = await model_routing.call_routed(
+            chosen, lambda m: agent.run(user_prompt, model=m, **kwargs)
+        )
+        latency = time.perf_counter() - start
+
+    # ``usage`` is a method on pydantic-ai 1.x and a property on newer releases
+    usage = result.usage() if callable(result.usage) else result.usage
+    input_tokens, output_tokens = usage.input_tokens or 0, usage.output_tokens or 0
+    record_token_usage(name, input_tokens, output_tokens)
+    model_routing.record_cost(chosen, model, input_tokens, output_tokens)
+    if cassettes.is_recording():
+        cassettes.record(
+            name,
+            fp,
+            output=result.output,
+            latency=latency,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            model=model,
+        )
+    return result.output
+
+
+async def stream_agent_text(name: str, agent: Agent, user_prompt: Any, **kwargs: Any) -> AsyncIterator[str]:
+    """Like :func:`run_agent` for text agents, yielding the answer as it is generated.
+
+    Recordings are shared with ``run_agent``; a replay yields the whole
+    recorded answer as one chunk. A fallback model is only tried before
+    any text was yielded.
+    """
+    fp = None
+    if cassettes.is_recording() or cassettes.is_replaying():
+        fp = cassettes.fingerprint(name, {"prompt": user_prompt, **kwargs})
+
+    start = time.perf_counter()
+    if cassettes.is_replaying():
+        entry = await cassettes.replay(name, fp)
+        observe_stage(f"agent.{name}", time.perf_counter() - start)
+        usage = entry["usage"]
+        record_token_usage(name, usage["input_tokens"], usage["output_tokens"])
+        yield entry["output"]
+        return
+
+    chosen = model_routing.route(name, model_routing.input_tokens(user_prompt, **kwargs))
+    error: BaseException | None = None
+    for model, timeout in chosen.attempts():
+        attempt_start = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            try:
+                # Only up to the first text: nothing is yielded while the target runs
+                with model_routing.routed_to(model):
+                    async with asyncio.timeout(timeout):
+                        result = await stack.enter_async_context(
+                            agent.run_stream(user_prompt, model=model_routing.get_model(model), **kwargs)
+                        )
+                        deltas = aiter(result.stream_text(delta=True, debounce_by=None))
+                        first = await anext(deltas, None)
+            except model_routing.FALLBACK_ERRORS as exc:
+                model_routing.record_attempt(chosen, model, time.perf_counter() - attempt_start, exc)
+                error = exc
+                continue
+            first_text = time.perf_counter() - attempt_start
+
+            chunks: list[str] = []
+            if first is not None:
+                chunks.append(first)
+                yield first
+            async for delta in deltas:
+                chunks.append(delta)
+                yield delta
+        break
+    else:
+        raise error
+    # Streams are timed to their first text, which is what the target is for
+    model_routing.record_attempt(chosen, model, first_text)
+    # Timed by hand: a stage() block cannot span the generator's yields
+    latency = time.perf_counter() - start
+    observe_stage(f"agent.{name}", latency)
+
+    usage = result.usage() if callable(result.usage) else result.usage
+    input_tokens, output_tokens = usage.input_tokens or 0, usage.output_tokens or 0
+    record_token_usage(name, input_tokens, output_tokens)
+    model_routing.record_cost(chosen, model, input_tokens, output_tokens)
+    if cassettes.is_recording():
+        cassettes.record(
+            name,
+            fp,
+            output="".join(chunks),
+            latency=latency,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            model=model,
+        )
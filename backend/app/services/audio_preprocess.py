@@ -0,0 +1,201 @@
+"""Silence trimming ahead of Whisper.
+
+Consultation recordings carry long pauses, and Whisper latency grows with
+every second uploaded. Before upload the audio is decoded to 16 kHz mono,
+split into 30 ms frames, and each frame is classed as speech or silence by
+its energy relative to the recording's own noise floor (vectorized with
+NumPy). Silent runs longer than ``AUDIO_TRIM_MIN_SILENCE_MS`` are cut,
+leaving ``AUDIO_TRIM_PAD_MS`` either side so word onsets and tails survive.
+What is left is re-encoded as low-bitrate mono Opus.
+
+Decoding and encoding are CPU-bound, so they run in a worker thread.
+Anything that cannot be decoded is passed through untouched.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+from dataclasses import dataclass, field
+
+import av
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import Counter, stage
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16_000
+FRAME_MS = 30
+OPUS_BIT_RATE = 24_000
+# A frame is speech when it is this far above the noise floor (the 10th
+# percentile of frame energy) and above an absolute floor for near-digital
+# silence. The threshold never rises above SPEECH_RANGE_DB below the loud
+# frames (90th percentile), so a recording with hardly any pauses, whose
+# "noise floor" is really quiet speech, is left intact.
+SPEECH_MARGIN_DB = 12.0
+SPEECH_RANGE_DB = 30.0
+ABSOLUTE_FLOOR_DB = -60.0
+# A recording with less range than the margin holds one steady level
+# throughout: speech if it is at least this loud, otherwise room noise
+STEADY_SPEECH_DB = -45.0
+
+AUDIO_SECONDS = Counter(
+    "helio_audio_seconds_total",
+    "Seconds of audio before and after silence trimming (stage: input, kept).",
+    ("stage",),
+)
+AUDIO_TRIMMED_SECONDS = Counter(
+    "helio_audio_trimmed_seconds_total",
+    "Seconds of silence cut before transcription.",
+)
+AUDIO_UPLOAD_BYTES = Counter(
+    "helio_audio_upload_bytes_total",
+    "Audio bytes before and after preprocessing (stage: input, upload).",
+    ("stage",),
+)
+
+
+@dataclass
+class TrimmedAudio:
+    data: bytes  # empty when no speech was found
+    mime_type: str
+    input_seconds: float
+    kept_seconds: float
+    # (trimmed start, source start, duration) in seconds, when requested
+    offsets: list[tuple[float, float, float]] | None = field(default=None)
+
+    def source_time(self, t: float) -> float:
+        """Map a time in the trimmed audio back to the original recording."""
+        if not self.offsets:
+            return t
+        for trimmed_start, source_start, duration in self.offsets:
+            if t < trimmed_start + duration:
+                return source_start + max(0.0, t - trimmed_start)
+        trimmed_start, source_start, duration = self.offsets[-1]
+        return source_start + duration
+
+
+# ---------------------------------------------------------------------------
+# Decode / encode
+# ---------------------------------------------------------------------------
+
+def decode_mono(audio_bytes: bytes) -> np.ndarray:
+    """Decode any container/codec ffmpeg knows to 16 kHz mono float32."""
+    # One-second output frames: far fewer ndarray conversions than per packet
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE, frame_size=SAMPLE_RATE)
+    chunks: list[np.ndarray] = []
+    with av.open(io.BytesIO(audio_bytes)) as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(frame))
+    chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(None))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def encode_opus(samples: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with av.open(buf, "w", format="ogg") as container:
+        # Lowest encoder complexity: about 6x faster than the default, and
+        # barely larger at this bitrate
+        stream = container.add_stream(
+            "libopus", rate=SAMPLE_RATE, layout="mono", options={"compression_level": "0"}
+        )
+        stream.bit_rate = OPUS_BIT_RATE
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="flt", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buf.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Voice activity
+# ---------------------------------------------------------------------------
+
+def speech_frames(samples: np.ndarray) -> np.ndarray:
+    """Per-frame speech flags for 16 kHz samples."""
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    n = len(samples) // frame_len
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[: n * frame_len].reshape(n, frame_len)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    floor, loud = np.percentile(energy_db, [10, 90])
+    if loud - floor < SPEECH_MARGIN_DB:
+        return np.full(n, loud >= STEADY_SPEECH_DB)
+    threshold = max(min(floor + SPEECH_MARGIN_DB, loud - SPEECH_RANGE_DB), ABSOLUTE_FLOOR_DB)
+    return energy_db > threshold
+
+
+def kept_spans(speech: np.ndarray, *, min_silence_frames: int, pad_frames: int) -> list[tuple[int, int]]:
+    """Frame ranges to keep: everything except silent runs of at least ``min_silence_frames``.
+
+    Each cut silence keeps ``pad_frames`` at either edge.
+    """
+    if not speech.any():
+        return []
+    # Boundaries of silent runs, found from the flag changes
+    padded = np.concatenate(([True], speech, [True]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    silent_starts, silent_ends = changes[::2], changes[1::2]
+    long_runs = (silent_ends - silent_starts) >= min_silence_frames
+
+    spans: list[tuple[int, int]] = []
+    position = 0
+    for start, end in zip(silent_starts[long_runs], silent_ends[long_runs]):
+        cut_start = start + (pad_frames if start > 0 else 0)
+        cut_end = end - (pad_frames if end < len(speech) else 0)
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            spans.append((position, int(cut_start)))
+        position = int(cut_end)
+    if position < len(speech):
+        spans.append((position, len(speech)))
+    return spans
+
+
+def trim_silence(audio_bytes: bytes, *, offsets: bool = False) -> TrimmedAudio:
+    """Cut long silences and re-encode; blocking, run it off the event loop."""
+    samples = decode_mono(audio_bytes)
+    input_seconds = len(samples) / SAMPLE_RATE
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    spans = kept_spans(
+        speech_frames(samples),
+        min_silence_frames=settings.AUDIO_TRIM_MIN_SILENCE_MS // FRAME_MS,
+        pad_frames=settings.AUDIO_TRIM_PAD_MS // FRAME_MS,
+    )
+    if not spans:
+        return TrimmedAudio(b"", "audio/ogg", input_seconds, 0.0, [] if offsets else None)
+
+    kept = np.concatenate([samples[s * frame_len:e * frame_len] for s, e in spans])
+    offset_map = None
+    if offsets:
+        offset_map, trimmed_start = [], 0.0
+        for s, e in spans:
+            duration = (e - s) * FRAME_MS / 1000
+            offset_map.append((trimmed_start, s * FRAME_MS / 1000, duration))
+            trimmed_start += duration
+    return TrimmedAudio(encode_opus(kept), "audio/ogg", input_seconds, len(kept) / SAMPLE_RATE, offset_map)
+
+
+async def preprocess_for_transcription(audio_bytes: bytes, mime_type: str, *, offsets: bool = False) -> TrimmedAudio:
+    """Trim silence in a worker thread; undecodable audio comes back unchanged."""
+    with stage("audio.trim_silence"):
+        try:
+            trimmed = await asyncio.to_thread(trim_silence, audio_bytes, offsets=offsets)
+        except (av.FFmpegError, ValueError, IndexError) as exc:
+            logger.warning("Could not decode %s audio for trimming (%s); uploading as is", mime_type, exc)
+            AUDIO_UPLOAD_BYTES.inc(len(audio_bytes), "input")
+            AUDIO_UPLOAD_BYTES.inc(len(audio_bytes), "upload")
+            return TrimmedAudio(audio_bytes, mime_type, input_seconds=0.0, kept_seconds=0.0)
+
+    AUDIO_SECONDS.inc(trimmed.input_seconds, "input")
+    AUDIO_SECONDS.inc(trimmed.kept_seconds, "kept")
+    AUDIO_TRIMMED_SECONDS.inc(trimmed.input_seconds - trimmed.kept_seconds)
+    AUDIO_UPLOAD_BYTES.inc(len(audio_bytes), "input")
+    AUDIO_UPLOAD_BYTES.inc(len(trimmed.data), "upload")
+    return trimmed
@@ -0,0 +1,167 @@
+"""Transcription and extraction of many recordings in one request.
+
+Each recording goes through the ``/transcribe`` pipeline: Whisper, then
+the prescription, summary and title agents. Whisper calls and extraction
+runs are bounded separately, so a large batch cannot flood either service.
+Finished items are saved in groups, with one bulk insert of consultations
+and one of prescriptions per group. A recording that fails is reported on
+its own item and the rest of the batch carries on. Recordings are kept in
+the blob store, attached in one go per saved group.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.metrics import Counter, stage
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.services.extraction import EXTRACTED_FIELDS, input_hash, key_points_from, prescription_row, run_extraction
+from app.services.transcription import transcribe_audio
+from app.services.uploads import PendingUpload, Upload, discard_uploads, keep_uploads
+
+logger = logging.getLogger(__name__)
+
+BATCH_ITEMS = Counter(
+    "helio_batch_transcription_items_total",
+    "Batch transcription items by outcome (completed, failed).",
+    ("outcome",),
+)
+
+
+@dataclass
+class BatchItem:
+    filename: str
+    mime_type: str
+    patient_id: uuid.UUID
+    # Reads the audio; called only once the item gets a Whisper slot
+    load: Callable[[], Awaitable[bytes]]
+
+
+@dataclass
+class BatchResult:
+    index: int
+    filename: str
+    status: str = "pending"  # then "completed" or "failed"
+    consultation_id: uuid.UUID | None = None
+    title: str | None = None
+    error: str | None = None
+
+
+class _BulkSaver:
+    """Collects finished items and inserts them ``group_size`` at a time."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], group_size: int) -> None:
+        self.session_factory = session_factory
+        self.group_size = group_size
+        self._pending: list[tuple[BatchResult, dict, dict, Upload | None]] = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, result: BatchResult, consultation: dict, prescription: dict, upload: Upload | None) -> None:
+        self._pending.append((result, consultation, prescription, upload))
+        if len(self._pending) >= self.group_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            group, self._pending = self._pending, []
+            if not group:
+                return
+            uploads = [u for *_, u in group if u is not None]
+            try:
+                with stage("batch_transcription.save"):
+                    async with self.session_factory() as db:
+                        await db.execute(insert(Consultation), [c for _, c, _, _ in group])
+                        await db.execute(insert(Prescription), [p for _, _, p, _ in group])
+                        await db.commit()
+            except Exception:
+                logger.exception("Saving %d batch transcription items failed", len(group))
+                await discard_uploads(uploads)
+                for result, *_ in group:
+                    _fail(result, "Could not save results")
+                return
+            for result, *_ in group:
+                result.status = "completed"
+                BATCH_ITEMS.inc(1, "completed")
+            await self._keep(uploads)
+
+    async def _keep(self, uploads: list[Upload]) -> None:
+        # Best-effort, like single uploads: the items are saved either way
+        try:
+            async with self.session_factory() as db:
+                await keep_uploads(db, uploads)
+        except Exception:
+            logger.exception("Could not keep %d batch recordings", len(uploads))
+
+
+def _fail(result: BatchResult, error: str) -> None:
+    result.status, result.error, result.consultation_id, result.title = "failed", error, None, None
+    BATCH_ITEMS.inc(1, "failed")
+
+
+async def transcribe_batch(
+    items: list[BatchItem],
+    doctor_id: uuid.UUID,
+    session_factory: async_sessionmaker[AsyncSession],
+    *,
+    whisper_concurrency: int,
+    extraction_concurrency: int,
+    save_group_size: int,
+) -> list[BatchResult]:
+    whisper_slots = asyncio.Semaphore(whisper_concurrency)
+    extraction_slots = asyncio.Semaphore(extraction_concurrency)
+    saver = _BulkSaver(session_factory, save_group_size)
+    results = [BatchResult(index=i, filename=item.filename) for i, item in enumerate(items)]
+
+    async def process(item: BatchItem, result: BatchResult) -> None:
+        step = "Transcription failed"
+        upload: PendingUpload | None = None
+        try:
+            async with whisper_slots:
+                audio = await item.load()
+                upload = PendingUpload(audio, kind="audio", mime_type=item.mime_type, filename=item.filename)
+                transcript = await transcribe_audio(audio, item.mime_type)
+                del audio
+            step = "Extraction failed"
+            async with extraction_slots:
+                prescription_result, summary_result, title = await run_extraction(transcript)
+        except BaseException as exc:
+            if upload is not None:
+                await upload.drop()
+            if not isinstance(exc, Exception):
+                raise
+            logger.exception("Batch item %d (%s): %s", result.index, item.filename, step.lower())
+            _fail(result, step)
+            return
+
+        now = datetime.now(timezone.utc)
+        consultation_id = uuid.uuid4()
+        result.consultation_id, result.title = consultation_id, title
+        await saver.add(
+            result,
+            {
+                "id": consultation_id,
+                "doctor_id": doctor_id,
+                "patient_id": item.patient_id,
+                "transcript": transcript,
+                "title": title,
+                "status": "completed",
+                "summary": summary_result.model_dump(),
+                "key_points": key_points_from(prescription_result).model_dump(),
+                "input_hashes": dict.fromkeys(EXTRACTED_FIELDS, input_hash(transcript)),
+                "consent_given_at": now,
+            },
+            prescription_row(consultation_id, prescription_result),
+            await upload.for_consultation(consultation_id),
+        )
+
+    await asyncio.gather(*(process(item, result) for item, result in zip(items, results)))
+    await saver.flush()
+    return results
@@ -0,0 +1,163 @@
+"""Content-addressed storage for uploaded audio and images.
+
+Blobs are keyed by the SHA-256 of their content, so an identical upload is
+stored once however often it arrives. Writes are two-phase: ``stage``
+streams the content into the backend while hashing it, and ``publish``
+makes it visible under its digest, or drops the staged copy when that
+content is already there. Callers publish while holding the ``blobs`` row
+lock (see ``app.services.uploads``), which keeps publishing and garbage
+collection of the same digest from interleaving.
+
+Reads stream in chunks and can start and stop anywhere, for HTTP ranges.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Protocol
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StagedBlob:
+    sha256: str
+    size: int
+    # Backend-specific handle on the staged copy
+    location: str
+
+
+class BlobBackend(Protocol):
+    async def stage(self, chunks: AsyncIterable[bytes]) -> StagedBlob: ...
+
+    async def publish(self, staged: StagedBlob) -> bool: ...
+
+    async def discard(self, staged: StagedBlob) -> None: ...
+
+    async def purge_staged(self, older_than_s: float) -> int: ...
+
+    async def size(self, sha256: str) -> int | None: ...
+
+    def read(self, sha256: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]: ...
+
+    async def delete(self, sha256: str) -> None: ...
+
+
+class LocalBlobBackend:
+    """Blobs as files under ``root/ab/cd/<digest>``, staged in ``root/tmp``.
+
+    File I/O runs in worker threads, one chunk at a time, so a large
+    upload never sits in memory whole.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+        self.staging = self.root / "tmp"
+        self.staging.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    async def stage(self, chunks: AsyncIterable[bytes]) -> StagedBlob:
+        path = self.staging / f"{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(f: BinaryIO, chunk: bytes) -> None:
+            digest.update(chunk)
+            f.write(chunk)
+
+        f = await asyncio.to_thread(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(write, f, chunk)
+                size += len(chunk)
+            await asyncio.to_thread(f.close)
+        except BaseException:
+            f.close()
+            path.unlink(missing_ok=True)
+            raise
+        return StagedBlob(digest.hexdigest(), size, str(path))
+
+    async def publish(self, staged: StagedBlob) -> bool:
+        """Move the staged copy into place; False when the content was already stored."""
+        final = self._path(staged.sha256)
+
+        def move() -> bool:
+            if final.exists():
+                os.unlink(staged.location)
+                return False
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged.location, final)
+            return True
+
+        return await asyncio.to_thread(move)
+
+    async def discard(self, staged: StagedBlob) -> None:
+        await asyncio.to_thread(Path(staged.location).unlink, missing_ok=True)
+
+    async def purge_staged(self, older_than_s: float) -> int:
+        """Delete staged copies left behind by requests that died mid-upload."""
+
+        def purge() -> int:
+            cutoff = time.time() - older_than_s
+            removed = 0
+            for path in self.staging.glob("*.part"):
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+            return removed
+
+        return await asyncio.to_thread(purge)
+
+    async def size(self, sha256: str) -> int | None:
+        try:
+            return (await asyncio.to_thread(self._path(sha256).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def read(self, sha256: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        """Bytes ``start`` up to (not including) ``end``, in chunks."""
+        f = await asyncio.to_thread(open, self._path(sha256), "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                n = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, n)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def delete(self, sha256: str) -> None:
+        await asyncio.to_thread(self._path(sha256).unlink, missing_ok=True)
+
+
+async def iter_chunks(data: bytes | memoryview) -> AsyncIterator[bytes]:
+    """Feed bytes already in memory to ``stage`` without copying them whole."""
+    view = memoryview(data)
+    for offset in range(0, len(view), CHUNK_SIZE):
+        yield bytes(view[offset:offset + CHUNK_SIZE])
+
+
+@lru_cache(maxsize=1)
+def get_blob_backend() -> BlobBackend:
+    if settings.BLOB_STORE_BACKEND == "local":
+        return LocalBlobBackend(settings.BLOB_STORE_DIR)
+    raise ValueError(f"Unknown BLOB_STORE_BACKEND {settings.BLOB_STORE_BACKEND!r}")
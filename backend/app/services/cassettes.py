@@ -0,0 +1,110 @@
+"""Record/replay of LLM and transcription calls.
+
+With ``CASSETTE_MODE=record`` every agent run and transcription is stored
+under ``CASSETTE_DIR/<name>/<fingerprint>.json`` together with its token
+usage and observed latency. With ``CASSETTE_MODE=replay`` the stored output
+is served instead of calling the model (optionally after sleeping for the
+recorded latency), so tests and benchmarks can run fully offline.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+from pydantic_ai import BinaryContent
+
+from app.core.config import settings
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no recording matches a call."""
+
+
+def is_recording() -> bool:
+    return settings.CASSETTE_MODE == "record"
+
+
+def is_replaying() -> bool:
+    return settings.CASSETTE_MODE == "replay"
+
+
+def _canonical(obj: Any) -> Any:
+    """Reduce a call's inputs to the parts that affect the model's answer.
+
+    Binary payloads are replaced by their hash, and message history keeps
+    only part kinds and content (timestamps and ids change on every turn).
+    """
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, bytes):
+        return {"sha256": hashlib.sha256(obj).hexdigest()}
+    if isinstance(obj, BinaryContent):
+        return {"media_type": obj.media_type, "sha256": hashlib.sha256(obj.data).hexdigest()}
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "parts") and hasattr(obj, "kind"):
+        return {
+            "kind": obj.kind,
+            "parts": [
+                {"part_kind": p.part_kind, "content": _canonical(getattr(p, "content", None))}
+                for p in obj.parts
+            ],
+        }
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    return repr(obj)
+
+
+def fingerprint(name: str, payload: Any) -> str:
+    blob = json.dumps({"name": name, "payload": _canonical(payload)}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _path(name: str, fp: str) -> Path:
+    return Path(settings.CASSETTE_DIR) / name / f"{fp}.json"
+
+
+def record(
+    name: str,
+    fp: str,
+    *,
+    output: Any,
+    latency: float,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    model: str | None = None,
+) -> None:
+    path = _path(name, fp)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entry = {
+        "name": name,
+        "fingerprint": fp,
+        "output": output.model_dump(mode="json") if isinstance(output, BaseModel) else output,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        "model": model,
+        "latency_s": round(latency, 4),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(entry, indent=2))
+    os.replace(tmp, path)
+
+
+async def replay(name: str, fp: str) -> dict:
+    """Return the recorded entry for a call, honouring CASSETTE_REPLAY_LATENCY."""
+    path = _path(name, fp)
+    try:
+        entry = json.loads(path.read_text())
+    except FileNotFoundError:
+        raise CassetteMissError(f"No recording for {name} call {fp} in {settings.CASSETTE_DIR}")
+    if settings.CASSETTE_REPLAY_LATENCY:
+        await asyncio.sleep(entry.get("latency_s", 0))
+    return entry
@@ -1,8 +1,11 @@
+from collections.abc import AsyncIterator
 from functools import lru_cache
 
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.messages import ModelMessage
 
+from app.services.agent_runner import run_agent, stream_agent_text
+
 BASE_SYSTEM_PROMPT = (
     "You are Helio Health Assistant, a medical information tool. You help users understand "
     "general health topics and their existing consultation records.\n\n"
@@ -39,7 +42,6 @@ BASE_SYSTEM_PROMPT = (
 @lru_cache(maxsize=1)
 def _get_agent() -> Agent:
     agent = Agent(
-        "openai:gpt-4o",
         deps_type=str,
         system_prompt=BASE_SYSTEM_PROMPT,
     )
@@ -56,10 +58,24 @@ async def get_chat_response(
     message_history: list[ModelMessage] | None = None,
     consultation_context: str | None = None,
 ) -> str:
-    agent = _get_agent()
-    result = await agent.run(
+    return await run_agent(
+        "chat",
+        _get_agent(),
+        message,
+        deps=consultation_context or "",
+        message_history=message_history or [],
+    )
+
+
+def stream_chat_response(
+    message: str,
+    message_history: list[ModelMessage] | None = None,
+    consultation_context: str | None = None,
+) -> AsyncIterator[str]:
+    return stream_agent_text(
+        "chat",
+        _get_agent(),
         message,
         deps=consultation_context or "",
         message_history=message_history or [],
     )
-    return result.output
@@ -0,0 +1,379 @@
+"""Chat history loading with a per-session cache of built model messages.
+
+Without the cache every turn re-selects the whole session and rebuilds its
+``ModelRequest``/``ModelResponse`` objects. With it, a turn reads only the
+session tail from the last cached ``seq`` onwards. Normally that is the one
+row proving the entry is current, plus anything another worker appended
+and any of our own write-behind messages that have since been flushed. If
+the anchor row is gone, or a queued message was lost, the entry is stale
+and the session is reloaded in full.
+
+Messages still queued in the write-behind writer have no ``seq`` yet. They
+are always newer than every stored row, so they are served last.
+
+Backends are picked with ``CHAT_HISTORY_CACHE``:
+
+* ``memory``: an in-process LRU over sessions (the default).
+* ``file``: JSON files in ``CHAT_HISTORY_CACHE_DIR``. This is a local
+  stand-in for a shared store such as Redis. Entries go through the same
+  serialization round trip and are visible to every worker on the host.
+* ``off``: always load the full session.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.models.chat_message import ChatMessage
+from app.services.chat_writer import get_chat_writer
+
+HISTORY_ROWS_READ = Counter(
+    "helio_chat_history_rows_read_total",
+    "Chat message rows read from the database to build model history.",
+)
+HISTORY_CACHE_LOOKUPS = Counter(
+    "helio_chat_history_cache_lookups_total",
+    "Chat history cache lookups by outcome (hit, refresh, miss).",
+    ("outcome",),
+)
+
+
+class StoredMessage(NamedTuple):
+    id: uuid.UUID
+    seq: int | None  # None while queued for write-behind
+    role: str
+    content: str
+
+
+@dataclass
+class CachedHistory:
+    messages: list[ModelMessage] = field(default_factory=list)
+    last_id: uuid.UUID | None = None
+    # Highest stored seq covered, and ids covered that were still queued
+    last_seq: int | None = None
+    unsettled: tuple[uuid.UUID, ...] = ()
+
+    def extended(self, rows: list[StoredMessage]) -> CachedHistory:
+        # A new list: other requests may still hold this entry's messages
+        if not rows:
+            return self
+        seqs = [s for s in (self.last_seq, *(r.seq for r in rows)) if s is not None]
+        return CachedHistory(
+            messages=[*self.messages, *(to_model_message(r.role, r.content) for r in rows)],
+            last_id=rows[-1].id,
+            last_seq=max(seqs, default=None),
+            unsettled=(*self.unsettled, *(r.id for r in rows if r.seq is None)),
+        )
+
+
+def to_model_message(role: str, content: str) -> ModelMessage:
+    if role == "user":
+        return ModelRequest(parts=[UserPromptPart(content=content)])
+    return ModelResponse(parts=[TextPart(content=content)])
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class HistoryCacheBackend(Protocol):
+    async def get(self, key: str) -> CachedHistory | None: ...
+
+    async def set(self, key: str, entry: CachedHistory) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
+class InProcessBackend:
+    def __init__(self, max_sessions: int) -> None:
+        self.max_sessions = max_sessions
+        self._entries: OrderedDict[str, CachedHistory] = OrderedDict()
+
+    async def get(self, key: str) -> CachedHistory | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CachedHistory) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class FileBackend:
+    """File I/O runs in worker threads, off the event loop.
+
+    Eviction scans the directory only once ``max_sessions`` files may have
+    been exceeded, and then trims to ``EVICT_TO`` of it, so the scan happens
+    once per that many new sessions rather than on every write. The count
+    of files is this worker's estimate; each scan corrects it.
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, directory: str, max_sessions: int) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_sessions = max_sessions
+        self._files = len(list(self.directory.glob("*.json")))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key.replace(':', '_')}.json"
+
+    async def get(self, key: str) -> CachedHistory | None:
+        return await asyncio.to_thread(self._read, self._path(key))
+
+    async def set(self, key: str, entry: CachedHistory) -> None:
+        data = {
+            "messages": ModelMessagesTypeAdapter.dump_python(entry.messages, mode="json"),
+            "last_id": str(entry.last_id) if entry.last_id else None,
+            "last_seq": entry.last_seq,
+            "unsettled": [str(i) for i in entry.unsettled],
+        }
+        if await asyncio.to_thread(self._write, self._path(key), json.dumps(data)):
+            self._files += 1
+            if self._files > self.max_sessions:
+                self._files = await asyncio.to_thread(self._evict, int(self.max_sessions * self.EVICT_TO))
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
+
+    @staticmethod
+    def _read(path: Path) -> CachedHistory | None:
+        try:
+            data = json.loads(path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)  # LRU by mtime
+        return CachedHistory(
+            messages=ModelMessagesTypeAdapter.validate_python(data["messages"]),
+            last_id=uuid.UUID(data["last_id"]) if data["last_id"] else None,
+            last_seq=data["last_seq"],
+            unsettled=tuple(uuid.UUID(i) for i in data["unsettled"]),
+        )
+
+    @staticmethod
+    def _write(path: Path, text: str) -> bool:
+        """Replace the entry's file; True when it did not exist before."""
+        new = not path.exists()
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text)
+        os.replace(tmp, path)
+        return new
+
+    def _evict(self, keep: int) -> int:
+        """Delete the least recently used files beyond ``keep``; returns the files left."""
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass  # evicted by another worker
+        if len(files) <= keep:
+            return len(files)
+        files.sort()
+        for _, path in files[: len(files) - keep]:
+            path.unlink(missing_ok=True)
+        return keep
+
+
+@lru_cache(maxsize=1)
+def _get_backend() -> HistoryCacheBackend | None:
+    if settings.CHAT_HISTORY_CACHE == "memory":
+        return InProcessBackend(settings.CHAT_HISTORY_CACHE_SESSIONS)
+    if settings.CHAT_HISTORY_CACHE == "file":
+        return FileBackend(settings.CHAT_HISTORY_CACHE_DIR, settings.CHAT_HISTORY_CACHE_SESSIONS)
+    return None
+
+
+def _key(patient_id: uuid.UUID, session_id: str) -> str:
+    return f"{patient_id}:{session_id}"
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+def _rows_query(patient_id: uuid.UUID, session_id: str):
+    # Core columns only: no ORM entities or identity map for history reads
+    t = ChatMessage.__table__
+    return select(t.c.id, t.c.seq, t.c.role, t.c.content).where(
+        t.c.patient_id == patient_id, t.c.session_id == session_id
+    )
+
+
+def _pending(patient_id: uuid.UUID, session_id: str) -> list[StoredMessage]:
+    writer = get_chat_writer()
+    if writer is None:
+        return []
+    return [
+        StoredMessage(p["id"], None, p["role"], p["content"])
+        for p in writer.pending_for(patient_id, session_id)
+    ]
+
+
+async def load_page(
+    db: AsyncSession,
+    patient_id: uuid.UUID,
+    session_id: str,
+    *,
+    before: int | None = None,
+    after: int | None = None,
+    limit: int | None = None,
+) -> list[StoredMessage]:
+    """A slice of a session's messages in seq order, oldest first.
+
+    Without ``after`` this is the newest ``limit`` messages below ``before``;
+    with ``after`` it is the oldest ``limit`` messages above it. Messages
+    still queued for write-behind are included whenever the slice reaches
+    the end of the session.
+    """
+    t = ChatMessage.__table__
+    query = _rows_query(patient_id, session_id)
+    if before is not None:
+        query = query.where(t.c.seq < before)
+    if after is not None:
+        query = query.where(t.c.seq > after)
+    newest_first = after is None
+    query = query.order_by(t.c.seq.desc() if newest_first else t.c.seq.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    rows = [StoredMessage(*r) for r in (await db.execute(query)).all()]
+    HISTORY_ROWS_READ.inc(len(rows))
+    if newest_first:
+        rows.reverse()
+
+    reaches_end = before is None and (newest_first or limit is None or len(rows) < limit)
+    if reaches_end:
+        seen = {r.id for r in rows}
+        rows += [p for p in _pending(patient_id, session_id) if p.id not in seen]
+        if limit is not None and len(rows) > limit:
+            rows = rows[-limit:] if newest_first else rows[:limit]
+    return rows
+
+
+def _catch_up(entry: CachedHistory, tail: list[StoredMessage], queued: set[uuid.UUID]) -> CachedHistory | None:
+    """Bring a cached entry up to date with the stored tail, or None if it no longer matches."""
+    if entry.last_seq is not None and (not tail or tail[0].seq != entry.last_seq):
+        return None
+    unsettled = set(entry.unsettled)
+    stored = {r.id for r in tail}
+    if not (unsettled - stored) <= queued:
+        return None
+    foreign = [r for r in tail if r.seq != entry.last_seq and r.id not in unsettled]
+    if foreign and unsettled:
+        # Where our flushed messages fall among the others is unknown
+        return None
+    caught_up = CachedHistory(
+        messages=entry.messages,
+        last_id=entry.last_id,
+        last_seq=max((r.seq for r in tail), default=entry.last_seq),
+        unsettled=tuple(i for i in entry.unsettled if i not in stored),
+    )
+    return caught_up.extended(foreign)
+
+
+async def load_history(db: AsyncSession, patient_id: uuid.UUID, session_id: str) -> CachedHistory:
+    """The session's model message history, from cache where it is still current."""
+    backend = _get_backend()
+    key = _key(patient_id, session_id)
+    entry = await backend.get(key) if backend is not None else None
+
+    if entry is not None and entry.last_id is not None:
+        query = _rows_query(patient_id, session_id)
+        seq = ChatMessage.__table__.c.seq
+        if entry.last_seq is not None:
+            query = query.where(seq >= entry.last_seq)
+        tail = [StoredMessage(*r) for r in (await db.execute(query.order_by(seq))).all()]
+        HISTORY_ROWS_READ.inc(len(tail))
+        current = _catch_up(entry, tail, {p.id for p in _pending(patient_id, session_id)})
+        if current is not None:
+            # Compare the bookkeeping only; messages change only along with it
+            changed = (current.last_id, current.last_seq, current.unsettled) != (
+                entry.last_id, entry.last_seq, entry.unsettled
+            )
+            HISTORY_CACHE_LOOKUPS.inc(1, "refresh" if changed else "hit")
+            if changed:
+                await backend.set(key, current)
+            return current
+
+    if backend is not None:
+        HISTORY_CACHE_LOOKUPS.inc(1, "miss")
+    entry = CachedHistory().extended(await load_page(db, patient_id, session_id))
+    if backend is not None and entry.last_id is not None:
+        await backend.set(key, entry)
+    return entry
+
+
+async def peek_history(patient_id: uuid.UUID, session_id: str) -> CachedHistory | None:
+    """The cached entry for a session, if any, without checking it against the database."""
+    backend = _get_backend()
+    return await backend.get(_key(patient_id, session_id)) if backend is not None else None
+
+
+async def _others_since(
+    db: AsyncSession, patient_id: uuid.UUID, session_id: str, base: CachedHistory, ours: set[uuid.UUID]
+) -> bool:
+    """Whether anyone else added to the session after ``base`` was loaded."""
+    known = ours | set(base.unsettled)
+    if any(p.id not in known for p in _pending(patient_id, session_id)):
+        return True
+    t = ChatMessage.__table__
+    query = select(t.c.id).where(
+        t.c.patient_id == patient_id, t.c.session_id == session_id, t.c.id.not_in(known)
+    )
+    if base.last_seq is not None:
+        query = query.where(t.c.seq > base.last_seq)
+    return (await db.execute(query.limit(1))).first() is not None
+
+
+async def append_history(
+    db: AsyncSession, patient_id: uuid.UUID, session_id: str, base: CachedHistory, rows: list[StoredMessage]
+) -> CachedHistory:
+    """Record a finished turn on top of the history it was built from.
+
+    If another message landed in the session since ``base`` was loaded (a
+    concurrent turn, possibly between our own two saves), the history is
+    reloaded instead. If only the cached entry moved on meanwhile, it is
+    dropped rather than merged; the next turn reloads. Without a cache
+    nothing reuses the result, so the database is not consulted.
+    """
+    backend = _get_backend()
+    if backend is None:
+        return base.extended(rows)
+    if await _others_since(db, patient_id, session_id, base, {r.id for r in rows}):
+        return await load_history(db, patient_id, session_id)
+    extended = base.extended(rows)
+    key = _key(patient_id, session_id)
+    current = await backend.get(key)
+    if current is not None and current.last_id != base.last_id:
+        await backend.delete(key)
+        return extended
+    await backend.set(key, extended)
+    return extended
@@ -0,0 +1,90 @@
+"""Keeps ``chat_sessions`` in step with ``chat_messages``.
+
+Every code path that inserts chat messages calls :func:`record_messages`
+in the same transaction, so a session's count, last message time and
+preview can never disagree with its messages.
+"""
+from __future__ import annotations
+
+import uuid
+from collections.abc import Sequence
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.chat_session import ChatSession
+
+TITLE_CHARS = 80
+PREVIEW_CHARS = 200
+
+
+def _title(content: str) -> str:
+    line = content.strip().splitlines()[0] if content.strip() else ""
+    return line if len(line) <= TITLE_CHARS else line[: TITLE_CHARS - 1].rstrip() + "…"
+
+
+async def record_messages(db: AsyncSession, rows: Sequence[dict]) -> None:
+    """Fold newly inserted message rows (ChatMessage column dicts) into their sessions.
+
+    One upsert per call; sessions are written in key order so concurrent
+    batches touching the same sessions cannot deadlock.
+    """
+    sessions: dict[tuple[uuid.UUID, str], dict] = {}
+    for row in sorted(rows, key=lambda r: r["created_at"]):
+        key = (row["patient_id"], row["session_id"])
+        session = sessions.get(key)
+        if session is None:
+            session = sessions[key] = {
+                "owner_id": row["patient_id"],
+                "session_id": row["session_id"],
+                "title": None,
+                "consultation_id": None,
+                "message_count": 0,
+            }
+        session["message_count"] += 1
+        session["last_message_at"] = row["created_at"]
+        session["preview"] = row["content"][:PREVIEW_CHARS]
+        if row.get("consultation_id") is not None:
+            session["consultation_id"] = row["consultation_id"]
+        if session["title"] is None and row["role"] == "user":
+            session["title"] = _title(row["content"])
+    if not sessions:
+        return
+
+    stmt = insert(ChatSession)
+    newer = stmt.excluded.last_message_at >= func.coalesce(ChatSession.last_message_at, stmt.excluded.last_message_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChatSession.owner_id, ChatSession.session_id],
+        set_={
+            "message_count": ChatSession.message_count + stmt.excluded.message_count,
+            "last_message_at": case((newer, stmt.excluded.last_message_at), else_=ChatSession.last_message_at),
+            "preview": case((newer, stmt.excluded.preview), else_=ChatSession.preview),
+            "consultation_id": func.coalesce(stmt.excluded.consultation_id, ChatSession.consultation_id),
+            "title": func.coalesce(ChatSession.title, stmt.excluded.title),
+        },
+    )
+    await db.execute(stmt, [{"id": uuid.uuid4(), **s} for _, s in sorted(sessions.items())])
+
+
+async def link_session(
+    db: AsyncSession,
+    owner_id: uuid.UUID,
+    session_id: str,
+    *,
+    title: str | None,
+    consultation_id: uuid.UUID | None,
+) -> None:
+    """Create or update a session's title and consultation link ahead of its messages."""
+    stmt = insert(ChatSession).values(
+        id=uuid.uuid4(), owner_id=owner_id, session_id=session_id,
+        title=title, consultation_id=consultation_id, message_count=0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChatSession.owner_id, ChatSession.session_id],
+        set_={
+            "title": func.coalesce(stmt.excluded.title, ChatSession.title),
+            "consultation_id": func.coalesce(stmt.excluded.consultation_id, ChatSession.consultation_id),
+        },
+    )
+    await db.execute(stmt)
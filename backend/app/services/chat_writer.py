@@ -0,0 +1,173 @@
+"""Write-behind persistence for chat messages.
+
+When ``CHAT_WRITE_BEHIND`` is enabled, chat turns enqueue their messages
+here instead of committing them one by one. A background task flushes the
+queue as a single multi-row INSERT every ``CHAT_WRITE_BEHIND_FLUSH_MS`` or
+as soon as ``CHAT_WRITE_BEHIND_MAX_BATCH`` rows are waiting, and again on
+shutdown. Readers merge :meth:`ChatMessageWriter.pending_for` into what
+they load from the database so queued messages are never invisible.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.metrics import stage
+from app.models.chat_message import ChatMessage
+from app.services.chat_sessions import record_messages
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        flush_interval: float,
+        max_batch: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: list[dict] = []
+        # Rows taken for the current flush; still served to readers until committed
+        self._inflight: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # The background flush in progress, shielded from the task's cancellation
+        self._flushing: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            # Let a batch already on its way commit rather than lose it mid-INSERT
+            try:
+                await self._flushing
+            except Exception:
+                pass  # requeued; retried below
+            self._flushing = None
+        try:
+            while self._pending:
+                await self.flush()
+        except Exception:
+            logger.error("Dropping %d unflushed chat messages at shutdown", len(self._pending))
+
+    def enqueue(
+        self,
+        *,
+        patient_id: uuid.UUID,
+        session_id: str,
+        role: str,
+        content: str,
+        consultation_id: uuid.UUID | None = None,
+    ) -> dict:
+        # Ids and timestamps are assigned here: rows of one turn may share a
+        # batch, so the server-side now() would no longer order them
+        row = {
+            "id": uuid.uuid4(),
+            "patient_id": patient_id,
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "consultation_id": consultation_id,
+            "created_at": datetime.now(timezone.utc),
+        }
+        self._pending.append(row)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return row
+
+    def pending_for(self, patient_id: uuid.UUID, session_id: str) -> list[dict]:
+        return [
+            row for row in (*self._inflight, *self._pending)
+            if row["patient_id"] == patient_id and row["session_id"] == session_id
+        ]
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch:]
+            try:
+                with stage("chat_writer.flush"):
+                    async with self.session_factory() as session:
+                        await session.execute(insert(ChatMessage), self._inflight)
+                        await record_messages(session, self._inflight)
+                        await session.commit()
+            except IntegrityError:
+                # One bad row (e.g. its consultation was deleted meanwhile)
+                # must not poison the whole batch
+                await self._insert_each(self._inflight)
+            except Exception:
+                logger.exception("Chat write-behind flush of %d rows failed; will retry", len(self._inflight))
+                self._pending[:0] = self._inflight
+                raise
+            finally:
+                self._inflight = []
+
+    async def _insert_each(self, rows: list[dict]) -> None:
+        for i, row in enumerate(rows):
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(insert(ChatMessage), [row])
+                    await record_messages(session, [row])
+                    await session.commit()
+            except IntegrityError:
+                logger.exception("Dropping chat message %s that cannot be stored", row["id"])
+            except Exception:
+                # Not the row's fault (e.g. the connection dropped): keep it and the rest
+                logger.exception("Chat write-behind flush of %d rows failed; will retry", len(rows) - i)
+                self._pending[:0] = rows[i:]
+                raise
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._flushing = asyncio.create_task(self.flush())
+            try:
+                await asyncio.shield(self._flushing)
+            except Exception:
+                # Rows were requeued; back off for one interval before retrying
+                await asyncio.sleep(self.flush_interval)
+
+
+_writer: ChatMessageWriter | None = None
+
+
+def get_chat_writer() -> ChatMessageWriter | None:
+    """The running writer, or None when write-behind is disabled."""
+    return _writer
+
+
+def start_chat_writer(session_factory: async_sessionmaker[AsyncSession], flush_ms: int, max_batch: int) -> None:
+    global _writer
+    _writer = ChatMessageWriter(session_factory, flush_interval=flush_ms / 1000, max_batch=max_batch)
+    _writer.start()
+
+
+async def stop_chat_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
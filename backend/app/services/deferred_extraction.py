@@ -0,0 +1,241 @@
+"""Extraction that answers by per-agent deadlines and finishes the rest later.
+
+``/transcribe`` starts the prescription, summary and title agents together
+but waits for each only until its deadline (``TRANSCRIBE_*_DEADLINE_S``,
+counted from the start; 0 waits indefinitely). Whatever has finished by
+then is returned and saved. An agent that is still running keeps running:
+its fields are listed in ``Consultation.pending_fields``, the row stays
+``processing``, and the result is written into the row when it arrives.
+A late agent gets ``TRANSCRIBE_BACKGROUND_GRACE_S`` more; if it fails, runs
+out of time or is cancelled at shutdown, its fields stop being pending and
+stay empty. Fields a worker that died left pending expire on their own
+(:func:`app.services.extraction.still_pending`).
+
+Watchers of a consultation (the ``/events`` stream) are woken in-process
+when a late result is stored; watchers on other workers see it on their
+next poll.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import uuid
+import weakref
+from collections.abc import Coroutine
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import String, and_, case, func, literal, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.schemas.consultation import SummaryData
+from app.services.extraction import AGENT_CALLS, AGENT_FIELDS, input_hash, prescription_row, regenerated_fields
+from app.services.prescription_agent import PrescriptionAgentResult
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_AGENTS = Counter(
+    "helio_transcribe_deferred_agents_total",
+    "Extraction agents that missed their /transcribe deadline, by outcome "
+    "(deferred, completed, failed, cancelled).",
+    ("agent", "outcome"),
+)
+
+_background: set[asyncio.Task] = set()
+# Writes of late results, finished even when their job is cancelled
+_storing: set[asyncio.Task] = set()
+# Held only by waiting watchers, so entries go away with them
+_watchers: weakref.WeakValueDictionary[uuid.UUID, asyncio.Event] = weakref.WeakValueDictionary()
+
+
+@dataclass
+class Extraction:
+    prescription: PrescriptionAgentResult | None = None
+    summary: SummaryData | None = None
+    title: str | None = None
+    # Agents past their deadline, still running
+    late: dict[str, asyncio.Task] = field(default_factory=dict)
+    # Of the transcript, for Consultation.input_hashes
+    input_hash: str = ""
+
+    @property
+    def pending_fields(self) -> list[str]:
+        return [f for agent in self.late for f in AGENT_FIELDS[agent]]
+
+    @property
+    def input_hashes(self) -> dict[str, str]:
+        """Hashes of the fields extracted in time."""
+        done = [agent for agent in AGENT_FIELDS if agent not in self.late and getattr(self, agent) is not None]
+        return {f: self.input_hash for agent in done for f in AGENT_FIELDS[agent]}
+
+    def cancel(self) -> None:
+        """Stop the late agents, for when the consultation could not be saved."""
+        for task in self.late.values():
+            task.cancel()
+
+
+def _deadline(agent: str) -> float:
+    return getattr(settings, f"TRANSCRIBE_{agent.upper()}_DEADLINE_S")
+
+
+async def extract_by_deadlines(transcript: str) -> Extraction:
+    """Run the agents, returning once each has finished or hit its deadline.
+
+    An agent that fails before the response goes out fails the call, as
+    it always has; the others are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = {agent: asyncio.create_task(call(transcript)) for agent, call in AGENT_CALLS.items()}
+    try:
+        # Shortest deadline first, so each wait only covers the time left
+        for agent in sorted(tasks, key=lambda a: _deadline(a) or math.inf):
+            limit = _deadline(agent)
+            timeout = max(0.0, start + limit - loop.time()) if limit > 0 else None
+            await asyncio.wait([tasks[agent]], timeout=timeout)
+        extraction = Extraction(input_hash=input_hash(transcript))
+        for agent, task in tasks.items():
+            if task.done():
+                setattr(extraction, agent, task.result())
+            else:
+                extraction.late[agent] = task
+                DEFERRED_AGENTS.inc(1, agent, "deferred")
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return extraction
+
+
+# ---------------------------------------------------------------------------
+# Late results
+# ---------------------------------------------------------------------------
+
+def finish_in_background(
+    consultation_id: uuid.UUID,
+    extraction: Extraction,
+    session_factory: async_sessionmaker[AsyncSession],
+) -> None:
+    """Store each late agent's result on the (committed) consultation as it arrives."""
+    for agent, task in extraction.late.items():
+        job = asyncio.create_task(
+            _store_when_done(consultation_id, agent, task, extraction.input_hash, session_factory)
+        )
+        _background.add(job)
+        job.add_done_callback(_background.discard)
+
+
+async def _store_when_done(
+    consultation_id: uuid.UUID,
+    agent: str,
+    task: asyncio.Task,
+    transcript_hash: str,
+    session_factory: async_sessionmaker[AsyncSession],
+) -> None:
+    try:
+        async with asyncio.timeout(settings.TRANSCRIBE_BACKGROUND_GRACE_S):
+            output = await task
+    except Exception:
+        # Including running out of time. The fields stop being pending and
+        # stay empty; the doctor can regenerate
+        logger.exception("Deferred %s agent for consultation %s failed", agent, consultation_id)
+        output = None
+    except BaseException:
+        # Cancelled at shutdown: the fields must not stay pending for good
+        task.cancel()
+        DEFERRED_AGENTS.inc(1, agent, "cancelled")
+        await _finish(_store(consultation_id, agent, None, transcript_hash, session_factory))
+        _notify(consultation_id)
+        raise
+    DEFERRED_AGENTS.inc(1, agent, "failed" if output is None else "completed")
+    await _finish(_store(consultation_id, agent, output, transcript_hash, session_factory))
+    _notify(consultation_id)
+
+
+async def _finish(store: Coroutine[Any, Any, None]) -> None:
+    """Run ``store`` to the end even if the caller is cancelled meanwhile."""
+    job = asyncio.create_task(store)
+    _storing.add(job)
+    job.add_done_callback(_storing.discard)
+    await asyncio.shield(job)
+
+
+async def _store(
+    consultation_id: uuid.UUID,
+    agent: str,
+    output: Any,
+    transcript_hash: str,
+    session_factory: async_sessionmaker[AsyncSession],
+) -> None:
+    """Write a late agent's output, or with None just clear its pending fields."""
+    values: dict = {}
+    if output is not None:
+        # The prescription is a row of its own, added below
+        values = {f: v for f, v in regenerated_fields({agent: output}).items() if f != "prescription"}
+        values["input_hashes"] = Consultation.input_hashes.op("||", return_type=JSONB)(
+            literal(dict.fromkeys(AGENT_FIELDS[agent], transcript_hash), JSONB)
+        )
+
+    remaining = Consultation.pending_fields.op("-", return_type=JSONB)(
+        literal(list(AGENT_FIELDS[agent]), ARRAY(String))
+    )
+    try:
+        async with session_factory() as db:
+            stored = await db.execute(
+                update(Consultation)
+                .where(Consultation.id == consultation_id)
+                .values(
+                    **values,
+                    pending_fields=remaining,
+                    status=case(
+                        (
+                            and_(func.jsonb_array_length(remaining) == 0, Consultation.status == "processing"),
+                            "completed",
+                        ),
+                        else_=Consultation.status,
+                    ),
+                )
+                .returning(Consultation.id)
+            )
+            # Deleted while the agent ran: nothing to attach a prescription to
+            if stored.first() is not None and agent == "prescription" and output is not None:
+                db.add(Prescription(**prescription_row(consultation_id, output)))
+            await db.commit()
+    except Exception:
+        logger.exception("Could not store deferred %s for consultation %s", agent, consultation_id)
+
+
+def _notify(consultation_id: uuid.UUID) -> None:
+    event = _watchers.pop(consultation_id, None)
+    if event is not None:
+        event.set()
+
+
+async def wait_for_update(consultation_id: uuid.UUID, timeout: float) -> None:
+    """Return when a late result for the consultation is stored here, or after ``timeout``."""
+    event = _watchers.setdefault(consultation_id, asyncio.Event())
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def drain_deferred_extractions(timeout: float) -> None:
+    """Give late agents up to ``timeout`` seconds to land at shutdown, then cancel them."""
+    if not _background:
+        return
+    _, unfinished = await asyncio.wait(set(_background), timeout=timeout)
+    if unfinished:
+        logger.error("Cancelling %d deferred extraction agents at shutdown", len(unfinished))
+        for job in unfinished:
+            job.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+    if _storing:
+        # Cancelled jobs still clear their pending fields
+        await asyncio.wait(set(_storing), timeout=timeout)
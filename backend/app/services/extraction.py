@@ -0,0 +1,132 @@
+"""The extraction agents, and the stored form of what they produce.
+
+Everything that runs the prescription, summary and title agents over a
+transcript (``/transcribe`` and its late results, batch transcription,
+regeneration and bulk reprocessing) shares these, so a field is computed,
+hashed and stored the same way whichever path wrote it, and they all agree
+on when fields left pending by ``/transcribe`` are given up on.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import unicodedata
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import ColumnElement, func, or_
+
+from app.core.config import settings
+from app.models.consultation import Consultation
+from app.schemas.consultation import KeyPoints, SummaryData
+from app.services.prescription_agent import PrescriptionAgentResult, extract_prescription
+from app.services.summary_agent import generate_summary
+from app.services.title_agent import generate_title
+
+# Consultation fields the extraction agents produce; "prescription" is the Prescription row
+EXTRACTED_FIELDS = ("title", "summary", "key_points", "prescription")
+
+# Agent -> the consultation fields it produces
+AGENT_FIELDS = {
+    "prescription": ("key_points", "prescription"),
+    "summary": ("summary",),
+    "title": ("title",),
+}
+
+AGENT_CALLS = {
+    "prescription": extract_prescription,
+    "summary": generate_summary,
+    "title": generate_title,
+}
+
+# Prescription columns an agent run sets
+PRESCRIPTION_FIELDS = ("diagnosis", "medicines", "instructions")
+
+_TYPOGRAPHY = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-"})
+
+
+async def run_extraction(transcript: str) -> tuple[PrescriptionAgentResult, SummaryData, str]:
+    return await asyncio.gather(
+        extract_prescription(transcript),
+        generate_summary(transcript),
+        generate_title(transcript),
+    )
+
+
+def key_points_from(result: PrescriptionAgentResult) -> KeyPoints:
+    return KeyPoints(
+        symptoms=result.symptoms,
+        diagnosis=result.diagnosis,
+        allergies=result.allergies,
+        notes=result.notes,
+    )
+
+
+def prescription_row(consultation_id: uuid.UUID, result: PrescriptionAgentResult) -> dict:
+    return {
+        "id": uuid.uuid4(),
+        "consultation_id": consultation_id,
+        "diagnosis": ", ".join(result.diagnosis),
+        "medicines": [m.model_dump() for m in result.medicines],
+        "instructions": result.instructions,
+    }
+
+
+def regenerated_fields(outputs: dict[str, Any]) -> dict[str, Any]:
+    """Stored form of agent outputs, by field; ``prescription`` holds the Prescription columns."""
+    values: dict[str, Any] = {}
+    if "prescription" in outputs:
+        result = outputs["prescription"]
+        values["key_points"] = key_points_from(result).model_dump(mode="json")
+        row = prescription_row(uuid.uuid4(), result)
+        values["prescription"] = {name: row[name] for name in PRESCRIPTION_FIELDS}
+    if "summary" in outputs:
+        values["summary"] = outputs["summary"].model_dump(mode="json")
+    if "title" in outputs:
+        values["title"] = outputs["title"]
+    return values
+
+
+def pending_lifetime() -> timedelta:
+    """How long after ``pending_since`` late agents can still be storing fields.
+
+    Past it the fields were left behind by a worker that went away before
+    storing them, and no longer count as pending.
+    """
+    deadlines = (getattr(settings, f"TRANSCRIBE_{agent.upper()}_DEADLINE_S") for agent in AGENT_FIELDS)
+    return timedelta(seconds=max(deadlines) + settings.TRANSCRIBE_BACKGROUND_GRACE_S)
+
+
+def still_pending(consultation: Consultation) -> list[str]:
+    """``consultation.pending_fields`` that a late agent may still store."""
+    since = consultation.pending_since
+    if since is None or since < datetime.now(timezone.utc) - pending_lifetime():
+        return []
+    return consultation.pending_fields
+
+
+def nothing_pending() -> ColumnElement[bool]:
+    """SQL for :func:`still_pending` being empty."""
+    return or_(
+        func.jsonb_array_length(Consultation.pending_fields) == 0,
+        Consultation.pending_since.is_(None),
+        Consultation.pending_since < func.now() - pending_lifetime(),
+    )
+
+
+def normalize_transcript(transcript: str) -> str:
+    """``transcript`` without cosmetic differences: case, spacing, and quote and dash styles.
+
+    Punctuation is kept: "no pain?" and "no pain." are not the same answer.
+    """
+    text = unicodedata.normalize("NFKC", transcript).translate(_TYPOGRAPHY).casefold()
+    return " ".join(text.split())
+
+
+def input_hash(transcript: str) -> str:
+    """What ``Consultation.input_hashes`` records for fields extracted from ``transcript``.
+
+    Taken over the normalized text, so cosmetic edits keep the hash.
+    """
+    return hashlib.sha256(normalize_transcript(transcript).encode()).hexdigest()
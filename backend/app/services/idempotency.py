@@ -0,0 +1,231 @@
+"""Storage behind ``Idempotency-Key`` support.
+
+A request carrying a key first claims it: one ``INSERT ... ON CONFLICT``
+either creates the row (this request runs the endpoint), takes over a
+key that has expired or whose attempt was abandoned, or leaves the
+existing row alone. An existing row is then:
+
+- for a different request (fingerprint mismatch): ``KeyReusedError``;
+- completed: its stored response is replayed;
+- still in progress: waited on, until it completes, is released by a
+  failed attempt (the waiter then claims it), or ``IDEMPOTENCY_WAIT_S``
+  runs out (``KeyInProgressError``).
+
+Only successful responses are stored; a failed attempt releases the key
+so the retry runs for real. A periodic cleanup task deletes keys
+``IDEMPOTENCY_TTL_HOURS`` after they were claimed.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+import weakref
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.periodic import PeriodicTask
+from app.models.idempotency_key import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_REQUESTS = Counter(
+    "helio_idempotent_requests_total",
+    "Requests with an Idempotency-Key, by outcome (executed, replayed, conflict, mismatch).",
+    ("outcome",),
+)
+
+CLEANUP_BATCH = 1000
+
+# Held only by waiting retries, so entries go away with them
+_waiters: weakref.WeakValueDictionary[tuple[uuid.UUID, str], asyncio.Event] = weakref.WeakValueDictionary()
+
+
+class KeyReusedError(ValueError):
+    """The key was first used for a request with a different fingerprint."""
+
+
+class KeyInProgressError(RuntimeError):
+    """The attempt holding the key did not finish within ``IDEMPOTENCY_WAIT_S``."""
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes
+    media_type: str | None
+
+
+@dataclass
+class Claim:
+    """Proof that this request owns a key and must complete or release it."""
+
+    user_id: uuid.UUID
+    key: str
+
+
+def _notify(user_id: uuid.UUID, key: str) -> None:
+    event = _waiters.pop((user_id, key), None)
+    if event is not None:
+        event.set()
+
+
+async def _wait(user_id: uuid.UUID, key: str, timeout: float) -> None:
+    event = _waiters.setdefault((user_id, key), asyncio.Event())
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def claim_key(
+    session_factory: async_sessionmaker[AsyncSession],
+    user_id: uuid.UUID,
+    key: str,
+    fingerprint: str,
+) -> Claim | StoredResponse:
+    """Own ``key`` for this request, or get the response an earlier request stored under it."""
+    loop = asyncio.get_running_loop()
+    give_up = loop.time() + settings.IDEMPOTENCY_WAIT_S
+    ttl = timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    abandoned = timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT_S)
+    claim_stmt = (
+        insert(IdempotencyKey)
+        .values(user_id=user_id, key=key, fingerprint=fingerprint, status="in_progress")
+        .on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "response_status": None,
+                "response_body": None,
+                "media_type": None,
+                "created_at": func.now(),
+            },
+            where=or_(
+                IdempotencyKey.created_at < func.now() - ttl,
+                and_(IdempotencyKey.status == "in_progress", IdempotencyKey.created_at < func.now() - abandoned),
+            ),
+        )
+        .returning(IdempotencyKey.key)
+    )
+
+    while True:
+        async with session_factory() as db:
+            claimed = (await db.execute(claim_stmt)).first() is not None
+            existing = None
+            if not claimed:
+                existing = (
+                    await db.execute(
+                        select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                    )
+                ).scalar_one_or_none()
+            await db.commit()
+
+        if claimed:
+            IDEMPOTENT_REQUESTS.inc(1, "executed")
+            return Claim(user_id, key)
+        if existing is None:
+            # Released between the two statements: claim it again
+            continue
+        if existing.fingerprint != fingerprint:
+            IDEMPOTENT_REQUESTS.inc(1, "mismatch")
+            raise KeyReusedError(key)
+        if existing.status == "completed":
+            IDEMPOTENT_REQUESTS.inc(1, "replayed")
+            return StoredResponse(existing.response_status, existing.response_body, existing.media_type)
+
+        remaining = give_up - loop.time()
+        if remaining <= 0:
+            IDEMPOTENT_REQUESTS.inc(1, "conflict")
+            raise KeyInProgressError(key)
+        # Woken at once by an attempt in this process, otherwise on the next poll
+        await _wait(user_id, key, min(remaining, settings.IDEMPOTENCY_POLL_S))
+
+
+async def complete_key(
+    session_factory: async_sessionmaker[AsyncSession], claim: Claim, response: StoredResponse
+) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == claim.user_id,
+                IdempotencyKey.key == claim.key,
+                IdempotencyKey.status == "in_progress",
+            )
+            .values(
+                status="completed",
+                response_status=response.status_code,
+                response_body=response.body,
+                media_type=response.media_type,
+            )
+        )
+        await db.commit()
+    _notify(claim.user_id, claim.key)
+
+
+async def release_key(session_factory: async_sessionmaker[AsyncSession], claim: Claim) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == claim.user_id,
+                IdempotencyKey.key == claim.key,
+                IdempotencyKey.status == "in_progress",
+            )
+        )
+        await db.commit()
+    _notify(claim.user_id, claim.key)
+
+
+# ---------------------------------------------------------------------------
+# Cleanup
+# ---------------------------------------------------------------------------
+
+async def purge_expired_keys(session_factory: async_sessionmaker[AsyncSession], ttl: timedelta) -> int:
+    """Delete keys claimed more than ``ttl`` ago, in short batches; returns how many."""
+    expired = (
+        select(IdempotencyKey.user_id, IdempotencyKey.key)
+        .where(IdempotencyKey.created_at < func.now() - ttl)
+        .limit(CLEANUP_BATCH)
+    )
+    total = 0
+    while True:
+        async with session_factory() as db:
+            result = await db.execute(
+                delete(IdempotencyKey).where(
+                    tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired)
+                )
+            )
+            await db.commit()
+        total += result.rowcount
+        if result.rowcount < CLEANUP_BATCH:
+            return total
+
+
+_cleanup: PeriodicTask | None = None
+
+
+async def _cleanup_once(session_factory: async_sessionmaker[AsyncSession]) -> None:
+    deleted = await purge_expired_keys(session_factory, timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS))
+    if deleted:
+        logger.info("Deleted %d expired idempotency keys", deleted)
+
+
+def start_idempotency_cleanup(session_factory: async_sessionmaker[AsyncSession], interval: float) -> None:
+    global _cleanup
+    _cleanup = PeriodicTask("Idempotency key cleanup", lambda: _cleanup_once(session_factory), interval)
+    _cleanup.start()
+
+
+async def stop_idempotency_cleanup() -> None:
+    global _cleanup
+    if _cleanup is not None:
+        await _cleanup.stop()
+        _cleanup = None
@@ -5,6 +5,7 @@ from functools import lru_cache
 from pydantic_ai import Agent, BinaryContent, ImageUrl
 
 from app.schemas.consultation import SummaryData
+from app.services.agent_runner import run_agent
 from app.services.prescription_agent import PrescriptionAgentResult
 
 # ---------------------------------------------------------------------------
@@ -61,7 +62,6 @@ _PRESCRIPTION_IMAGE_SYSTEM = (
 @lru_cache(maxsize=1)
 def _get_prescription_image_agent() -> Agent:
     return Agent(
-        "openai:gpt-5-mini",
         output_type=PrescriptionAgentResult,
         system_prompt=_PRESCRIPTION_IMAGE_SYSTEM,
     )
@@ -98,7 +98,6 @@ _SUMMARY_IMAGE_SYSTEM = (
 @lru_cache(maxsize=1)
 def _get_summary_image_agent() -> Agent:
     return Agent(
-        "openai:gpt-5-mini",
         output_type=SummaryData,
         system_prompt=_SUMMARY_IMAGE_SYSTEM,
     )
@@ -122,7 +121,6 @@ _TITLE_IMAGE_SYSTEM = (
 @lru_cache(maxsize=1)
 def _get_title_image_agent() -> Agent:
     return Agent(
-        "openai:gpt-5-mini",
         output_type=str,
         system_prompt=_TITLE_IMAGE_SYSTEM,
     )
@@ -141,10 +139,12 @@ async def extract_prescription_from_image(
     media_type: str = "image/png",
 ) -> PrescriptionAgentResult:
     """Extract prescription data from an image."""
-    agent = _get_prescription_image_agent()
     img = _make_image_content(data, media_type)
-    result = await agent.run(["Extract prescription data from this image:", img])
-    return result.output
+    return await run_agent(
+        "image_prescription",
+        _get_prescription_image_agent(),
+        ["Extract prescription data from this image:", img],
+    )
 
 
 async def generate_summary_from_image(
@@ -152,10 +152,12 @@ async def generate_summary_from_image(
     media_type: str = "image/png",
 ) -> SummaryData:
     """Generate clinical summary from a prescription/document image."""
-    agent = _get_summary_image_agent()
     img = _make_image_content(data, media_type)
-    result = await agent.run(["Generate a clinical summary from this image:", img])
-    return result.output
+    return await run_agent(
+        "image_summary",
+        _get_summary_image_agent(),
+        ["Generate a clinical summary from this image:", img],
+    )
 
 
 async def generate_title_from_image(
@@ -163,7 +165,9 @@ async def generate_title_from_image(
     media_type: str = "image/png",
 ) -> str:
     """Generate a short title from a prescription/document image."""
-    agent = _get_title_image_agent()
     img = _make_image_content(data, media_type)
-    result = await agent.run(["Generate a title for this medical document:", img])
-    return result.output
+    return await run_agent(
+        "image_title",
+        _get_title_image_agent(),
+        ["Generate a title for this medical document:", img],
+    )
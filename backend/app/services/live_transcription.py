@@ -0,0 +1,114 @@
+"""Incremental transcription of a consultation while it is being recorded.
+
+The client sends the recording as a series of self-contained segments
+(each one decodable on its own, e.g. a MediaRecorder restarted every few
+seconds). Each segment is sent to Whisper in the background as soon as it
+arrives, a few at a time. Segments can finish out of order; the transcript
+only ever grows by the run of finished segments that directly follows
+what it already holds, so it always reads in recording order.
+
+Audio waiting for Whisper is bounded: once ``max_pending_bytes`` of it is
+queued, :meth:`LiveTranscript.add` waits for segments to finish, so a
+client sending faster than Whisper keeps up is slowed to its pace.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from app.core.metrics import Counter
+from app.services.transcription import transcribe_audio
+
+logger = logging.getLogger(__name__)
+
+LIVE_SEGMENTS = Counter(
+    "helio_live_transcription_segments_total",
+    "Live recording segments transcribed, by outcome (ok, failed).",
+    ("outcome",),
+)
+
+# Called with the index of the first newly settled segment and the texts of
+# all segments settled since the previous call
+OnSegments = Callable[[int, list[str]], Awaitable[None]]
+
+
+class LiveTranscript:
+    def __init__(
+        self, mime_type: str, on_segments: OnSegments, *, concurrency: int, max_pending_bytes: int
+    ) -> None:
+        self.mime_type = mime_type
+        self.on_segments = on_segments
+        self.max_pending_bytes = max_pending_bytes
+        self.failed: list[int] = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._texts: list[str] = []  # settled segments, in order
+        self._finished: dict[int, str] = {}  # finished but not yet settled
+        self._received = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._settle_lock = asyncio.Lock()
+        self._pending_bytes = 0
+        self._drained = asyncio.Event()
+
+    @property
+    def segments(self) -> int:
+        return self._received
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(t for t in self._texts if t)
+
+    async def add(self, audio: bytes) -> int:
+        """Queue one recorded segment for transcription; returns its index.
+
+        Waits while queuing it would exceed ``max_pending_bytes``; a segment
+        is always accepted once nothing else is pending.
+        """
+        while self._pending_bytes and self._pending_bytes + len(audio) > self.max_pending_bytes:
+            self._drained.clear()
+            await self._drained.wait()
+        index = self._received
+        self._received += 1
+        self._pending_bytes += len(audio)
+        task = asyncio.create_task(self._transcribe(index, audio))
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._done(t, len(audio)))
+        return index
+
+    def _done(self, task: asyncio.Task, size: int) -> None:
+        self._tasks.discard(task)
+        self._pending_bytes -= size
+        self._drained.set()
+
+    async def _transcribe(self, index: int, audio: bytes) -> None:
+        async with self._semaphore:
+            try:
+                text = (await transcribe_audio(audio, self.mime_type)).strip()
+                LIVE_SEGMENTS.inc(1, "ok")
+            except Exception:
+                # One lost segment should not end the recording; it is reported at the end
+                logger.exception("Live transcription of segment %d failed", index)
+                LIVE_SEGMENTS.inc(1, "failed")
+                self.failed.append(index)
+                text = ""
+        self._finished[index] = text
+        await self._settle()
+
+    async def _settle(self) -> None:
+        async with self._settle_lock:
+            first = len(self._texts)
+            while len(self._texts) in self._finished:
+                self._texts.append(self._finished.pop(len(self._texts)))
+            if len(self._texts) > first:
+                await self.on_segments(first, self._texts[first:])
+
+    async def finish(self) -> str:
+        """Wait for every queued segment and return the full transcript."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+        self.failed.sort()
+        return self.transcript
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
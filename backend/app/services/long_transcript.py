@@ -0,0 +1,152 @@
+"""Map-reduce over transcripts too long for one comfortable model call.
+
+Above ``LONG_TRANSCRIPT_TOKENS`` the summary and prescription agents stop
+sending the whole transcript. The transcript is split at speaker turns
+(then sentences, words, and as a last resort characters) into chunks of at most
+``LONG_TRANSCRIPT_CHUNK_TOKENS``, each overlapping the previous one by up
+to ``LONG_TRANSCRIPT_OVERLAP_TOKENS`` so nothing said across a boundary is
+lost. The chunks are extracted in parallel and the partial results merged
+deterministically by each agent module. The title only needs the visit's
+main topic, so it is generated from the opening chunk alone.
+
+Token counts are estimated from character length. That is close enough to
+bound chunk sizes and needs no tokenizer download.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+from collections.abc import Awaitable, Callable, Iterable
+from typing import TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+CHARS_PER_TOKEN = 4
+
+_TURN_RE = re.compile(r"\n+|(?<=[.!?])\s+(?=(?:Doctor|Patient|Dr\.|Nurse)\b[^:\n]{0,30}:)")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_KEY_RE = re.compile(r"[^a-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def is_long(transcript: str) -> bool:
+    return estimate_tokens(transcript) > settings.LONG_TRANSCRIPT_TOKENS
+
+
+def _pieces(turn: str, max_tokens: int) -> Iterable[str]:
+    """One turn as pieces no longer than ``max_tokens``: sentences, then words, then characters."""
+    if estimate_tokens(turn) <= max_tokens:
+        yield turn
+        return
+    for sentence in _SENTENCE_RE.split(turn):
+        if estimate_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        piece: list[str] = []
+        for word in sentence.split():
+            if estimate_tokens(word) > max_tokens:
+                # No spaces to split at (a pasted blob, a long URL): cut anywhere
+                if piece:
+                    yield " ".join(piece)
+                    piece = []
+                step = max_tokens * CHARS_PER_TOKEN
+                yield from (word[i:i + step] for i in range(0, len(word), step))
+                continue
+            if piece and estimate_tokens(" ".join([*piece, word])) > max_tokens:
+                yield " ".join(piece)
+                piece = []
+            piece.append(word)
+        if piece:
+            yield " ".join(piece)
+
+
+def _units(text: str, max_tokens: int) -> Iterable[tuple[bool, str]]:
+    """Pieces of ``text`` no longer than ``max_tokens``, split as coarsely as possible.
+
+    Each comes with whether it starts a speaker turn.
+    """
+    for turn in _TURN_RE.split(text):
+        turn = turn.strip()
+        if turn:
+            for i, piece in enumerate(_pieces(turn, max_tokens)):
+                yield i == 0, piece
+
+
+def _join(units: list[tuple[bool, str]]) -> str:
+    # Turns stay on lines of their own; pieces of one turn are rejoined with a space
+    parts = [units[0][1]]
+    for starts_turn, unit in units[1:]:
+        parts.append("\n" if starts_turn else " ")
+        parts.append(unit)
+    return "".join(parts)
+
+
+def split_transcript(text: str, max_tokens: int, overlap_tokens: int = 0) -> list[str]:
+    """Greedy chunks of whole units, each starting with the tail of the one before."""
+    chunks: list[str] = []
+    current: list[tuple[bool, str]] = []
+    size = 0
+    for starts_turn, unit in _units(text, max_tokens):
+        cost = estimate_tokens(unit) + 1
+        if current and size + cost > max_tokens:
+            chunks.append(_join(current))
+            # Carry whole trailing units, up to the overlap budget
+            carried: list[tuple[bool, str]] = []
+            carried_size = 0
+            for prev in reversed(current):
+                prev_cost = estimate_tokens(prev[1]) + 1
+                if carried_size + prev_cost > overlap_tokens or carried_size + prev_cost + cost > max_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_size += prev_cost
+            current, size = carried, carried_size
+        current.append((starts_turn, unit))
+        size += cost
+    if current:
+        chunks.append(_join(current))
+    return chunks
+
+
+def _chunks(transcript: str) -> list[str]:
+    return split_transcript(
+        transcript, settings.LONG_TRANSCRIPT_CHUNK_TOKENS, settings.LONG_TRANSCRIPT_OVERLAP_TOKENS
+    )
+
+
+def opening(transcript: str) -> str:
+    """The first chunk of a long transcript (the whole of a short one)."""
+    return _chunks(transcript)[0] if is_long(transcript) else transcript
+
+
+async def map_chunks(transcript: str, extract: Callable[[str], Awaitable[T]]) -> list[T]:
+    """Run ``extract`` over the transcript's chunks, a bounded number at a time, in chunk order."""
+    chunks = _chunks(transcript)
+    slots = asyncio.Semaphore(settings.LONG_TRANSCRIPT_CONCURRENCY)
+
+    async def run(chunk: str) -> T:
+        async with slots:
+            return await extract(chunk)
+
+    return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+
+def dedupe_key(text: str) -> str:
+    """Case, punctuation and spacing folded away: "Paracetamol 500mg." == "paracetamol 500 mg"."""
+    return _KEY_RE.sub("", text.casefold())
+
+
+def unique(items: Iterable[T], key: Callable[[T], str]) -> list[T]:
+    """First occurrence of each key, in order; blank keys are dropped."""
+    seen: set[str] = set()
+    out: list[T] = []
+    for item in items:
+        k = key(item)
+        if k and k not in seen:
+            seen.add(k)
+            out.append(item)
+    return out
@@ -0,0 +1,147 @@
+"""Choosing the model for each agent call.
+
+``MODEL_ROUTES`` gives each agent (by the name ``run_agent`` is called
+with) a list of rules. :func:`route` picks the first rule whose
+``max_input_tokens`` covers the estimated input, so short transcripts can
+go to a small model and long ones to a larger one. :func:`call_routed`
+tries the rule's model and then its fallbacks in order: a model is given
+up on when it raises, or when it has not answered within the rule's
+latency target while a fallback is left.
+
+Every attempt is counted under the agent, route and the model that served
+it, with its latency and, from ``MODEL_PRICES``, the estimated cost.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, TypeVar
+
+from pydantic_ai.exceptions import AgentRunError
+from pydantic_ai.models import Model, infer_model
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.services.long_transcript import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Failures that move a call on to the next model. Timeouts are the latency
+# target running out; UserError (a misconfigured agent) is not retried
+FALLBACK_ERRORS = (AgentRunError, TimeoutError)
+
+LLM_CALLS = Counter(
+    "helio_llm_calls_total",
+    "Model calls per agent and route, by the model tried and outcome "
+    "(ok, slow: answered after the latency target, error, timeout).",
+    ("agent", "route", "model", "outcome"),
+)
+LLM_CALL_LATENCY = Histogram(
+    "helio_llm_call_duration_seconds",
+    "Latency of each model call, by agent, route and model.",
+    ("agent", "route", "model"),
+)
+LLM_COST = Counter(
+    "helio_llm_cost_usd_total",
+    "Estimated spend on answered model calls, from MODEL_PRICES.",
+    ("agent", "route", "model"),
+)
+
+# The model the agent call in progress was routed to
+current_model: ContextVar[str | None] = ContextVar("current_model", default=None)
+
+
+@dataclass(frozen=True)
+class Route:
+    agent: str
+    name: str
+    # The rule's model, then its fallbacks
+    models: tuple[str, ...]
+    latency_target_s: float
+
+    def attempts(self) -> Iterator[tuple[str, float | None]]:
+        """Each model to try and the seconds it gets; the last gets as long as it takes."""
+        for i, model in enumerate(self.models):
+            last = i == len(self.models) - 1
+            yield model, None if last or not self.latency_target_s else self.latency_target_s
+
+
+def input_tokens(user_prompt: Any, *, message_history: Any = None, deps: Any = None, **_: Any) -> int:
+    """Estimated size of an agent call's text input; images are not counted."""
+    texts = [user_prompt] if isinstance(user_prompt, str) else [p for p in user_prompt if isinstance(p, str)]
+    if isinstance(deps, str):
+        texts.append(deps)
+    for message in message_history or []:
+        texts.extend(
+            part.content for part in message.parts if isinstance(getattr(part, "content", None), str)
+        )
+    return sum(estimate_tokens(text) for text in texts)
+
+
+def route(agent: str, size: int) -> Route:
+    """The route for a call to ``agent`` with an input of ``size`` tokens."""
+    rules = settings.MODEL_ROUTES[agent]
+    rule = next((r for r in rules if not r.max_input_tokens or size <= r.max_input_tokens), rules[-1])
+    return Route(agent, rule.name, (rule.model, *rule.fallbacks), rule.latency_target_s)
+
+
+@lru_cache(maxsize=None)
+def get_model(name: str) -> Model:
+    return infer_model(name)
+
+
+@contextmanager
+def routed_to(model: str) -> Iterator[None]:
+    token = current_model.set(model)
+    try:
+        yield
+    finally:
+        current_model.reset(token)
+
+
+def record_attempt(chosen: Route, model: str, seconds: float, error: BaseException | None = None) -> None:
+    if error is not None:
+        outcome = "timeout" if isinstance(error, TimeoutError) else "error"
+        logger.warning("%s (%s route) failed on %s: %r", chosen.agent, chosen.name, model, error)
+    elif chosen.latency_target_s and seconds > chosen.latency_target_s:
+        outcome = "slow"
+    else:
+        outcome = "ok"
+    LLM_CALLS.inc(1, chosen.agent, chosen.name, model, outcome)
+    LLM_CALL_LATENCY.observe(seconds, chosen.agent, chosen.name, model)
+
+
+def record_cost(chosen: Route, model: str, input_tokens: int, output_tokens: int) -> None:
+    prices = settings.MODEL_PRICES.get(model)
+    if prices is not None:
+        cost = (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+        LLM_COST.inc(cost, chosen.agent, chosen.name, model)
+
+
+async def call_routed(chosen: Route, call: Callable[[Model], Awaitable[T]]) -> tuple[str, T]:
+    """Run ``call`` with the route's models in turn; returns the model that answered and its result.
+
+    When every model fails, the last one's error is raised.
+    """
+    error: BaseException | None = None
+    for model, timeout in chosen.attempts():
+        start = time.perf_counter()
+        try:
+            with routed_to(model):
+                async with asyncio.timeout(timeout):
+                    result = await call(get_model(model))
+        except FALLBACK_ERRORS as exc:
+            record_attempt(chosen, model, time.perf_counter() - start, exc)
+            error = exc
+            continue
+        record_attempt(chosen, model, time.perf_counter() - start)
+        return model, result
+    raise error
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Weight of the newest sample in the per-mirror latency average
+_EWMA_ALPHA = 0.3
+
+# Never race more than this many mirrors for a single query
+_MAX_IN_FLIGHT = 2
+
+
+class OverpassUnavailableError(Exception):
+    """Raised when no Overpass mirror produced a usable response."""
+
+
+# ---------------------------------------------------------------------------
+# Per-mirror health + circuit breaker
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MirrorHealth:
+    url: str
+    latency_ewma: float = 1.0
+    consecutive_failures: int = 0
+    opened_at: float | None = None
+
+    def is_available(self, now: float, cooldown: float) -> bool:
+        """Closed breakers are available; open ones become half-open after the cooldown."""
+        return self.opened_at is None or now - self.opened_at >= cooldown
+
+    def score(self) -> float:
+        """Lower is better: recent latency, penalised by recent failures."""
+        return self.latency_ewma * (1 + self.consecutive_failures)
+
+    def record_success(self, latency: float) -> None:
+        self.latency_ewma = _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * self.latency_ewma
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self, now: float, threshold: int) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= threshold:
+            if self.opened_at is None:
+                logger.warning("Overpass mirror %s circuit opened", self.url)
+            # Re-opening a half-open breaker restarts its cooldown
+            self.opened_at = now
+
+
+# ---------------------------------------------------------------------------
+# Mirror pool with hedged requests
+# ---------------------------------------------------------------------------
+
+class OverpassMirrorPool:
+    def __init__(
+        self,
+        urls: list[str],
+        *,
+        hedge_delay: float,
+        failure_threshold: int,
+        cooldown: float,
+    ) -> None:
+        if not urls:
+            raise ValueError("At least one Overpass URL is required")
+        self.mirrors = [MirrorHealth(url=u) for u in urls]
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def ranked(self) -> list[MirrorHealth]:
+        """Available mirrors, healthiest first."""
+        now = time.monotonic()
+        available = [m for m in self.mirrors if m.is_available(now, self.cooldown)]
+        return sorted(available, key=MirrorHealth.score)
+
+    async def _attempt(self, mirror: MirrorHealth, fetch: Callable[[str], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await fetch(mirror.url)
+        except asyncio.CancelledError:
+            # Losing a race is not a failure of the mirror
+            raise
+        except Exception:
+            mirror.record_failure(time.monotonic(), self.failure_threshold)
+            raise
+        mirror.record_success(time.monotonic() - start)
+        return result
+
+    async def run(self, fetch: Callable[[str], Awaitable[T]]) -> T:
+        """Run ``fetch(url)`` against the best mirror, hedging to the next one.
+
+        A second mirror is raced once the first has been in flight for
+        ``hedge_delay`` seconds, or immediately when an attempt fails. The
+        first successful result wins and the remaining attempts are cancelled.
+        """
+        candidates = self.ranked()
+        if not candidates:
+            raise OverpassUnavailableError("All Overpass mirrors are circuit-open")
+
+        pending: set[asyncio.Task[T]] = set()
+        errors: list[BaseException] = []
+        next_idx = 0
+
+        def launch() -> None:
+            nonlocal next_idx
+            mirror = candidates[next_idx]
+            next_idx += 1
+            pending.add(asyncio.create_task(self._attempt(mirror, fetch)))
+
+        launch()
+        try:
+            while pending:
+                can_hedge = next_idx < len(candidates) and len(pending) < _MAX_IN_FLIGHT
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    exc = task.exception()
+                    if exc is None:
+                        return task.result()
+                    errors.append(exc)
+                    if next_idx < len(candidates):
+                        launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise OverpassUnavailableError(
+            f"All {len(errors)} Overpass attempts failed: {errors[-1]!r}"
+        ) from errors[-1]
+
+
+_pool: OverpassMirrorPool | None = None
+
+
+def get_mirror_pool() -> OverpassMirrorPool:
+    global _pool
+    if _pool is None:
+        _pool = OverpassMirrorPool(
+            settings.OVERPASS_URLS,
+            hedge_delay=settings.OVERPASS_HEDGE_DELAY_SECONDS,
+            failure_threshold=settings.OVERPASS_FAILURE_THRESHOLD,
+            cooldown=settings.OVERPASS_COOLDOWN_SECONDS,
+        )
+    return _pool
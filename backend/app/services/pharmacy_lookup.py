@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import heapq
+import json
+import logging
 import math
+import re
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable
 from typing import Literal
 
 import httpx
+import ijson
 
+from app.core.metrics import stage
 from app.schemas.pharmacy import NearbyLocationResponse
+from app.services.overpass_mirrors import OverpassUnavailableError, get_mirror_pool
+
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Constants
@@ -14,7 +25,6 @@ from app.schemas.pharmacy import NearbyLocationResponse
 ALLOWED_TYPES: set[str] = {"pharmacy", "hospital", "clinic"}
 
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 
 # Overpass amenity tags for each allowed type
 _AMENITY_MAP: dict[str, list[str]] = {
@@ -27,6 +37,17 @@ _USER_AGENT = "HelioMed/1.0 (health-app; contact@heliomedapp.com)"
 
 DEFAULT_RADIUS_M = 5000  # 5 km
 
+# Last good Overpass result per (rounded) search, served when every mirror fails
+_RESULT_CACHE_SIZE = 256
+_result_cache: OrderedDict[tuple, list[NearbyLocationResponse]] = OrderedDict()
+
+_REMARK_TAIL_BYTES = 4096
+_REMARK_RE = re.compile(rb'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Postal codes don't move; remember resolved coordinates of the recent ones
+_GEOCODE_CACHE_SIZE = 256
+_geocode_cache: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
 
 # ---------------------------------------------------------------------------
 # Haversine
@@ -58,22 +79,32 @@ async def geocode_indian_zipcode(
 
     Raises ValueError if the zipcode can't be resolved.
     """
-    resp = await client.get(
-        NOMINATIM_URL,
-        params={
-            "postalcode": zipcode,
-            "country": "India",
-            "format": "json",
-            "limit": 1,
-        },
-        headers={"User-Agent": _USER_AGENT},
-        timeout=15.0,
-    )
+    cached = _geocode_cache.get(zipcode)
+    if cached is not None:
+        _geocode_cache.move_to_end(zipcode)
+        return cached
+
+    with stage("nominatim"):
+        resp = await client.get(
+            NOMINATIM_URL,
+            params={
+                "postalcode": zipcode,
+                "country": "India",
+                "format": "json",
+                "limit": 1,
+            },
+            headers={"User-Agent": _USER_AGENT},
+            timeout=15.0,
+        )
     resp.raise_for_status()
     data = resp.json()
     if not data:
         raise ValueError(f"Could not geocode Indian zipcode: {zipcode}")
-    return float(data[0]["lat"]), float(data[0]["lon"])
+    coords = float(data[0]["lat"]), float(data[0]["lon"])
+    _geocode_cache[zipcode] = coords
+    while len(_geocode_cache) > _GEOCODE_CACHE_SIZE:
+        _geocode_cache.popitem(last=False)
+    return coords
 
 
 # ---------------------------------------------------------------------------
@@ -106,83 +137,152 @@ def _build_overpass_query(
 
 
 # ---------------------------------------------------------------------------
-# Overpass fetch + parse
+# Overpass streaming parse
 # ---------------------------------------------------------------------------
 
-async def _query_overpass(
-    lat: float,
-    lon: float,
-    radius: int,
-    location_types: list[str],
-    client: httpx.AsyncClient,
-) -> list[NearbyLocationResponse]:
-    """Query Overpass API and return parsed results sorted by distance."""
-    query = _build_overpass_query(lat, lon, radius, location_types)
+class _NearestCollector:
+    """Keeps only the ``limit`` nearest named elements seen so far (all with ``None``).
 
-    resp = await client.post(
-        OVERPASS_URL,
-        data={"data": query},
-        headers={"User-Agent": _USER_AGENT},
-        timeout=20.0,
-    )
-    resp.raise_for_status()
-    elements = resp.json().get("elements", [])
+    Uses a max-heap on distance, so with a limit memory is O(limit) however
+    many elements Overpass returns; without one, every named element is
+    kept, as all of them are returned. Response objects are built only for
+    survivors. An element Overpass sends twice is dropped while its first
+    copy is in the heap; once evicted, a copy is too far to get back in.
+    """
 
-    results: list[NearbyLocationResponse] = []
-    seen_ids: set[int] = set()
+    def __init__(self, lat: float, lon: float, limit: int | None) -> None:
+        self.lat = lat
+        self.lon = lon
+        self.limit = limit
+        self._heap: list[tuple[float, int, dict]] = []
+        # Ids of the elements in the heap
+        self._kept: set[int] = set()
+        self._seq = 0
 
-    for el in elements:
+    def add(self, el: dict) -> None:
         eid = el.get("id")
-        if eid in seen_ids:
-            continue
-        seen_ids.add(eid)
+        if eid in self._kept:
+            return
 
         tags = el.get("tags", {})
-        name = tags.get("name", tags.get("name:en", ""))
-        if not name:
-            continue  # skip unnamed POIs
+        if not tags.get("name", tags.get("name:en", "")):
+            return  # skip unnamed POIs
 
         # For ways, use the 'center' key
         el_lat = el.get("lat") or (el.get("center", {}).get("lat"))
         el_lon = el.get("lon") or (el.get("center", {}).get("lon"))
         if el_lat is None or el_lon is None:
-            continue
-
-        amenity = tags.get("amenity", "")
-        loc_type = _resolve_type(amenity)
-
-        distance_km = _haversine_km(lat, lon, float(el_lat), float(el_lon))
-
-        address_parts = [
-            tags.get("addr:street", ""),
-            tags.get("addr:city", ""),
-            tags.get("addr:district", ""),
-            tags.get("addr:state", ""),
-            tags.get("addr:postcode", ""),
-        ]
-        address = ", ".join(p for p in address_parts if p) or tags.get("address", "Address not available")
-
-        phone = tags.get("phone", tags.get("contact:phone", ""))
-        website = tags.get("website", tags.get("contact:website", ""))
-        opening_hours = tags.get("opening_hours", "Not available")
-
-        results.append(
-            NearbyLocationResponse(
-                id=str(eid),
-                name=name,
-                type=loc_type,
-                address=address,
-                lat=float(el_lat),
-                lon=float(el_lon),
-                distance=round(distance_km, 2),
-                phone=phone or None,
-                website=website or None,
-                hours=opening_hours,
-            )
-        )
+            return
+
+        distance_km = _haversine_km(self.lat, self.lon, float(el_lat), float(el_lon))
+        self._seq += 1
+        entry = (-distance_km, self._seq, el)
+        if self.limit is None or len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+        elif distance_km < -self._heap[0][0]:
+            _, _, evicted = heapq.heapreplace(self._heap, entry)
+            self._kept.discard(evicted.get("id"))
+        else:
+            return
+        self._kept.add(eid)
+
+    def results(self) -> list[NearbyLocationResponse]:
+        ordered = sorted(self._heap, key=lambda e: (-e[0], e[1]))
+        return [_to_location(el, -neg_dist) for neg_dist, _, el in ordered]
+
+
+def _to_location(el: dict, distance_km: float) -> NearbyLocationResponse:
+    tags = el.get("tags", {})
+    el_lat = el.get("lat") or el["center"]["lat"]
+    el_lon = el.get("lon") or el["center"]["lon"]
+
+    address_parts = [
+        tags.get("addr:street", ""),
+        tags.get("addr:city", ""),
+        tags.get("addr:district", ""),
+        tags.get("addr:state", ""),
+        tags.get("addr:postcode", ""),
+    ]
+    address = ", ".join(p for p in address_parts if p) or tags.get("address", "Address not available")
+
+    phone = tags.get("phone", tags.get("contact:phone", ""))
+    website = tags.get("website", tags.get("contact:website", ""))
+
+    return NearbyLocationResponse(
+        id=str(el.get("id")),
+        name=tags.get("name", tags.get("name:en", "")),
+        type=_resolve_type(tags.get("amenity", "")),
+        address=address,
+        lat=float(el_lat),
+        lon=float(el_lon),
+        distance=round(distance_km, 2),
+        phone=phone or None,
+        website=website or None,
+        hours=tags.get("opening_hours", "Not available"),
+    )
+
+
+async def _stream_elements(
+    chunks: AsyncIterator[bytes],
+    on_element: Callable[[dict], None],
+) -> str:
+    """Incrementally parse an Overpass JSON body.
 
-    results.sort(key=lambda r: r.distance)
-    return results
+    Each entry of ``elements`` is handed to ``on_element`` as soon as it is
+    complete and then dropped, so the full payload is never held in memory.
+    Returns the top-level ``remark`` (empty if absent).
+    """
+    elements = ijson.sendable_list()
+    parser = ijson.items_coro(elements, "elements.item", use_float=True)
+    # Overpass writes "remark" after "elements"; keep just the tail to find it
+    tail = b""
+
+    async for chunk in chunks:
+        parser.send(chunk)
+        for el in elements:
+            on_element(el)
+        del elements[:]
+        tail = (tail + chunk)[-_REMARK_TAIL_BYTES:]
+    parser.close()
+    for el in elements:
+        on_element(el)
+
+    match = _REMARK_RE.search(tail)
+    return json.loads(b'"' + match.group(1) + b'"') if match else ""
+
+
+async def _query_overpass(
+    lat: float,
+    lon: float,
+    radius: int,
+    location_types: list[str],
+    client: httpx.AsyncClient,
+    limit: int | None = None,
+) -> list[NearbyLocationResponse]:
+    """Query Overpass API and return the ``limit`` nearest results (all with ``None``) sorted by distance.
+
+    Raises OverpassUnavailableError if no mirror answered successfully.
+    """
+    query = _build_overpass_query(lat, lon, radius, location_types)
+
+    async def fetch(url: str) -> list[NearbyLocationResponse]:
+        collector = _NearestCollector(lat, lon, limit)
+        async with client.stream(
+            "POST",
+            url,
+            data={"data": query},
+            headers={"User-Agent": _USER_AGENT},
+            timeout=20.0,
+        ) as resp:
+            resp.raise_for_status()
+            remark = await _stream_elements(resp.aiter_bytes(), collector.add)
+        # Overpass reports server-side timeouts as a 200 with a remark
+        if "runtime error" in remark:
+            raise RuntimeError(f"Overpass error: {remark}")
+        return collector.results()
+
+    with stage("overpass"):
+        return await get_mirror_pool().run(fetch)
 
 
 def _resolve_type(amenity: str) -> Literal["pharmacy", "hospital", "clinic"]:
@@ -193,6 +293,24 @@ def _resolve_type(amenity: str) -> Literal["pharmacy", "hospital", "clinic"]:
     return "clinic"  # clinic, doctors → clinic
 
 
+# ---------------------------------------------------------------------------
+# Last-known-good cache
+# ---------------------------------------------------------------------------
+
+def _cache_key(
+    lat: float, lon: float, radius: int, location_types: list[str], limit: int | None
+) -> tuple:
+    # ~100 m grid so nearby repeats of the same search share an entry
+    return (round(lat, 3), round(lon, 3), radius, tuple(sorted(location_types)), limit)
+
+
+def _remember_results(key: tuple, results: list[NearbyLocationResponse]) -> None:
+    _result_cache[key] = results
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > _RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
@@ -204,11 +322,14 @@ async def find_nearby_locations(
     lon: float | None = None,
     radius: int = DEFAULT_RADIUS_M,
     location_types: list[str] | None = None,
+    limit: int | None = None,
 ) -> dict:
     """Find nearby pharmacies, hospitals, and clinics.
 
     Accepts either an Indian zipcode (geocoded to lat/lon) or direct lat/lon.
-    Returns a dict with 'center' (lat/lon used) and 'results' list.
+    Returns a dict with 'center' (lat/lon used) and 'results' list. When every
+    Overpass mirror fails, the last result for the same search is returned
+    with 'stale' set.
     """
     types = [t for t in (location_types or list(ALLOWED_TYPES)) if t in ALLOWED_TYPES]
     if not types:
@@ -221,7 +342,19 @@ async def find_nearby_locations(
         elif lat is None or lon is None:
             raise ValueError("Either zipcode or lat/lon must be provided")
 
-        results = await _query_overpass(lat, lon, radius, types, client)
+        key = _cache_key(lat, lon, radius, types, limit)
+        stale = False
+        try:
+            results = await _query_overpass(lat, lon, radius, types, client, limit)
+        except OverpassUnavailableError:
+            cached = _result_cache.get(key)
+            if cached is None:
+                raise
+            logger.warning("Overpass unavailable, serving cached results for %s", key)
+            results = cached
+            stale = True
+        else:
+            _remember_results(key, results)
 
     return {
         "center_lat": lat,
@@ -229,4 +362,5 @@ async def find_nearby_locations(
         "radius_m": radius,
         "count": len(results),
         "results": results,
+        "stale": stale,
     }
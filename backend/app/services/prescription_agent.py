@@ -3,6 +3,9 @@ from functools import lru_cache
 from pydantic import BaseModel
 from pydantic_ai import Agent
 
+from app.services.agent_runner import run_agent
+from app.services.long_transcript import dedupe_key, is_long, map_chunks, unique
+
 
 class MedicineDetail(BaseModel):
     name: str
@@ -23,7 +26,6 @@ class PrescriptionAgentResult(BaseModel):
 @lru_cache(maxsize=1)
 def _get_agent() -> Agent:
     return Agent(
-        "openai:gpt-4o",
         output_type=PrescriptionAgentResult,
         system_prompt=(
             "You are a medical transcription extraction tool. Your ONLY function is to extract "
@@ -54,6 +56,50 @@ def _get_agent() -> Agent:
     )
 
 
+def _specific(values: list[str]) -> str:
+    """The first stated value, preferring anything over the prompt's 'As directed' placeholder."""
+    stated = [v for v in values if v.strip()]
+    for v in stated:
+        if dedupe_key(v) != "asdirected":
+            return v
+    return stated[0] if stated else ""
+
+
+def merge_prescription_results(parts: list[PrescriptionAgentResult]) -> PrescriptionAgentResult:
+    """Combine chunk extractions in transcript order, one entry per distinct item.
+
+    Medicines are matched by name; each detail takes the first specific
+    value any chunk gave for it.
+    """
+    medicines: dict[str, list[MedicineDetail]] = {}
+    for part in parts:
+        for m in part.medicines:
+            medicines.setdefault(dedupe_key(m.name), []).append(m)
+    medicines.pop("", None)
+
+    def merged(field: str) -> list[str]:
+        return unique((v for part in parts for v in getattr(part, field)), dedupe_key)
+
+    return PrescriptionAgentResult(
+        symptoms=merged("symptoms"),
+        diagnosis=merged("diagnosis"),
+        allergies=merged("allergies"),
+        notes=merged("notes"),
+        medicines=[
+            MedicineDetail(
+                name=same[0].name,
+                dosage=_specific([m.dosage for m in same]),
+                frequency=_specific([m.frequency for m in same]),
+                duration=_specific([m.duration for m in same]),
+            )
+            for same in medicines.values()
+        ],
+        instructions=merged("instructions"),
+    )
+
+
 async def extract_prescription(transcript: str) -> PrescriptionAgentResult:
-    result = await _get_agent().run(transcript)
-    return result.output
+    if is_long(transcript):
+        parts = await map_chunks(transcript, lambda chunk: run_agent("prescription", _get_agent(), chunk))
+        return merge_prescription_results(parts)
+    return await run_agent("prescription", _get_agent(), transcript)
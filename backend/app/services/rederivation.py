@@ -0,0 +1,142 @@
+"""Re-deriving extracted fields after a transcript is edited.
+
+With ``TRANSCRIPT_REDERIVE`` on, ``PATCH /consultations/{id}`` schedules a
+run for the consultation once its edits pause for
+``TRANSCRIPT_REDERIVE_DEBOUNCE_S``: each edit in the meantime restarts the
+wait, so a doctor correcting a transcript line by line costs one run. An
+edit made while a run is going schedules another after it.
+
+A run is :func:`app.services.regeneration.regenerate_fields` over
+``TRANSCRIPT_REDERIVE_FIELDS``: fields whose normalized transcript hash is
+unchanged (a cosmetic edit) call no model, and the results are written in
+one statement that only applies to the transcript the agents read.
+
+Scheduling is per process. Runs started on two workers for the same
+consultation are harmless: the later one finds the hashes up to date.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections.abc import Awaitable, Callable, Hashable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.models.consultation import Consultation
+from app.services.regeneration import (
+    ConsultationChangedError,
+    FieldsPendingError,
+    NoTranscriptError,
+    regenerate_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+REDERIVATIONS = Counter(
+    "helio_transcript_rederivations_total",
+    "Transcript edits and the runs they led to, by outcome "
+    "(scheduled, coalesced, regenerated, unchanged, superseded, failed).",
+    ("outcome",),
+)
+
+
+class Debouncer:
+    """Runs the latest action given for a key once ``delay`` seconds pass without another.
+
+    A key touched while its action runs is run again afterwards.
+    """
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self._actions: dict[Hashable, Callable[[], Awaitable[None]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: dict[Hashable, asyncio.Task] = {}
+
+    def touch(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> bool:
+        """Schedule ``action`` for ``key``; False when it joined one already waiting."""
+        coalesced = key in self._actions
+        self._actions[key] = action
+        if key in self._running:
+            # Picked up when the current run ends
+            return not coalesced
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(self.delay, self._fire, key)
+        return not coalesced
+
+    def _fire(self, key: Hashable) -> None:
+        del self._timers[key]
+        action = self._actions.pop(key)
+        self._running[key] = asyncio.create_task(self._run(key, action))
+
+    async def _run(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await action()
+        except Exception:
+            logger.exception("Debounced action for %s failed", key)
+        finally:
+            del self._running[key]
+            again = self._actions.pop(key, None)
+            if again is not None:
+                self.touch(key, again)
+
+    async def drain(self, timeout: float) -> None:
+        """Run what is waiting now, and wait up to ``timeout`` for all runs to finish."""
+        for key in list(self._timers):
+            self._timers[key].cancel()
+            self._fire(key)
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=timeout)
+
+
+_debouncer: Debouncer | None = None
+
+
+def _get_debouncer() -> Debouncer:
+    global _debouncer
+    if _debouncer is None:
+        _debouncer = Debouncer(settings.TRANSCRIPT_REDERIVE_DEBOUNCE_S)
+    return _debouncer
+
+
+def schedule_rederivation(
+    consultation_id: uuid.UUID, session_factory: async_sessionmaker[AsyncSession]
+) -> None:
+    """Re-derive the consultation's fields once edits to it pause."""
+    scheduled = _get_debouncer().touch(consultation_id, lambda: rederive(consultation_id, session_factory))
+    REDERIVATIONS.inc(1, "scheduled" if scheduled else "coalesced")
+
+
+async def rederive(consultation_id: uuid.UUID, session_factory: async_sessionmaker[AsyncSession]) -> None:
+    async with session_factory() as db:
+        consultation = (
+            await db.execute(select(Consultation).where(Consultation.id == consultation_id))
+        ).scalar_one_or_none()
+        if consultation is None:
+            return
+        try:
+            outcome = await regenerate_fields(db, consultation, list(settings.TRANSCRIPT_REDERIVE_FIELDS))
+        except NoTranscriptError:
+            return
+        except FieldsPendingError:
+            # /transcribe is still writing fields from the old transcript: look again later
+            schedule_rederivation(consultation_id, session_factory)
+            return
+        except ConsultationChangedError:
+            # Edited again while the agents ran; that edit scheduled its own run
+            REDERIVATIONS.inc(1, "superseded")
+            return
+        except Exception:
+            REDERIVATIONS.inc(1, "failed")
+            raise
+    REDERIVATIONS.inc(1, "regenerated" if outcome.regenerated else "unchanged")
+
+
+async def drain_rederivations(timeout: float) -> None:
+    if _debouncer is not None:
+        await _debouncer.drain(timeout)
@@ -0,0 +1,160 @@
+"""Regenerating chosen fields of one consultation from its transcript.
+
+Every extracted field records the hash of the transcript it came from in
+``Consultation.input_hashes``. :func:`regenerate_fields` runs, all at once,
+only the agents behind requested fields whose recorded hash no longer
+matches the transcript, and writes their results with one statement. That
+statement applies only if the transcript is still the one the agents
+read; when the prescription is regenerated it updates the latest
+prescription (or adds one) in the same statement.
+"""
+from __future__ import annotations
+
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import Counter
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.services.extraction import (
+    AGENT_CALLS,
+    EXTRACTED_FIELDS,
+    PRESCRIPTION_FIELDS,
+    input_hash,
+    regenerated_fields,
+    still_pending,
+)
+
+# Field -> the agent that produces it
+FIELD_AGENTS = {
+    "title": "title",
+    "summary": "summary",
+    "key_points": "prescription",
+    "prescription": "prescription",
+}
+
+REGENERATED_FIELDS = Counter(
+    "helio_regenerated_fields_total",
+    "Fields asked for on /consultations/{id}/regenerate, by outcome (regenerated, unchanged).",
+    ("field", "outcome"),
+)
+
+
+class NoTranscriptError(ValueError):
+    """The consultation has no transcript to regenerate from."""
+
+
+class FieldsPendingError(RuntimeError):
+    """Requested fields are still being extracted by ``/transcribe``."""
+
+
+class ConsultationChangedError(RuntimeError):
+    """The transcript or latest prescription changed while the agents ran."""
+
+
+@dataclass
+class Regeneration:
+    regenerated: list[str]
+    unchanged: list[str]
+
+
+async def regenerate_fields(
+    db: AsyncSession, consultation: Consultation, fields: list[str], *, force: bool = False
+) -> Regeneration:
+    """Bring ``fields`` up to date with the transcript, committing the result.
+
+    ``force`` regenerates fields whose input is unchanged too, e.g. after
+    an agent's prompt or model changed.
+    """
+    consultation_id, transcript = consultation.id, consultation.transcript
+    if not transcript:
+        raise NoTranscriptError(str(consultation_id))
+    pending = set(fields) & set(still_pending(consultation))
+    if pending:
+        raise FieldsPendingError(", ".join(sorted(pending)))
+
+    current = input_hash(transcript)
+    stale = [f for f in EXTRACTED_FIELDS if f in fields and (force or consultation.input_hashes.get(f) != current)]
+    unchanged = [f for f in EXTRACTED_FIELDS if f in fields and f not in stale]
+    for name in unchanged:
+        REGENERATED_FIELDS.inc(1, name, "unchanged")
+    if not stale:
+        return Regeneration([], unchanged)
+
+    latest_prescription = None
+    if "prescription" in stale:
+        latest_prescription = await db.scalar(
+            select(Prescription.id)
+            .where(Prescription.consultation_id == consultation_id)
+            .order_by(Prescription.created_at.desc())
+            .limit(1)
+        )
+    # Nothing is held open while the agents run (this expires ``consultation``)
+    await db.rollback()
+
+    agents = list(dict.fromkeys(FIELD_AGENTS[f] for f in stale))
+    outputs = await asyncio.gather(*(AGENT_CALLS[agent](transcript) for agent in agents))
+    values = regenerated_fields(dict(zip(agents, outputs)))
+
+    stmt = _write_statement(consultation_id, transcript, stale, values, current, latest_prescription)
+    # Nothing in this session holds the rows written here
+    stmt = stmt.execution_options(synchronize_session=False)
+    if (await db.execute(stmt)).first() is None:
+        await db.rollback()
+        raise ConsultationChangedError(str(consultation_id))
+    await db.commit()
+    for name in stale:
+        REGENERATED_FIELDS.inc(1, name, "regenerated")
+    return Regeneration(stale, unchanged)
+
+
+def _write_statement(
+    consultation_id: uuid.UUID,
+    transcript: str,
+    stale: list[str],
+    values: dict[str, Any],
+    transcript_hash: str,
+    latest_prescription: uuid.UUID | None,
+):
+    updated = (
+        update(Consultation)
+        .where(Consultation.id == consultation_id, Consultation.transcript == transcript)
+        .values(
+            **{f: values[f] for f in stale if f != "prescription"},
+            input_hashes=Consultation.input_hashes.op("||", return_type=JSONB)(
+                literal(dict.fromkeys(stale, transcript_hash), JSONB)
+            ),
+        )
+        .returning(Consultation.id)
+    )
+    if "prescription" not in stale:
+        return updated
+
+    # Chained on the consultation update, so neither applies without the other
+    updated = updated.cte("updated")
+    prescription = values["prescription"]
+    if latest_prescription is not None:
+        return (
+            update(Prescription)
+            .where(Prescription.id == latest_prescription, Prescription.consultation_id.in_(select(updated.c.id)))
+            .values(**prescription)
+            .returning(Prescription.id)
+        )
+    return (
+        insert(Prescription)
+        .from_select(
+            ["id", "consultation_id", *PRESCRIPTION_FIELDS],
+            select(
+                literal(uuid.uuid4()),
+                updated.c.id,
+                *(literal(prescription[name], Prescription.__table__.c[name].type) for name in PRESCRIPTION_FIELDS),
+            ),
+        )
+        .returning(Prescription.id)
+    )
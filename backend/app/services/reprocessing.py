@@ -0,0 +1,442 @@
+"""Re-running extraction agents over stored consultations.
+
+After a change to the prescription, summary or title agent, historical
+consultations are regenerated with :func:`reprocess` (the command line is
+``python -m app.reprocess``). Consultations are walked in primary-key
+order a page at a time and each transcript goes through the selected
+agents, with a cap on agent calls in flight and optionally on agent calls
+per second. Only rows whose output changed are written, in one
+transaction per page that also advances the run's checkpoint in
+``reprocess_runs``, so a run that dies resumes after the last page it
+wrote without redoing or skipping one. Consultations whose agents failed
+are listed on the run, and ``retry_failed`` takes just those again.
+
+A dry run writes nothing; each field that would change is reported with
+its stored and regenerated values instead.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import deque
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import String, func, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.metrics import Counter
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.models.reprocess_run import ReprocessRun
+from app.services.extraction import (
+    AGENT_CALLS,
+    AGENT_FIELDS,
+    PRESCRIPTION_FIELDS,
+    input_hash,
+    nothing_pending,
+    regenerated_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+REPROCESSED = Counter(
+    "helio_reprocessed_consultations_total",
+    "Consultations run through bulk reprocessing, by outcome (unchanged, changed, failed, stale).",
+    ("outcome",),
+)
+
+# Fetched ahead so agent calls keep flowing while a page finishes and is written
+PAGES_IN_FLIGHT = 2
+CONSULTATION_FIELDS = ("title", "summary", "key_points")
+
+
+class RunMismatchError(ValueError):
+    """A run of that name exists for different agents."""
+
+
+class RunConflictError(RuntimeError):
+    """Another process advanced the run's checkpoint: the same run is going twice."""
+
+
+@dataclass
+class Change:
+    consultation_id: uuid.UUID
+    field: str
+    before: Any
+    after: Any
+
+
+@dataclass
+class RunReport:
+    processed: int = 0
+    changed: int = 0
+    failed: int = 0
+    stale: int = 0
+    cursor: uuid.UUID | None = None
+    finished: bool = False
+
+
+@dataclass
+class _Row:
+    id: uuid.UUID
+    transcript: str
+    stored: dict[str, Any]
+    input_hashes: dict[str, str]
+    prescription_id: uuid.UUID | None = None
+
+
+class RateLimiter:
+    """Spaces calls to ``acquire`` at least ``1 / per_second`` apart."""
+
+    def __init__(self, per_second: float) -> None:
+        self.interval = 1 / per_second
+        self._next = 0.0
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+async def _fetch_page(
+    session_factory: async_sessionmaker[AsyncSession],
+    after: uuid.UUID | None,
+    created_before: datetime,
+    size: int,
+    doctor_id: uuid.UUID | None,
+    only: list[uuid.UUID] | None = None,
+) -> list[_Row]:
+    stmt = (
+        select(
+            Consultation.id, Consultation.transcript, Consultation.title,
+            Consultation.summary, Consultation.key_points, Consultation.input_hashes,
+        )
+        .where(
+            Consultation.created_at <= created_before,
+            Consultation.transcript != "",
+            # Not still being extracted by /transcribe, with the current agents
+            nothing_pending(),
+        )
+        .order_by(Consultation.id)
+        .limit(size)
+    )
+    if after is not None:
+        stmt = stmt.where(Consultation.id > after)
+    if doctor_id is not None:
+        stmt = stmt.where(Consultation.doctor_id == doctor_id)
+    if only is not None:
+        stmt = stmt.where(Consultation.id.in_(only))
+
+    async with session_factory() as db:
+        rows = [
+            _Row(
+                r.id, r.transcript, {"title": r.title, "summary": r.summary, "key_points": r.key_points},
+                r.input_hashes,
+            )
+            for r in await db.execute(stmt)
+        ]
+        if not rows:
+            return rows
+        # The latest prescription of each consultation is the one regenerated
+        latest = await db.execute(
+            select(Prescription.consultation_id, Prescription.id, *(
+                getattr(Prescription, name) for name in PRESCRIPTION_FIELDS
+            ))
+            .where(Prescription.consultation_id.in_([r.id for r in rows]))
+            .distinct(Prescription.consultation_id)
+            .order_by(Prescription.consultation_id, Prescription.created_at.desc())
+        )
+        prescriptions = {p.consultation_id: p for p in latest}
+    for row in rows:
+        p = prescriptions.get(row.id)
+        row.stored["prescription"] = None
+        if p is not None:
+            row.prescription_id = p.id
+            row.stored["prescription"] = {name: getattr(p, name) for name in PRESCRIPTION_FIELDS}
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Regenerating
+# ---------------------------------------------------------------------------
+
+async def _regenerate(
+    row: _Row, agents: list[str], slots: asyncio.Semaphore, limiter: RateLimiter | None
+) -> dict[str, Any] | None:
+    async def call(agent: str) -> Any:
+        async with slots:
+            if limiter is not None:
+                await limiter.acquire()
+            return await AGENT_CALLS[agent](row.transcript)
+
+    try:
+        outputs = await asyncio.gather(*(call(agent) for agent in agents))
+    except Exception:
+        logger.exception("Reprocessing consultation %s failed", row.id)
+        return None
+    return regenerated_fields(dict(zip(agents, outputs)))
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+async def _write_changes(db: AsyncSession, changed: list[tuple[_Row, dict[str, Any]]]) -> set[uuid.UUID]:
+    """Write regenerated fields in bulk; returns the consultations left alone as stale."""
+    if not changed:
+        return set()
+    # Lock the rows, then skip any whose transcript was edited while the agents ran
+    current = dict(
+        (await db.execute(
+            select(Consultation.id, Consultation.transcript)
+            .where(Consultation.id.in_([row.id for row, _ in changed]))
+            .with_for_update()
+        )).all()
+    )
+    fresh = [(row, values) for row, values in changed if current.get(row.id) == row.transcript]
+    stale = {row.id for row, _ in changed} - {row.id for row, _ in fresh}
+
+    consultation_rows = [
+        {
+            "id": row.id,
+            **{name: values[name] for name in CONSULTATION_FIELDS if name in values},
+            "input_hashes": {**row.input_hashes, **dict.fromkeys(values, input_hash(row.transcript))},
+        }
+        for row, values in fresh
+    ]
+    if consultation_rows:
+        await db.execute(update(Consultation), consultation_rows)
+
+    prescriptions = [(row, values["prescription"]) for row, values in fresh if "prescription" in values]
+    updates = [{"id": row.prescription_id, **p} for row, p in prescriptions if row.prescription_id is not None]
+    inserts = [
+        {"id": uuid.uuid4(), "consultation_id": row.id, **p}
+        for row, p in prescriptions
+        if row.prescription_id is None
+    ]
+    if updates:
+        await db.execute(update(Prescription), updates)
+    if inserts:
+        await db.execute(insert(Prescription), inserts)
+    return stale
+
+
+async def _open_run(
+    session_factory: async_sessionmaker[AsyncSession], name: str, agents: list[str]
+) -> tuple[RunReport, datetime, list[uuid.UUID]]:
+    async with session_factory() as db:
+        await db.execute(
+            insert(ReprocessRun)
+            .values(name=name, agents=agents, processed=0, changed=0, failed=0, stale=0)
+            .on_conflict_do_nothing(index_elements=[ReprocessRun.name])
+        )
+        run = (await db.execute(select(ReprocessRun).where(ReprocessRun.name == name))).scalar_one()
+        await db.commit()
+    if run.agents != agents:
+        raise RunMismatchError(f"Run {name!r} is for agents {', '.join(run.agents)}")
+    report = RunReport(
+        processed=run.processed,
+        changed=run.changed,
+        failed=run.failed,
+        stale=run.stale,
+        cursor=run.cursor,
+        finished=run.finished_at is not None,
+    )
+    return report, run.started_at, sorted(uuid.UUID(i) for i in run.failed_ids)
+
+
+async def _checkpoint(
+    db: AsyncSession,
+    name: str,
+    previous: RunReport,
+    report: RunReport,
+    *,
+    failed: Sequence[uuid.UUID] = (),
+    recovered: Sequence[uuid.UUID] = (),
+    finished: bool = False,
+) -> None:
+    """Store ``report``, adding ``failed`` to the run's failed ids and dropping ``recovered``."""
+    failed_ids = ReprocessRun.failed_ids
+    if failed:
+        failed_ids = failed_ids.op("||", return_type=JSONB)(literal([str(i) for i in failed], JSONB))
+    if recovered:
+        failed_ids = failed_ids.op("-", return_type=JSONB)(literal([str(i) for i in recovered], ARRAY(String)))
+    result = await db.execute(
+        update(ReprocessRun)
+        .where(
+            ReprocessRun.name == name,
+            ReprocessRun.cursor.is_not_distinct_from(previous.cursor),
+            ReprocessRun.failed == previous.failed,
+        )
+        .values(
+            cursor=report.cursor,
+            processed=report.processed,
+            changed=report.changed,
+            failed=report.failed,
+            failed_ids=failed_ids,
+            stale=report.stale,
+            finished_at=func.now() if finished else ReprocessRun.finished_at,
+        )
+    )
+    if result.rowcount != 1:
+        raise RunConflictError(f"Run {name!r} was advanced by another process")
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+async def reprocess(
+    session_factory: async_sessionmaker[AsyncSession],
+    agents: list[str],
+    *,
+    run: str | None = None,
+    batch_size: int = 100,
+    concurrency: int = 8,
+    rate: float = 0,
+    dry_run: bool = False,
+    limit: int | None = None,
+    doctor_id: uuid.UUID | None = None,
+    retry_failed: bool = False,
+    on_change: Callable[[Change], None] | None = None,
+) -> RunReport:
+    """Regenerate the fields ``agents`` produce for stored consultations.
+
+    A named ``run`` is checkpointed and resumed; it covers consultations
+    created before it first started, in every invocation. ``limit`` caps
+    the consultations taken in this invocation (a later one carries on).
+    ``on_change`` is called for each field whose value differs, in dry
+    runs and real ones.
+
+    ``retry_failed`` takes only the consultations the run failed on so far,
+    finished or not; those that now succeed leave its failed list and count.
+    """
+    unknown = set(agents) - set(AGENT_FIELDS)
+    if unknown or not agents:
+        raise ValueError(f"Unknown agents: {', '.join(sorted(unknown)) or '(none)'}")
+    if run is None and not dry_run:
+        raise ValueError("A run name is required unless it is a dry run")
+    if retry_failed and (run is None or dry_run):
+        raise ValueError("Retrying failures needs a run name and cannot be a dry run")
+    agents = [agent for agent in AGENT_FIELDS if agent in agents]
+
+    only: list[uuid.UUID] | None = None
+    if dry_run:
+        report, created_before = RunReport(), datetime.now(timezone.utc)
+    else:
+        report, created_before, failed_ids = await _open_run(session_factory, run, agents)
+        if retry_failed:
+            only = failed_ids
+            if not only:
+                return report
+        elif report.finished:
+            return report
+
+    slots = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate) if rate > 0 else None
+    in_flight: deque[tuple[list[_Row], asyncio.Future]] = deque()
+    # A retry walks the failed ids in order, leaving the run's cursor alone
+    fetch_after, remaining = None if retry_failed else report.cursor, limit
+    more, at_end = True, False
+
+    try:
+        while True:
+            while more and len(in_flight) < PAGES_IN_FLIGHT:
+                size = batch_size if remaining is None else min(batch_size, remaining)
+                if size <= 0:
+                    more = False
+                    break
+                rows = await _fetch_page(session_factory, fetch_after, created_before, size, doctor_id, only)
+                if len(rows) < size:
+                    more, at_end = False, True
+                if not rows:
+                    break
+                fetch_after = rows[-1].id
+                if remaining is not None:
+                    remaining -= len(rows)
+                in_flight.append((
+                    rows,
+                    asyncio.gather(*(_regenerate(row, agents, slots, limiter) for row in rows)),
+                ))
+            if not in_flight:
+                break
+
+            rows, pending = in_flight.popleft()
+            outputs = await pending
+            changed: list[tuple[_Row, dict[str, Any]]] = []
+            failed: list[uuid.UUID] = []
+            for row, values in zip(rows, outputs):
+                if values is None:
+                    failed.append(row.id)
+                    continue
+                diffs = [
+                    Change(row.id, name, row.stored[name], value)
+                    for name, value in values.items()
+                    if row.stored[name] != value
+                ]
+                if diffs:
+                    changed.append((row, values))
+                    if on_change is not None:
+                        for diff in diffs:
+                            on_change(diff)
+
+            previous = replace(report)
+            stale: set[uuid.UUID] = set()
+            recovered: list[uuid.UUID] = []
+            if retry_failed:
+                # Failing again, they stay listed
+                recovered = [row.id for row in rows if row.id not in failed]
+                report.failed -= len(recovered)
+                failed = []
+            else:
+                report.cursor = rows[-1].id
+                report.processed += len(rows)
+                report.failed += len(failed)
+            if not dry_run:
+                last = at_end and not in_flight and not retry_failed
+                async with session_factory() as db:
+                    stale = await _write_changes(db, changed)
+                    report.changed += len(changed) - len(stale)
+                    report.stale += len(stale)
+                    await _checkpoint(
+                        db, run, previous, report, failed=failed, recovered=recovered, finished=last
+                    )
+                    await db.commit()
+                report.finished = report.finished or last
+            else:
+                report.changed += len(changed)
+            REPROCESSED.inc(len(changed) - len(stale), "changed")
+            REPROCESSED.inc(len(stale), "stale")
+            failures = len(rows) - len(recovered) if retry_failed else len(failed)
+            REPROCESSED.inc(failures, "failed")
+            REPROCESSED.inc(len(rows) - len(changed) - failures, "unchanged")
+            logger.info(
+                "Reprocessed %d consultations (%d changed, %d failed), up to %s",
+                report.processed, report.changed, report.failed, report.cursor,
+            )
+    finally:
+        for _, pending in in_flight:
+            pending.cancel()
+        await asyncio.gather(*(pending for _, pending in in_flight), return_exceptions=True)
+
+    if not dry_run and not retry_failed and at_end and not report.finished:
+        # The last page was full, or there was nothing left to take
+        async with session_factory() as db:
+            await _checkpoint(db, run, report, report, finished=True)
+            await db.commit()
+        report.finished = True
+    if dry_run:
+        report.finished = at_end
+    return report
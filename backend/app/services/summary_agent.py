@@ -2,13 +2,15 @@ from functools import lru_cache
 
 from pydantic_ai import Agent
 
+from app.core.config import settings
 from app.schemas.consultation import SummaryData
+from app.services.agent_runner import run_agent
+from app.services.long_transcript import dedupe_key, is_long, map_chunks, unique
 
 
 @lru_cache(maxsize=1)
 def _get_agent() -> Agent:
     return Agent(
-        "openai:gpt-5-mini",
         output_type=SummaryData,
         system_prompt=(
             "You are a clinical documentation summarization tool. Your ONLY function is to "
@@ -37,6 +39,50 @@ def _get_agent() -> Agent:
     )
 
 
+@lru_cache(maxsize=1)
+def _get_reduce_agent() -> Agent:
+    return Agent(
+        output_type=SummaryData,
+        system_prompt=(
+            "You are a clinical documentation consolidation tool. You receive structured notes "
+            "extracted separately from consecutive parts of ONE long consultation transcript, "
+            "already merged and de-duplicated. Produce the single structured summary of the whole "
+            "consultation.\n\n"
+            "RULES:\n"
+            "- Use ONLY the information in the notes. NEVER add diagnoses, codes, recommendations "
+            "or clinical judgments that are not there.\n"
+            "- chiefComplaint: the primary reason for the visit, as one statement.\n"
+            "- history: one coherent paragraph; drop repetition between parts.\n"
+            "- assessment: keep every listed code; merge only entries that are the same diagnosis.\n"
+            "- plan: keep every distinct step; merge only duplicates.\n"
+            "- Do NOT include personally identifiable information. All output must be in English."
+        ),
+    )
+
+
+def merge_summaries(parts: list[SummaryData]) -> SummaryData:
+    """Combine chunk summaries in transcript order, one entry per distinct item.
+
+    The chief complaint comes from the first chunk that has one (visits
+    open with it); assessments are matched by ICD code, or by description
+    when a chunk gave no code.
+    """
+    return SummaryData(
+        chiefComplaint=next((p.chiefComplaint for p in parts if p.chiefComplaint.strip()), ""),
+        history="\n\n".join(unique((p.history for p in parts), dedupe_key)),
+        assessment=unique(
+            (a for p in parts for a in p.assessment),
+            lambda a: dedupe_key(a.code) or dedupe_key(a.description),
+        ),
+        plan=unique((step for p in parts for step in p.plan), dedupe_key),
+    )
+
+
 async def generate_summary(transcript: str) -> SummaryData:
-    result = await _get_agent().run(transcript)
-    return result.output
+    if is_long(transcript):
+        parts = await map_chunks(transcript, lambda chunk: run_agent("summary", _get_agent(), chunk))
+        merged = merge_summaries(parts)
+        if settings.LONG_TRANSCRIPT_REDUCE and len(parts) > 1:
+            return await run_agent("summary_reduce", _get_reduce_agent(), merged.model_dump_json())
+        return merged
+    return await run_agent("summary", _get_agent(), transcript)
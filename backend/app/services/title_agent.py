@@ -2,11 +2,13 @@ from functools import lru_cache
 
 from pydantic_ai import Agent
 
+from app.services.agent_runner import run_agent
+from app.services.long_transcript import opening
+
 
 @lru_cache(maxsize=1)
 def _get_agent() -> Agent:
     return Agent(
-        "openai:gpt-4o-mini",
         output_type=str,
         system_prompt=(
             "You are a medical consultation title generator. Generate a concise title of "
@@ -27,5 +29,4 @@ def _get_agent() -> Agent:
 
 
 async def generate_title(text: str) -> str:
-    result = await _get_agent().run(text)
-    return result.output
+    return await run_agent("title", _get_agent(), opening(text))
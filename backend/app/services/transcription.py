@@ -1,8 +1,12 @@
 import io
+import time
 
 from openai import AsyncOpenAI
 
 from app.core.config import settings
+from app.core.metrics import stage
+from app.services import cassettes
+from app.services.audio_preprocess import preprocess_for_transcription
 
 _client: AsyncOpenAI | None = None
 
@@ -25,10 +29,34 @@ async def transcribe_audio(audio_bytes: bytes, mime_type: str = "audio/webm") ->
     }
     ext = ext_map.get(mime_type, "webm")
 
-    client = _get_client()
-    # Use translations endpoint to always output English
-    transcript = await client.audio.translations.create(
-        model="whisper-1",
-        file=(f"audio.{ext}", io.BytesIO(audio_bytes), mime_type),
-    )
-    return transcript.text
+    fp = None
+    if cassettes.is_recording() or cassettes.is_replaying():
+        fp = cassettes.fingerprint("transcription", {"audio": audio_bytes, "mime_type": mime_type})
+
+    with stage("transcribe_audio"):
+        if cassettes.is_replaying():
+            return (await cassettes.replay("transcription", fp))["output"]
+
+        start = time.perf_counter()
+        text = None
+        if settings.AUDIO_TRIM_SILENCE:
+            trimmed = await preprocess_for_transcription(audio_bytes, mime_type)
+            if not trimmed.data:
+                # Nothing but silence; Whisper tends to invent text for it
+                text = ""
+            audio_bytes, mime_type = trimmed.data, trimmed.mime_type
+            ext = ext_map.get(mime_type, "webm")
+
+        if text is None:
+            client = _get_client()
+            # Use translations endpoint to always output English
+            transcript = await client.audio.translations.create(
+                model="whisper-1",
+                file=(f"audio.{ext}", io.BytesIO(audio_bytes), mime_type),
+            )
+            text = transcript.text
+
+    if cassettes.is_recording():
+        # Silent recordings too, so replay never has to call Whisper for them
+        cassettes.record("transcription", fp, output=text, latency=time.perf_counter() - start)
+    return text
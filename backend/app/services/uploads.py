@@ -0,0 +1,317 @@
+"""Keeping the uploads consultations were made from.
+
+An upload is staged in the blob store while the request transcribes or
+analyses it (:class:`PendingUpload`). Once the consultation is saved it is
+attached: the ``blobs`` row is upserted, which locks it, the consultation
+link is inserted, and the staged copy is published under that lock. An
+upload whose request fails is dropped, and content published by an attach
+that then fails to commit is left for garbage collection. Storing is best-effort: an upload
+that cannot be kept never fails the request.
+
+Garbage collection honours consent. Links are removed when their
+consultation is deleted, when the doctor withdraws them, and, with
+``BLOB_RETENTION_DAYS``, once that long has passed since consent was
+given. Content that no consultation links to any more is then deleted,
+unless it was linked within ``BLOB_GC_GRACE_S``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.periodic import PeriodicTask
+from app.models.blob import Blob, ConsultationBlob
+from app.models.consultation import Consultation
+from app.services.blob_store import BlobBackend, StagedBlob, get_blob_backend, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BYTES = Counter(
+    "helio_upload_bytes_total",
+    "Uploaded bytes kept in the blob store, by outcome (stored, deduplicated).",
+    ("outcome",),
+)
+BLOBS_COLLECTED = Counter(
+    "helio_blobs_collected_total",
+    "Blob store entries removed by garbage collection (what: links, blobs).",
+    ("what",),
+)
+
+GC_BATCH = 100
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+@dataclass
+class Upload:
+    consultation_id: uuid.UUID
+    staged: StagedBlob
+    kind: str
+    mime_type: str
+    filename: str | None
+
+
+class PendingUpload:
+    """An upload being staged in the background while the request does its work."""
+
+    def __init__(self, data: bytes, *, kind: str, mime_type: str, filename: str | None) -> None:
+        self.kind, self.mime_type, self.filename = kind, mime_type, filename
+        self._task = asyncio.create_task(self._stage(data)) if settings.BLOB_STORE_UPLOADS else None
+
+    @staticmethod
+    async def _stage(data: bytes) -> StagedBlob | None:
+        try:
+            return await get_blob_backend().stage(iter_chunks(data))
+        except Exception:
+            logger.exception("Could not stage upload of %d bytes", len(data))
+            return None
+
+    async def for_consultation(self, consultation_id: uuid.UUID) -> Upload | None:
+        staged = await self._task if self._task is not None else None
+        if staged is None:
+            return None
+        return Upload(consultation_id, staged, self.kind, self.mime_type, self.filename)
+
+    async def attach(self, db: AsyncSession, consultation_id: uuid.UUID) -> None:
+        """Keep the upload as part of ``consultation_id`` (committed)."""
+        upload = await self.for_consultation(consultation_id)
+        if upload is None:
+            return
+        try:
+            await keep_uploads(db, [upload])
+        except Exception:
+            logger.exception("Could not keep the upload for consultation %s", consultation_id)
+
+    async def drop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            staged = await self._task
+        except asyncio.CancelledError:
+            return
+        if staged is not None:
+            await get_blob_backend().discard(staged)
+
+
+async def keep_uploads(db: AsyncSession, uploads: list[Upload]) -> None:
+    """Record and publish staged uploads in ``db``'s transaction, and commit it.
+
+    Publishing happens under the ``blobs`` row locks taken here, so garbage
+    collection of the same content waits for this transaction. When the
+    commit fails the staged copies are dropped and content already published
+    is recorded unlinked, for garbage collection to remove; then the error
+    is raised.
+    """
+    if not uploads:
+        return
+    published: list[Upload] = []
+    try:
+        await _attach(db, uploads, published)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await discard_uploads([u for u in uploads if u not in published])
+        await _orphaned(db, published)
+        raise
+    for upload in uploads:
+        UPLOAD_BYTES.inc(upload.staged.size, "stored" if upload in published else "deduplicated")
+
+
+async def _attach(db: AsyncSession, uploads: list[Upload], published: list[Upload]) -> None:
+    backend = get_blob_backend()
+    sizes = {u.staged.sha256: u.staged.size for u in uploads}
+    # One row per digest, in a fixed order so concurrent batches lock alike
+    await db.execute(
+        insert(Blob)
+        .values([{"sha256": sha, "size": sizes[sha]} for sha in sorted(sizes)])
+        .on_conflict_do_update(index_elements=[Blob.sha256], set_={"last_linked_at": func.now()})
+    )
+    await db.execute(
+        insert(ConsultationBlob)
+        .values([
+            {
+                "id": uuid.uuid4(),
+                "consultation_id": u.consultation_id,
+                "sha256": u.staged.sha256,
+                "kind": u.kind,
+                "mime_type": u.mime_type,
+                "filename": (u.filename or "")[:255] or None,
+            }
+            for u in uploads
+        ])
+        .on_conflict_do_nothing(constraint="uq_consultation_blobs_consultation_sha256")
+    )
+    for upload in uploads:
+        if await backend.publish(upload.staged):
+            published.append(upload)
+
+
+async def _orphaned(db: AsyncSession, published: list[Upload]) -> None:
+    """Record content published by a transaction that then failed, so it is collected."""
+    if not published:
+        return
+    sizes = {u.staged.sha256: u.staged.size for u in published}
+    try:
+        await db.execute(
+            insert(Blob)
+            .values([{"sha256": sha, "size": sizes[sha]} for sha in sorted(sizes)])
+            .on_conflict_do_nothing(index_elements=[Blob.sha256])
+        )
+        await db.commit()
+    except Exception:
+        logger.exception("Could not record %d published blobs for garbage collection", len(sizes))
+        await db.rollback()
+
+
+async def discard_uploads(uploads: list[Upload]) -> None:
+    backend = get_blob_backend()
+    for upload in uploads:
+        await backend.discard(upload.staged)
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """``(start, end)`` (end exclusive) for a single-range ``Range`` header, None for the whole blob.
+
+    Raises ValueError for a range that cannot be satisfied.
+    """
+    if header is None:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple or non-byte ranges: serve the whole blob, as RFC 9110 allows
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or end <= start:
+        raise ValueError(header)
+    return start, end
+
+
+# ---------------------------------------------------------------------------
+# Garbage collection
+# ---------------------------------------------------------------------------
+
+async def withdraw_uploads(
+    session_factory: async_sessionmaker[AsyncSession], consultation_id: uuid.UUID
+) -> int:
+    """Unlink a consultation's uploads and delete content nothing else uses; returns links removed."""
+    async with session_factory() as db:
+        result = await db.execute(
+            delete(ConsultationBlob)
+            .where(ConsultationBlob.consultation_id == consultation_id)
+            .returning(ConsultationBlob.sha256)
+        )
+        digests = sorted(set(result.scalars()))
+        await db.commit()
+    BLOBS_COLLECTED.inc(len(digests), "links")
+    if digests:
+        await _collect_unlinked(session_factory, get_blob_backend(), grace=timedelta(0), only=digests)
+    return len(digests)
+
+
+async def collect_garbage(
+    session_factory: async_sessionmaker[AsyncSession], backend: BlobBackend | None = None
+) -> dict[str, int]:
+    """Drop links past retention, then delete content no consultation links to.
+
+    Staged copies older than the grace period, left by requests that died
+    before attaching them, go too.
+    """
+    backend = backend or get_blob_backend()
+    links = 0
+    if settings.BLOB_RETENTION_DAYS > 0:
+        expired_before = func.now() - timedelta(days=settings.BLOB_RETENTION_DAYS)
+        async with session_factory() as db:
+            result = await db.execute(
+                delete(ConsultationBlob).where(
+                    ConsultationBlob.consultation_id.in_(
+                        select(Consultation.id).where(Consultation.consent_given_at < expired_before)
+                    )
+                )
+            )
+            await db.commit()
+        links = result.rowcount
+        BLOBS_COLLECTED.inc(links, "links")
+    blobs = await _collect_unlinked(session_factory, backend, grace=timedelta(seconds=settings.BLOB_GC_GRACE_S))
+    staged = await backend.purge_staged(settings.BLOB_GC_GRACE_S)
+    return {"links": links, "blobs": blobs, "staged": staged}
+
+
+async def _collect_unlinked(
+    session_factory: async_sessionmaker[AsyncSession],
+    backend: BlobBackend,
+    *,
+    grace: timedelta,
+    only: list[str] | None = None,
+) -> int:
+    unlinked = ~exists().where(ConsultationBlob.sha256 == Blob.sha256)
+    candidates = (
+        select(Blob.sha256)
+        .where(unlinked, Blob.last_linked_at < func.now() - grace)
+        .order_by(Blob.sha256)
+        .limit(GC_BATCH)
+        # Blobs being attached right now are locked: leave them for the next pass
+        .with_for_update(skip_locked=True)
+    )
+    if only is not None:
+        candidates = candidates.where(Blob.sha256.in_(only))
+    total = 0
+    while True:
+        async with session_factory() as db:
+            locked = list((await db.execute(candidates)).scalars())
+            if not locked:
+                return total
+            # Checked again under the locks, with a fresh snapshot
+            result = await db.execute(
+                delete(Blob).where(Blob.sha256.in_(locked), unlinked).returning(Blob.sha256)
+            )
+            doomed = list(result.scalars())
+            # Before commit: until then the row locks keep new uploads of this content waiting
+            for sha256 in doomed:
+                await backend.delete(sha256)
+            await db.commit()
+        total += len(doomed)
+        BLOBS_COLLECTED.inc(len(doomed), "blobs")
+        if len(locked) < GC_BATCH:
+            return total
+
+
+_gc: PeriodicTask | None = None
+
+
+async def _gc_once(session_factory: async_sessionmaker[AsyncSession]) -> None:
+    collected = await collect_garbage(session_factory)
+    if any(collected.values()):
+        logger.info("Blob store GC removed %(links)d links, %(blobs)d blobs and %(staged)d staged files", collected)
+
+
+def start_blob_gc(session_factory: async_sessionmaker[AsyncSession], interval: float) -> None:
+    global _gc
+    _gc = PeriodicTask("Blob store garbage collection", lambda: _gc_once(session_factory), interval)
+    _gc.start()
+
+
+async def stop_blob_gc() -> None:
+    global _gc
+    if _gc is not None:
+        await _gc.stop()
+        _gc = None
@@ -0,0 +1,123 @@
+"""Upload size and transcription latency with and without silence trimming.
+
+Usage (from backend/):
+
+    python -m benchmarks.audio_trim --minutes 10 --uplink-mbps 5
+
+Builds sample recordings the way a browser would send them (48 kHz
+stereo Opus in WebM): speech-like voiced bursts separated by pauses,
+over low background noise. Pause share varies per sample. Each sample
+is run through ``preprocess_for_transcription`` for real. End-to-end
+latency is modelled as
+
+    preprocessing + bytes / uplink + whisper_base + whisper_rtf * seconds
+
+because Whisper time scales with audio duration. The report gives
+upload bytes, seconds trimmed and both latencies per sample.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import time
+
+import av
+import numpy as np
+
+from app.services.audio_preprocess import preprocess_for_transcription
+
+RATE = 48_000
+
+# name -> (mean speech burst seconds, mean pause seconds)
+SAMPLES = {
+    "talkative": (6.0, 0.8),
+    "typical": (4.0, 2.5),
+    "exam_pauses": (3.0, 6.0),
+}
+
+
+def synth_recording(minutes: float, speech_s: float, pause_s: float, seed: int) -> np.ndarray:
+    """Voiced bursts (harmonics of a drifting pitch, syllable-rate envelope) between pauses."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * RATE)
+    out = rng.normal(0, 0.002, total).astype(np.float32)  # room noise, about -54 dBFS
+    pos = 0
+    while pos < total:
+        pos += int(rng.exponential(pause_s) * RATE)
+        n = min(int(rng.exponential(speech_s) * RATE) + RATE // 4, total - pos)
+        if n <= 0:
+            break
+        t = np.arange(n) / RATE
+        f0 = rng.uniform(100, 220) * (1 + 0.05 * np.sin(2 * np.pi * 0.5 * t))
+        phase = 2 * np.pi * np.cumsum(f0) / RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3, 5) * t)) ** 2
+        out[pos:pos + n] += (0.15 * voiced * envelope).astype(np.float32)
+        pos += n
+    return out
+
+
+def encode_webm(samples: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with av.open(buf, "w", format="webm") as container:
+        stream = container.add_stream("libopus", rate=RATE, layout="stereo")
+        stream.bit_rate = 64_000
+        stereo = np.repeat(samples[None, :], 2, axis=0)
+        for start in range(0, stereo.shape[1], RATE):
+            frame = av.AudioFrame.from_ndarray(
+                np.ascontiguousarray(stereo[:, start:start + RATE]), format="fltp", layout="stereo"
+            )
+            frame.sample_rate = RATE
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buf.getvalue()
+
+
+def modelled_latency(prep_s: float, n_bytes: int, seconds: float, args: argparse.Namespace) -> float:
+    upload = n_bytes * 8 / (args.uplink_mbps * 1_000_000)
+    return prep_s + upload + args.whisper_base_ms / 1000 + args.whisper_rtf * seconds
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    report = {}
+    for i, (name, (speech_s, pause_s)) in enumerate(SAMPLES.items()):
+        samples = synth_recording(args.minutes, speech_s, pause_s, seed=i)
+        recording = encode_webm(samples)
+        seconds = len(samples) / RATE
+
+        start = time.perf_counter()
+        trimmed = await preprocess_for_transcription(recording, "audio/webm", offsets=True)
+        prep = time.perf_counter() - start
+
+        raw_latency = modelled_latency(0.0, len(recording), seconds, args)
+        trimmed_latency = modelled_latency(prep, len(trimmed.data), trimmed.kept_seconds, args)
+        report[name] = {
+            "input_seconds": round(seconds, 1),
+            "kept_seconds": round(trimmed.kept_seconds, 1),
+            "trimmed_pct": round(100 * (1 - trimmed.kept_seconds / seconds), 1),
+            "kept_spans": len(trimmed.offsets or []),
+            "input_bytes": len(recording),
+            "upload_bytes": len(trimmed.data),
+            "preprocess_ms": round(prep * 1000, 1),
+            "e2e_raw_ms": round(raw_latency * 1000),
+            "e2e_trimmed_ms": round(trimmed_latency * 1000),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--uplink-mbps", type=float, default=5)
+    parser.add_argument("--whisper-base-ms", type=float, default=500)
+    parser.add_argument("--whisper-rtf", type=float, default=0.05, help="Whisper seconds per audio second")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
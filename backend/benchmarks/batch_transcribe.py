@@ -0,0 +1,141 @@
+"""Throughput of a recording backlog: one ``/transcribe`` call per file versus one batch.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.batch_transcribe --files 40 --whisper 1500 --llm 800 --fail-every 10
+
+Drives the app in-process against the fakes in ``benchmarks.fakes``. Every
+``--fail-every``-th file is rejected by the fake Whisper, to show failures
+staying confined to their own item. ``sequential`` posts files to
+``/consultations/transcribe`` one after another, the way a backlog import
+works today. ``batch`` posts them all to ``/consultations/transcribe/batch``.
+The report gives files/s, item outcomes and database commits per mode.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, event
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session, engine
+from app.main import app
+from app.models.consultation import Consultation
+from app.schemas.user import CurrentUser
+from app.services import transcription
+
+FAIL_MARKER = b"FAIL"
+
+
+def _fail_marked_files() -> None:
+    """Make the fake Whisper reject audio that starts with ``FAIL_MARKER``."""
+    translations = transcription._client.audio.translations
+    create = translations.create
+
+    async def maybe_fail(*, model: str, file, **kwargs):
+        if file[1].getvalue().startswith(FAIL_MARKER):
+            raise RuntimeError("fake Whisper rejected the file")
+        return await create(model=model, file=file, **kwargs)
+
+    translations.create = maybe_fail
+
+
+def _recordings(args: argparse.Namespace) -> list[bytes]:
+    return [
+        (FAIL_MARKER if args.fail_every and (i + 1) % args.fail_every == 0 else b"OK") + bytes(args.file_kb * 1024)
+        for i in range(args.files)
+    ]
+
+
+async def run_sequential(client: httpx.AsyncClient, recordings: list[bytes]) -> dict:
+    outcomes = {"completed": 0, "failed": 0}
+    for i, audio in enumerate(recordings):
+        try:
+            resp = await client.post(
+                "/api/v1/consultations/transcribe", files={"file": (f"visit-{i}.webm", audio, "audio/webm")}
+            )
+            outcomes["completed" if resp.status_code == 200 else "failed"] += 1
+        except RuntimeError:
+            # Without a per-item status the error surfaces as a failed request
+            outcomes["failed"] += 1
+    return outcomes
+
+
+async def run_batch(client: httpx.AsyncClient, recordings: list[bytes]) -> dict:
+    resp = await client.post(
+        "/api/v1/consultations/transcribe/batch",
+        files=[("files", (f"visit-{i}.webm", audio, "audio/webm")) for i, audio in enumerate(recordings)],
+    )
+    resp.raise_for_status()
+    body = resp.json()
+    return {
+        "completed": body["completed"],
+        "failed": body["failed"],
+        "errors": sorted({item["error"] for item in body["items"] if item["error"]}),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency.parse(args.llm), whisper=Latency.parse(args.whisper), geo=Latency(0), per_agent={},
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    _fail_marked_files()
+    # The recordings are placeholders, not decodable audio
+    settings.AUDIO_TRIM_SILENCE = False
+    user = CurrentUser(id=uuid.uuid4(), email="batch@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    commits = [0]
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _count(conn) -> None:
+        commits[0] += 1
+
+    recordings = _recordings(args)
+    report = {}
+    try:
+        # Raise app errors instead of turning them into 500s, as a client would see them
+        transport = httpx.ASGITransport(app, raise_app_exceptions=True)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for mode, run in (("sequential", run_sequential), ("batch", run_batch)):
+                before = commits[0]
+                start = time.perf_counter()
+                outcome = await run(client, recordings)
+                elapsed = time.perf_counter() - start
+                report[mode] = {
+                    "elapsed_s": round(elapsed, 2),
+                    "files_per_s": round(len(recordings) / elapsed, 2),
+                    "commits": commits[0] - before,
+                    **outcome,
+                }
+        report["speedup"] = round(report["sequential"]["elapsed_s"] / report["batch"]["elapsed_s"], 1)
+    finally:
+        stack.close()
+        app.dependency_overrides.pop(get_current_user, None)
+        async with async_session() as db:
+            await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+            await db.commit()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--file-kb", type=int, default=64)
+    parser.add_argument("--fail-every", type=int, default=10, help="0 for no failures")
+    parser.add_argument("--whisper", default="1500", help="Whisper latency, median_ms[:sigma]")
+    parser.add_argument("--llm", default="800", help="Agent latency, median_ms[:sigma]")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Throughput of the blob store on large uploads, and its lifecycle end to end.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.blob_store --sizes-mb 1,25,200 --ranges 200
+
+For each size, content is written to a fresh local store in a scratch
+directory: streamed through ``stage``/``publish`` one chunk at a time, and
+naively (joined in memory, hashed, written in one go) for comparison. The
+report gives MB/s and the peak Python memory of each, the cost of writing
+the same content again (de-duplicated, so no extra disk), full-read MB/s,
+and the latency of ``--ranges`` random 64 KiB ranged reads.
+
+Then ``/transcribe`` is driven in-process against the fakes in
+``benchmarks.fakes``: the same recording twice (one blob, two links),
+a ranged download, and garbage collection after one consultation is
+deleted and the other's uploads are withdrawn.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session
+from app.main import app
+from app.models.blob import Blob, ConsultationBlob
+from app.models.consultation import Consultation
+from app.schemas.user import CurrentUser
+from app.services.blob_store import CHUNK_SIZE, LocalBlobBackend, get_blob_backend
+from app.services.uploads import collect_garbage
+
+MB = 1024 * 1024
+RANGE_SIZE = 64 * 1024
+
+
+async def synthetic(size: int, seed: int) -> AsyncIterator[bytes]:
+    """``size`` bytes of incompressible content, generated a chunk at a time."""
+    block = random.Random(seed).randbytes(CHUNK_SIZE)
+    for i, offset in enumerate(range(0, size, CHUNK_SIZE)):
+        yield (i.to_bytes(8, "big") + block[8:])[: size - offset]
+
+
+async def streamed_write(backend: LocalBlobBackend, size: int, seed: int) -> str:
+    staged = await backend.stage(synthetic(size, seed))
+    await backend.publish(staged)
+    return staged.sha256
+
+
+async def naive_write(root: Path, size: int, seed: int) -> str:
+    data = b"".join([chunk async for chunk in synthetic(size, seed)])
+    sha256 = hashlib.sha256(data).hexdigest()
+    await asyncio.to_thread((root / sha256).write_bytes, data)
+    return sha256
+
+
+async def timed(coro_factory, *, memory: bool) -> tuple[float, int, object]:
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = await coro_factory()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def disk_bytes(root: Path) -> int:
+    return sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+
+
+async def size_case(scratch: Path, size_mb: int, ranges: int) -> dict:
+    size = size_mb * MB
+    seed = size_mb
+    backend = LocalBlobBackend(str(scratch / f"store-{size_mb}"))
+    naive_root = scratch / f"naive-{size_mb}"
+    naive_root.mkdir()
+
+    # Timing and memory in separate passes: tracemalloc slows allocation down
+    streamed_s, _, sha256 = await timed(lambda: streamed_write(backend, size, seed), memory=False)
+    await backend.delete(sha256)
+    _, streamed_peak, _ = await timed(lambda: streamed_write(backend, size, seed), memory=True)
+    naive_s, _, naive_sha = await timed(lambda: naive_write(naive_root, size, seed), memory=False)
+    _, naive_peak, _ = await timed(lambda: naive_write(naive_root, size, seed), memory=True)
+    assert naive_sha == sha256
+
+    on_disk = disk_bytes(backend.root)
+    dedupe_s, _, _ = await timed(lambda: streamed_write(backend, size, seed), memory=False)
+    assert disk_bytes(backend.root) == on_disk
+
+    async def read_all() -> int:
+        return sum([len(chunk) async for chunk in backend.read(sha256)])
+
+    read_s, _, read_bytes = await timed(read_all, memory=False)
+    assert read_bytes == size
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(ranges):
+        start = rng.randrange(0, max(1, size - RANGE_SIZE))
+        t = time.perf_counter()
+        got = sum([len(chunk) async for chunk in backend.read(sha256, start, start + RANGE_SIZE)])
+        latencies.append(time.perf_counter() - t)
+        assert got == min(RANGE_SIZE, size - start)
+
+    return {
+        "size_mb": size_mb,
+        "streamed_write_mb_s": round(size_mb / streamed_s, 1),
+        "streamed_peak_mb": round(streamed_peak / MB, 1),
+        "naive_write_mb_s": round(size_mb / naive_s, 1),
+        "naive_peak_mb": round(naive_peak / MB, 1),
+        "dedupe_write_ms": round(dedupe_s * 1000, 1),
+        "disk_mb_after_dedupe": round(on_disk / MB, 1),
+        "full_read_mb_s": round(size_mb / read_s, 1),
+        "range_read_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "range_read_p99_ms": round(sorted(latencies)[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def lifecycle(user: CurrentUser) -> dict:
+    audio = b"visit-recording" + os.urandom(3 * MB)
+    sha256 = hashlib.sha256(audio).hexdigest()
+    transport = httpx.ASGITransport(app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        ids = []
+        for _ in range(2):
+            resp = await client.post(
+                "/api/v1/consultations/transcribe",
+                files={"file": ("visit.webm", audio, "audio/webm")},
+            )
+            resp.raise_for_status()
+            ids.append(resp.json()["consultation_id"])
+
+        async def counts() -> tuple[int, int]:
+            async with async_session() as db:
+                blobs = await db.scalar(select(func.count()).select_from(Blob).where(Blob.sha256 == sha256))
+                links = await db.scalar(
+                    select(func.count()).select_from(ConsultationBlob).where(ConsultationBlob.sha256 == sha256)
+                )
+            return blobs, links
+
+        after_uploads = await counts()
+        listed = (await client.get(f"/api/v1/consultations/{ids[0]}/uploads")).json()
+        ranged = await client.get(
+            f"/api/v1/consultations/{ids[0]}/uploads/{sha256}", headers={"Range": "bytes=1000-1999"}
+        )
+        assert ranged.status_code == 206 and ranged.content == audio[1000:2000]
+        unsatisfiable = await client.get(
+            f"/api/v1/consultations/{ids[0]}/uploads/{sha256}", headers={"Range": f"bytes={len(audio)}-"}
+        )
+
+        # Still linked to the second consultation: nothing to collect
+        (await client.delete(f"/api/v1/consultations/{ids[0]}")).raise_for_status()
+        after_delete = await collect_garbage(async_session)
+        stored_after_delete = await get_blob_backend().size(sha256)
+        (await client.delete(f"/api/v1/consultations/{ids[1]}/uploads")).raise_for_status()
+        after_withdraw = await counts()
+        stored_after_withdraw = await get_blob_backend().size(sha256)
+
+    async with async_session() as db:
+        await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+        await db.commit()
+    return {
+        "blobs_and_links_after_two_uploads": after_uploads,
+        "listed": [{k: u[k] for k in ("kind", "size")} for u in listed],
+        "range_status": ranged.status_code,
+        "unsatisfiable_range": [unsatisfiable.status_code, unsatisfiable.headers.get("content-range")],
+        "gc_after_deleting_one": after_delete,
+        "stored_after_deleting_one": stored_after_delete,
+        "blobs_and_links_after_withdraw": after_withdraw,
+        "stored_after_withdraw": stored_after_withdraw,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix="blob-bench-") as scratch:
+        sizes = [await size_case(Path(scratch), int(s), args.ranges) for s in args.sizes_mb.split(",")]
+
+        config = FakeConfig(llm=Latency(50), whisper=Latency(50), geo=Latency(0), per_agent={})
+        stack = install_fakes(config, "http://127.0.0.1:9")
+        # The recordings are placeholders, not decodable audio
+        settings.AUDIO_TRIM_SILENCE = False
+        settings.BLOB_STORE_DIR = str(Path(scratch) / "app-store")
+        settings.BLOB_GC_GRACE_S = 0
+        get_blob_backend.cache_clear()
+        user = CurrentUser(id=uuid.uuid4(), email="blobs@example.com")
+        app.dependency_overrides[get_current_user] = lambda: user
+        try:
+            return {"sizes": sizes, "lifecycle": await lifecycle(user)}
+        finally:
+            stack.close()
+            app.dependency_overrides.pop(get_current_user, None)
+            get_blob_backend.cache_clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", default="1,25,200", help="Comma-separated upload sizes in MiB")
+    parser.add_argument("--ranges", type=int, default=200, help="Random ranged reads per size")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Database rows read per chat turn, with and without the history cache.
+
+Usage (from backend/, against a disposable, migrated database):
+
+    python -m benchmarks.chat_history_cache --history 500 --turns 20
+
+Seeds one session with ``--history`` messages, then runs ``--turns`` turns
+the way ``POST /chat/`` does (load history, store the user and assistant
+messages, record the turn) for each ``CHAT_HISTORY_CACHE`` backend. Without
+the cache rows read per turn grow with the session; with it they stay at one.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.chat_message import ChatMessage
+from app.services import chat_history
+
+
+async def run_backend(backend: str, factory: async_sessionmaker[AsyncSession], args: argparse.Namespace) -> dict:
+    settings.CHAT_HISTORY_CACHE = backend
+    chat_history._get_backend.cache_clear()
+
+    patient = uuid.uuid4()
+    session_id = f"bench-{uuid.uuid4()}"
+    async with factory() as db:
+        await db.execute(insert(ChatMessage), [
+            {"patient_id": patient, "session_id": session_id,
+             "role": "user" if i % 2 == 0 else "assistant", "content": "x" * 200}
+            for i in range(args.history)
+        ])
+        await db.commit()
+
+    rows_per_turn: list[float] = []
+    start = time.perf_counter()
+    try:
+        for _ in range(args.turns):
+            before = chat_history.HISTORY_ROWS_READ._values.get((), 0)
+            async with factory() as db:
+                history = await chat_history.load_history(db, patient, session_id)
+                rows = []
+                for role in ("user", "assistant"):
+                    msg = ChatMessage(patient_id=patient, session_id=session_id, role=role, content="y" * 200)
+                    db.add(msg)
+                    await db.commit()
+                    rows.append(chat_history.StoredMessage(msg.id, msg.seq, role, msg.content))
+                await chat_history.append_history(db, patient, session_id, history, rows)
+            rows_per_turn.append(chat_history.HISTORY_ROWS_READ._values.get((), 0) - before)
+        elapsed = time.perf_counter() - start
+    finally:
+        async with factory() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.patient_id == patient))
+            await db.commit()
+
+    return {
+        "first_turn_rows": rows_per_turn[0],
+        "later_turns_rows_mean": round(sum(rows_per_turn[1:]) / max(1, len(rows_per_turn) - 1), 1),
+        "ms_per_turn": round(elapsed / args.turns * 1000, 2),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    engine = create_async_engine(args.database_url)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    settings.CHAT_HISTORY_CACHE_DIR = tempfile.mkdtemp(prefix="chat-history-")
+    try:
+        return {backend: await run_backend(backend, factory, args) for backend in ("off", "memory", "file")}
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--history", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
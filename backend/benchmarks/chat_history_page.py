@@ -0,0 +1,106 @@
+"""Latency of GET /chat/history reads on one long session.
+
+Usage (from backend/, against a disposable, migrated database):
+
+    python -m benchmarks.chat_history_page --messages 5000 --limit 50
+
+Seeds a session with ``--messages`` messages and times, per call:
+
+* ``orm_full``: the previous implementation, ORM entities for the whole
+  session converted to ``ChatHistoryMessage``;
+* ``core_full``: ``load_page`` without a limit (what an old client gets);
+* ``core_latest``: the newest ``--limit`` messages (opening the chat);
+* ``core_before``: a page of older messages from the middle of the session.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.schemas.chat import ChatHistoryMessage
+from app.services.chat_history import load_page
+
+
+async def _orm_full(db: AsyncSession, patient: uuid.UUID, session_id: str) -> list[ChatHistoryMessage]:
+    result = await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.patient_id == patient, ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.asc())
+    )
+    return [ChatHistoryMessage(role=m.role, content=m.content) for m in result.scalars().all()]
+
+
+async def _core(db: AsyncSession, patient: uuid.UUID, session_id: str, **page) -> list[ChatHistoryMessage]:
+    rows = await load_page(db, patient, session_id, **page)
+    return [ChatHistoryMessage(seq=r.seq, role=r.role, content=r.content) for r in rows]
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    engine = create_async_engine(args.database_url)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    patient = uuid.uuid4()
+    session_id = f"bench-{uuid.uuid4()}"
+    async with factory() as db:
+        await db.execute(insert(ChatMessage), [
+            {"patient_id": patient, "session_id": session_id,
+             "role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 300}
+            for i in range(args.messages)
+        ])
+        await db.commit()
+        seqs = (await db.execute(
+            select(ChatMessage.seq).where(ChatMessage.session_id == session_id).order_by(ChatMessage.seq)
+        )).scalars().all()
+        await db.execute(select(ChatMessage.id).limit(1))  # warm the pool
+
+    middle = seqs[len(seqs) // 2]
+    cases = {
+        "orm_full": lambda db: _orm_full(db, patient, session_id),
+        "core_full": lambda db: _core(db, patient, session_id),
+        "core_latest": lambda db: _core(db, patient, session_id, limit=args.limit),
+        "core_before": lambda db: _core(db, patient, session_id, before=middle, limit=args.limit),
+    }
+    report = {"messages": args.messages, "limit": args.limit}
+    try:
+        for name, call in cases.items():
+            timings = []
+            for _ in range(args.repeat):
+                async with factory() as db:
+                    start = time.perf_counter()
+                    rows = await call(db)
+                    timings.append(time.perf_counter() - start)
+            report[name] = {
+                "rows": len(rows),
+                "median_ms": round(statistics.median(timings) * 1000, 2),
+                "p95_ms": round(sorted(timings)[int(0.95 * (len(timings) - 1))] * 1000, 2),
+            }
+    finally:
+        async with factory() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.patient_id == patient))
+            await db.execute(delete(ChatSession).where(ChatSession.owner_id == patient))
+            await db.commit()
+        await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
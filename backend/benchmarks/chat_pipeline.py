@@ -0,0 +1,156 @@
+"""Latency of ``POST /chat/`` with its steps run in order versus overlapped.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database; the handler opens its extra read sessions from it):
+
+    python -m benchmarks.chat_pipeline --requests 50 --llm 800 --title 400
+
+Calls the ``chat`` handler directly, with fake models from
+``benchmarks.fakes``, for three kinds of turn: a plain chat, a chat about an
+existing consultation, and a chat that creates a consultation (and so also
+generates a title). ``sequential`` replays the handler as it was before
+its steps were overlapped: title first, then consultation, history, user
+message and model call one after another. Reports p50/p95 latency per
+mode and kind of turn.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.v1 import chat as chat_api
+from app.database.session import async_session
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.schemas.chat import ChatRequest, ChatResponse
+from app.schemas.user import CurrentUser
+from app.services.chat_agent import get_chat_response
+from app.services.chat_history import append_history, load_history
+from app.services.chat_sessions import link_session
+from app.services.title_agent import generate_title
+
+KINDS = ("plain", "consultation", "create")
+
+
+async def sequential_chat(body: ChatRequest, current_user: CurrentUser, db) -> ChatResponse:
+    """The chat handler with every step awaited in turn."""
+    session_id = body.session_id or str(uuid.uuid4())
+    user_id = current_user.id
+    new_consultation_id = new_title = None
+    if body.create_consultation and not body.consultation_id:
+        new_title = await generate_title(body.message)
+        consultation = chat_api._new_chat_consultation(db, user_id, new_title)
+        await db.flush()
+        new_consultation_id = body.consultation_id = consultation.id
+        await link_session(db, user_id, session_id, title=new_title, consultation_id=new_consultation_id)
+    context = None
+    if body.consultation_id:
+        context = await chat_api._consultation_context(db, body.consultation_id, user_id)
+    history = await load_history(db, user_id, session_id)
+    user_row = await chat_api._save_message(
+        db, patient_id=user_id, session_id=session_id, role="user",
+        content=body.message, consultation_id=body.consultation_id,
+    )
+    response_text = await get_chat_response(body.message, history.messages, context)
+    assistant_row = await chat_api._save_message(
+        db, patient_id=user_id, session_id=session_id, role="assistant",
+        content=response_text, consultation_id=body.consultation_id,
+    )
+    await append_history(db, user_id, session_id, history, [user_row, assistant_row])
+    return ChatResponse(response=response_text, sessionId=session_id,
+                        consultation_id=new_consultation_id, title=new_title)
+
+
+async def _seed(user: CurrentUser) -> uuid.UUID:
+    async with async_session() as db:
+        consultation = Consultation(
+            doctor_id=user.id, patient_id=user.id, title="Benchmark", status="completed",
+            transcript="Doctor: What brings you in? Patient: A dry cough. " * 40,
+            consent_given_at=datetime.now(timezone.utc),
+        )
+        consultation.prescriptions = [Prescription(
+            diagnosis="Acute bronchitis",
+            medicines=[{"name": "Paracetamol", "dosage": "500 mg", "frequency": "As needed", "duration": "3 days"}],
+            instructions=["Drink plenty of fluids"],
+        )]
+        db.add(consultation)
+        await db.commit()
+        return consultation.id
+
+
+def _percentile_ms(values: list[float], q: int) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, len(values) * q // 100)] * 1000, 1)
+
+
+async def run_mode(handler, user: CurrentUser, consultation_id: uuid.UUID, args: argparse.Namespace) -> dict:
+    report = {}
+    for kind in KINDS:
+        timings: list[float] = []
+        session_id = f"bench-{uuid.uuid4()}"
+
+        async def turn(i: int) -> None:
+            body = ChatRequest(
+                message=f"How long does a dry cough last? ({i})",
+                session_id=session_id if kind != "create" else None,
+                consultation_id=consultation_id if kind == "consultation" else None,
+                create_consultation=kind == "create",
+            )
+            async with async_session() as db:
+                start = time.perf_counter()
+                await handler(body, user, db)
+                timings.append(time.perf_counter() - start)
+
+        # One turn at a time: the point is the latency of a single request
+        for i in range(args.requests):
+            await turn(i)
+        report[kind] = {"p50_ms": _percentile_ms(timings, 50), "p95_ms": _percentile_ms(timings, 95)}
+    return report
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency.parse(args.llm), whisper=Latency(0), geo=Latency(0),
+        per_agent={"title": Latency.parse(args.title)},
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    user = CurrentUser(id=uuid.uuid4(), email="bench@example.com")
+    consultation_id = await _seed(user)
+    report = {}
+    try:
+        for mode, handler in (("sequential", sequential_chat), ("concurrent", chat_api.chat)):
+            report[mode] = await run_mode(handler, user, consultation_id, args)
+        report["p50_saved_ms"] = {
+            kind: round(report["sequential"][kind]["p50_ms"] - report["concurrent"][kind]["p50_ms"], 1)
+            for kind in KINDS
+        }
+    finally:
+        stack.close()
+        async with async_session() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.patient_id == user.id))
+            await db.execute(delete(ChatSession).where(ChatSession.owner_id == user.id))
+            await db.execute(delete(Consultation).where(Consultation.patient_id == user.id))
+            await db.commit()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=30, help="Turns per mode and kind")
+    parser.add_argument("--llm", default="800", help="Chat model latency, median_ms[:sigma]")
+    parser.add_argument("--title", default="400", help="Title model latency, median_ms[:sigma]")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Compare per-message commits with the write-behind chat message writer.
+
+Usage (from backend/, against a disposable, migrated database):
+
+    python -m benchmarks.chat_write_behind --users 200 --turns 20 --llm-ms 50
+
+Each virtual user runs chat turns the way ``POST /chat/`` stores them (user
+message, simulated model call, assistant message), once committing every
+message and once through ``ChatMessageWriter``. Reports chat turns/s next
+to database commits/s for both modes.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import delete, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.services.chat_sessions import record_messages
+from app.services.chat_writer import ChatMessageWriter
+
+
+async def _direct_turn(factory: async_sessionmaker[AsyncSession], patient: uuid.UUID, session_id: str,
+                       llm: float) -> None:
+    for role in ("user", "assistant"):
+        if role == "assistant":
+            await asyncio.sleep(llm)
+        async with factory() as db:
+            msg = ChatMessage(patient_id=patient, session_id=session_id, role=role, content="x" * 200)
+            db.add(msg)
+            await db.flush()
+            await record_messages(db, [{
+                "patient_id": patient, "session_id": session_id, "role": role,
+                "content": msg.content, "created_at": msg.created_at,
+            }])
+            await db.commit()
+
+
+async def _write_behind_turn(writer: ChatMessageWriter, patient: uuid.UUID, session_id: str,
+                             llm: float) -> None:
+    for role in ("user", "assistant"):
+        if role == "assistant":
+            await asyncio.sleep(llm)
+        writer.enqueue(patient_id=patient, session_id=session_id, role=role, content="x" * 200)
+
+
+async def run_mode(mode: str, factory: async_sessionmaker[AsyncSession], commits: list[int],
+                   args: argparse.Namespace, run_patient: uuid.UUID) -> dict:
+    writer = None
+    if mode == "write_behind":
+        writer = ChatMessageWriter(factory, flush_interval=args.flush_ms / 1000, max_batch=args.max_batch)
+        writer.start()
+
+    async def user() -> None:
+        session_id = f"bench-{uuid.uuid4()}"
+        for _ in range(args.turns):
+            if writer is None:
+                await _direct_turn(factory, run_patient, session_id, args.llm_ms / 1000)
+            else:
+                await _write_behind_turn(writer, run_patient, session_id, args.llm_ms / 1000)
+
+    before = commits[0]
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(args.users)))
+    if writer is not None:
+        await writer.stop()
+    elapsed = time.perf_counter() - start
+    n_commits = commits[0] - before
+    turns = args.users * args.turns
+    return {
+        "turns": turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(turns / elapsed, 1),
+        "commits": n_commits,
+        "commits_per_s": round(n_commits / elapsed, 1),
+        "commits_per_turn": round(n_commits / turns, 3),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    engine = create_async_engine(args.database_url, pool_size=args.pool_size, max_overflow=0)
+    commits = [0]
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _count(conn) -> None:
+        commits[0] += 1
+
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    run_patient = uuid.uuid4()
+    report = {}
+    try:
+        for mode in ("direct", "write_behind"):
+            report[mode] = await run_mode(mode, factory, commits, args, run_patient)
+    finally:
+        async with factory() as db:
+            await db.execute(delete(ChatMessage).where(ChatMessage.patient_id == run_patient))
+            await db.execute(delete(ChatSession).where(ChatSession.owner_id == run_patient))
+            await db.commit()
+        await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--llm-ms", type=float, default=50)
+    parser.add_argument("--flush-ms", type=int, default=settings.CHAT_WRITE_BEHIND_FLUSH_MS)
+    parser.add_argument("--max-batch", type=int, default=settings.CHAT_WRITE_BEHIND_MAX_BATCH)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
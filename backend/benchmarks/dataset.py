@@ -0,0 +1,237 @@
+"""Bulk-load a realistic, skewed synthetic dataset with COPY.
+
+Usage (from backend/, against a disposable, migrated database):
+
+    python -m benchmarks.dataset --scale 1.0 [--truncate]
+
+At ``--scale 1`` this writes ~200k consultations and prescriptions and ~2M
+chat messages. Doctors' consultation counts and sessions' message counts
+follow a Pareto distribution, so a few doctors own thousands of
+consultations and a few sessions run to hundreds of messages. Rows are
+streamed through asyncpg's binary COPY in batches, never through the ORM.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.security import hash_password
+
+BATCH_SIZE = 10_000
+NOW = datetime.now(timezone.utc)
+
+# Hashed once; bcrypt per user would dominate load time
+PASSWORD_HASH = hash_password("password")
+
+SENTENCES = [
+    "Patient reports a dry cough for the past week.",
+    "No history of hypertension or diabetes.",
+    "Mild fever in the evenings, relieved by paracetamol.",
+    "Lungs are clear on auscultation bilaterally.",
+    "Advised to increase fluid intake and rest.",
+    "Blood pressure is 128 over 84 today.",
+    "Patient is allergic to penicillin.",
+    "Continue current dose of metformin and review in three months.",
+    "Complains of intermittent headaches, worse in the morning.",
+    "Follow up if symptoms persist beyond five days.",
+]
+MEDICINES = [
+    ("Paracetamol", "500 mg"), ("Amoxicillin", "250 mg"), ("Metformin", "500 mg"),
+    ("Amlodipine", "5 mg"), ("Cetirizine", "10 mg"), ("Omeprazole", "20 mg"),
+    ("Dextromethorphan", "10 ml"), ("Atorvastatin", "10 mg"),
+]
+ICD_CODES = [("J20.9", "Acute bronchitis"), ("I10", "Essential hypertension"),
+             ("E11.9", "Type 2 diabetes mellitus"), ("R51", "Headache")]
+
+
+def _asyncpg_dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def _pareto_weights(rng: random.Random, n: int, alpha: float) -> list[float]:
+    return [rng.paretovariate(alpha) for _ in range(n)]
+
+
+def _text(rng: random.Random, mean_sentences: int) -> str:
+    n = max(1, int(rng.lognormvariate(0, 0.8) * mean_sentences))
+    return " ".join(rng.choices(SENTENCES, k=n))
+
+
+def _batches(rows: Iterator[tuple], size: int = BATCH_SIZE) -> Iterator[list[tuple]]:
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+# ---------------------------------------------------------------------------
+# Row generators
+# ---------------------------------------------------------------------------
+
+def user_rows(ids: list[uuid.UUID], prefix: str) -> Iterator[tuple]:
+    for i, uid in enumerate(ids):
+        yield (uid, f"{prefix}{i}@synthetic.example", PASSWORD_HASH, f"{prefix.title()} {i}", NOW)
+
+
+def consultation_rows(
+    rng: random.Random, n: int, doctors: list[uuid.UUID], patients: list[uuid.UUID],
+    consultation_ids: list[uuid.UUID],
+) -> Iterator[tuple]:
+    doctor_weights = list(itertools.accumulate(_pareto_weights(rng, len(doctors), 1.2)))
+    for i in range(n):
+        created = NOW - timedelta(minutes=rng.randrange(0, 3 * 365 * 24 * 60))
+        code, desc = rng.choice(ICD_CODES)
+        summary = {
+            "chiefComplaint": rng.choice(SENTENCES),
+            "history": _text(rng, 3),
+            "assessment": [{"code": code, "description": desc}],
+            "plan": rng.sample(SENTENCES, 2),
+        }
+        key_points = {"symptoms": rng.sample(SENTENCES, 2), "diagnosis": [desc],
+                      "allergies": [], "notes": []}
+        yield (
+            consultation_ids[i],
+            rng.choices(doctors, cum_weights=doctor_weights)[0],
+            rng.choice(patients),
+            f"Consultation: {desc}",
+            _text(rng, 40),  # a few KB on average, long tail to tens of KB
+            rng.choice(["completed", "completed", "completed", "chat", "draft"]),
+            json.dumps(summary),
+            json.dumps(key_points),
+            created,
+            created,
+            None,
+            created,
+        )
+
+
+def prescription_rows(rng: random.Random, consultation_ids: list[uuid.UUID]) -> Iterator[tuple]:
+    for cid in consultation_ids:
+        for _ in range(1 if rng.random() < 0.9 else 2):
+            medicines = [
+                {"name": name, "dosage": dose, "frequency": "Twice daily", "duration": "5 days"}
+                for name, dose in rng.sample(MEDICINES, rng.randint(1, 5))
+            ]
+            yield (
+                uuid.uuid4(), cid, rng.choice(ICD_CODES)[1],
+                json.dumps(medicines), json.dumps(rng.sample(SENTENCES, 2)), NOW, NOW,
+            )
+
+
+def chat_rows(
+    rng: random.Random, sessions: int, mean_messages: int, patients: list[uuid.UUID],
+    consultation_ids: list[uuid.UUID],
+) -> Iterator[tuple]:
+    for _ in range(sessions):
+        patient = rng.choice(patients)
+        session_id = str(uuid.uuid4())
+        consultation = rng.choice(consultation_ids) if rng.random() < 0.3 else None
+        n = min(2000, max(2, int(rng.paretovariate(1.5) * mean_messages / 3)))
+        ts = NOW - timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+        for j in range(n):
+            ts += timedelta(seconds=rng.randint(5, 120))
+            yield (
+                uuid.uuid4(), patient, session_id, "user" if j % 2 == 0 else "assistant",
+                _text(rng, 2 if j % 2 == 0 else 6), consultation, ts,
+            )
+
+
+def tally_sessions(rows: Iterator[tuple], sessions: dict[tuple, list]) -> Iterator[tuple]:
+    """Pass chat rows through while aggregating their chat_sessions rows."""
+    for row in rows:
+        _, patient, session_id, role, content, consultation, ts = row
+        session = sessions.get((patient, session_id))
+        if session is None:
+            session = sessions[(patient, session_id)] = [
+                uuid.uuid4(), patient, session_id, None, None, 0, None, None, ts,
+            ]
+        if session[3] is None and role == "user":
+            session[3] = content[:80]
+        session[4] = consultation or session[4]
+        session[5] += 1
+        session[6] = ts
+        session[7] = content[:200]
+        yield row
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+async def copy_rows(conn: asyncpg.Connection, table: str, columns: list[str], rows: Iterator[tuple]) -> int:
+    total = 0
+    start = time.perf_counter()
+    for batch in _batches(rows):
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+        total += len(batch)
+    print(f"{table}: {total} rows in {time.perf_counter() - start:.1f}s")
+    return total
+
+
+async def load(scale: float, seed: int, truncate: bool) -> None:
+    rng = random.Random(seed)
+    n_doctors = max(2, int(500 * scale))
+    n_patients = max(2, int(20_000 * scale))
+    n_consultations = max(1, int(200_000 * scale))
+    n_sessions = max(1, int(20_000 * scale))
+
+    doctors = [uuid.uuid4() for _ in range(n_doctors)]
+    patients = [uuid.uuid4() for _ in range(n_patients)]
+    consultation_ids = [uuid.uuid4() for _ in range(n_consultations)]
+    sessions: dict[tuple, list] = {}
+
+    conn = await asyncpg.connect(_asyncpg_dsn(settings.DATABASE_URL))
+    try:
+        if truncate:
+            await conn.execute(
+                "TRUNCATE chat_sessions, chat_messages, prescriptions, consultations, user_profiles, users CASCADE"
+            )
+        user_cols = ["id", "email", "password_hash", "name", "created_at"]
+        await copy_rows(conn, "users", user_cols, user_rows(doctors, "doctor"))
+        await copy_rows(conn, "users", user_cols, user_rows(patients, "patient"))
+        await copy_rows(
+            conn, "consultations",
+            ["id", "doctor_id", "patient_id", "title", "transcript", "status", "summary",
+             "key_points", "consent_given_at", "created_at", "notes", "updated_at"],
+            consultation_rows(rng, n_consultations, doctors, patients, consultation_ids),
+        )
+        await copy_rows(
+            conn, "prescriptions",
+            ["id", "consultation_id", "diagnosis", "medicines", "instructions", "created_at", "updated_at"],
+            prescription_rows(rng, consultation_ids),
+        )
+        await copy_rows(
+            conn, "chat_messages",
+            ["id", "patient_id", "session_id", "role", "content", "consultation_id", "created_at"],
+            tally_sessions(chat_rows(rng, n_sessions, 100, patients, consultation_ids), sessions),
+        )
+        await copy_rows(
+            conn, "chat_sessions",
+            ["id", "owner_id", "session_id", "title", "consultation_id", "message_count",
+             "last_message_at", "preview", "created_at"],
+            (tuple(s) for s in sessions.values()),
+        )
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--truncate", action="store_true", help="Empty the tables first")
+    args = parser.parse_args()
+    asyncio.run(load(args.scale, args.seed, args.truncate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Local stand-ins for OpenAI (agents + Whisper) and the OSM geo services.
+
+``install_fakes()`` swaps every agent in ``app/services`` for a pydantic-ai
+``FunctionModel`` that sleeps for a sampled latency and returns a canned,
+schema-valid output, replaces the Whisper client, and points Nominatim and
+Overpass at a local stub server (see ``geo_stub_app``).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+# Routed models build OpenAI providers and need some key
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import Response  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+from pydantic_ai.exceptions import ModelHTTPError  # noqa: E402
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, ToolCallPart  # noqa: E402
+from collections.abc import AsyncIterator  # noqa: E402
+
+from pydantic_ai.models.function import AgentInfo, FunctionModel  # noqa: E402
+
+from app.schemas.consultation import AssessmentItem, SummaryData  # noqa: E402
+from app.services import (  # noqa: E402
+    chat_agent,
+    image_analysis_agent,
+    model_routing,
+    overpass_mirrors,
+    pharmacy_lookup,
+    prescription_agent,
+    summary_agent,
+    title_agent,
+    transcription,
+)
+from app.services.prescription_agent import MedicineDetail, PrescriptionAgentResult  # noqa: E402
+
+
+# ---------------------------------------------------------------------------
+# Latency distributions
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Latency:
+    """Log-normal latency with the given median (ms) and shape ``sigma``."""
+
+    median_ms: float
+    sigma: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """Parse ``"800"`` or ``"800:0.4"``."""
+        median, _, sigma = spec.partition(":")
+        return cls(float(median), float(sigma or 0.0))
+
+    def sample(self) -> float:
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return random.lognormvariate(0, self.sigma) * self.median_ms / 1000
+
+
+@dataclass
+class FakeConfig:
+    llm: Latency
+    whisper: Latency
+    geo: Latency
+    per_agent: dict[str, Latency]
+    # Extra Whisper seconds per MB of audio, so longer recordings take longer
+    whisper_per_mb: float = 0.0
+    # Extra agent seconds per 1k prompt tokens, so longer inputs take longer
+    llm_per_1k_tokens: float = 0.0
+    # By the model a call was routed to, ahead of per_agent; and the share
+    # of calls to a model that fail with a 503
+    per_model: dict[str, Latency] = field(default_factory=dict)
+    model_errors: dict[str, float] = field(default_factory=dict)
+
+    def agent_latency(self, name: str) -> Latency:
+        return self.per_agent.get(name, self.llm)
+
+
+# ---------------------------------------------------------------------------
+# Canned outputs
+# ---------------------------------------------------------------------------
+
+SAMPLE_PRESCRIPTION = PrescriptionAgentResult(
+    symptoms=["persistent dry cough", "mild fever"],
+    diagnosis=["Acute bronchitis"],
+    allergies=["penicillin"],
+    notes=["Lungs clear on auscultation"],
+    medicines=[
+        MedicineDetail(name="Dextromethorphan", dosage="10 ml", frequency="Every 8 hours", duration="5 days"),
+        MedicineDetail(name="Paracetamol", dosage="500 mg", frequency="As needed", duration="3 days"),
+    ],
+    instructions=["Drink plenty of fluids", "Return if fever persists beyond 3 days"],
+)
+
+SAMPLE_SUMMARY = SummaryData(
+    chiefComplaint="Dry cough for one week with low-grade fever",
+    history="No chronic conditions. Non-smoker.",
+    assessment=[AssessmentItem(code="J20.9", description="Acute bronchitis, unspecified")],
+    plan=["Symptomatic treatment", "Follow up in one week if not improving"],
+)
+
+SAMPLE_TITLE = "Initial Visit: Acute Bronchitis With Dry Cough"
+
+SAMPLE_CHAT_REPLY = (
+    "Bronchitis is inflammation of the airways that usually clears up on its own. "
+    "This is for informational purposes only and does not constitute medical advice. "
+    "Consult a healthcare professional for personal medical decisions."
+)
+
+SAMPLE_TRANSCRIPT = (
+    "Doctor: What brings you in today? Patient: I've had a dry cough for about a week "
+    "and a slight fever. Doctor: Any allergies? Patient: Penicillin. Doctor: Your lungs "
+    "sound clear. This looks like acute bronchitis. Take dextromethorphan 10 ml every "
+    "8 hours for 5 days and paracetamol as needed."
+)
+
+
+def _prompt_tokens(messages: list[ModelMessage]) -> int:
+    """Rough prompt size, at the 4 characters per token the app itself assumes."""
+    chars = sum(
+        len(part.content)
+        for message in messages
+        for part in getattr(message, "parts", [])
+        if isinstance(getattr(part, "content", None), str)
+    )
+    return chars // 4
+
+
+def latency_model(
+    output: BaseModel | str,
+    latency: Latency,
+    per_1k_tokens: float = 0.0,
+    per_model: dict[str, Latency] | None = None,
+    model_errors: dict[str, float] | None = None,
+) -> FunctionModel:
+    """A model that waits ``latency`` and then returns ``output``.
+
+    ``per_1k_tokens`` adds time in proportion to the prompt. ``per_model``
+    and ``model_errors`` stand in for the model the call was routed to.
+    Text outputs can also be streamed: the first word arrives after
+    ``latency`` and the rest follow word by word.
+    """
+
+    async def wait(messages: list[ModelMessage]) -> None:
+        routed = model_routing.current_model.get()
+        if random.random() < (model_errors or {}).get(routed, 0.0):
+            raise ModelHTTPError(503, routed or "fake", {"error": "overloaded"})
+        base = (per_model or {}).get(routed, latency)
+        await asyncio.sleep(base.sample() + per_1k_tokens * _prompt_tokens(messages) / 1000)
+
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await wait(messages)
+        if isinstance(output, str):
+            return ModelResponse(parts=[TextPart(content=output)])
+        tool = info.output_tools[0]
+        return ModelResponse(parts=[ToolCallPart(tool.name, output.model_dump(mode="json"))])
+
+    async def stream(messages: list[ModelMessage], info: AgentInfo) -> AsyncIterator[str]:
+        await wait(messages)
+        for i, word in enumerate(str(output).split(" ")):
+            yield word if i == 0 else " " + word
+            await asyncio.sleep(0)
+
+    if isinstance(output, str):
+        return FunctionModel(respond, stream_function=stream)
+    return FunctionModel(respond)
+
+
+# name -> (agent factory, canned output); names match agent_runner labels
+AGENTS = {
+    "chat": (chat_agent._get_agent, SAMPLE_CHAT_REPLY),
+    "prescription": (prescription_agent._get_agent, SAMPLE_PRESCRIPTION),
+    "summary": (summary_agent._get_agent, SAMPLE_SUMMARY),
+    "summary_reduce": (summary_agent._get_reduce_agent, SAMPLE_SUMMARY),
+    "title": (title_agent._get_agent, SAMPLE_TITLE),
+    "image_prescription": (image_analysis_agent._get_prescription_image_agent, SAMPLE_PRESCRIPTION),
+    "image_summary": (image_analysis_agent._get_summary_image_agent, SAMPLE_SUMMARY),
+    "image_title": (image_analysis_agent._get_title_image_agent, SAMPLE_TITLE),
+}
+
+
+# ---------------------------------------------------------------------------
+# Whisper stand-in
+# ---------------------------------------------------------------------------
+
+class _FakeTranslations:
+    def __init__(self, latency: Latency, per_mb: float = 0.0) -> None:
+        self.latency = latency
+        self.per_mb = per_mb
+
+    async def create(self, *, model: str, file, **kwargs) -> SimpleNamespace:
+        size_mb = len(file[1].getbuffer()) / 1_000_000
+        await asyncio.sleep(self.latency.sample() + self.per_mb * size_mb)
+        return SimpleNamespace(text=SAMPLE_TRANSCRIPT)
+
+
+def fake_openai_client(latency: Latency, per_mb: float = 0.0) -> SimpleNamespace:
+    translations = _FakeTranslations(latency, per_mb)
+    return SimpleNamespace(audio=SimpleNamespace(translations=translations, transcriptions=translations))
+
+
+# ---------------------------------------------------------------------------
+# Nominatim / Overpass stand-in
+# ---------------------------------------------------------------------------
+
+def overpass_payload(lat: float, lon: float, n: int = 400, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n):
+        tags = {"amenity": rng.choice(["pharmacy", "hospital", "clinic", "doctors"])}
+        if rng.random() < 0.7:
+            tags.update({"name": f"Location {i}", "addr:city": "New Delhi"})
+        elements.append({
+            "type": "node", "id": i,
+            "lat": lat + rng.uniform(-0.05, 0.05), "lon": lon + rng.uniform(-0.05, 0.05),
+            "tags": tags,
+        })
+    return {"version": 0.6, "elements": elements}
+
+
+def geo_stub_app(latency: Latency) -> FastAPI:
+    stub = FastAPI()
+    body = json.dumps(overpass_payload(28.61, 77.21)).encode()
+
+    @stub.get("/search")
+    async def nominatim_search():
+        await asyncio.sleep(latency.sample())
+        return [{"lat": "28.61", "lon": "77.21"}]
+
+    @stub.post("/api/interpreter")
+    async def overpass_interpreter(request: Request):
+        await request.body()
+        await asyncio.sleep(latency.sample())
+        return Response(content=body, media_type="application/json")
+
+    return stub
+
+
+# ---------------------------------------------------------------------------
+# Installation
+# ---------------------------------------------------------------------------
+
+def install_fakes(config: FakeConfig, geo_base_url: str) -> ExitStack:
+    """Swap every external dependency for a local fake; close the stack to undo."""
+    stack = ExitStack()
+    for name, (factory, output) in AGENTS.items():
+        model = latency_model(
+            output, config.agent_latency(name), config.llm_per_1k_tokens, config.per_model, config.model_errors
+        )
+        stack.enter_context(factory().override(model=model))
+
+    original_client = transcription._client
+    transcription._client = fake_openai_client(config.whisper, config.whisper_per_mb)
+    stack.callback(setattr, transcription, "_client", original_client)
+
+    original_nominatim = pharmacy_lookup.NOMINATIM_URL
+    pharmacy_lookup.NOMINATIM_URL = f"{geo_base_url}/search"
+    stack.callback(setattr, pharmacy_lookup, "NOMINATIM_URL", original_nominatim)
+
+    original_pool = overpass_mirrors._pool
+    overpass_mirrors._pool = overpass_mirrors.OverpassMirrorPool(
+        [f"{geo_base_url}/api/interpreter"], hedge_delay=5.0, failure_threshold=3, cooldown=5.0
+    )
+    stack.callback(setattr, overpass_mirrors, "_pool", original_pool)
+    return stack
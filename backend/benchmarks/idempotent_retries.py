@@ -0,0 +1,110 @@
+"""What client retries of ``/transcribe`` cost with and without an ``Idempotency-Key``.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.idempotent_retries --visits 5 --retry-after 2 --late-retry-after 10
+
+Drives the app in-process against the fakes in ``benchmarks.fakes``. Each
+visit is posted, then posted again ``--retry-after`` seconds later while
+the first is still running (a client that timed out), and once more after
+``--late-retry-after`` seconds (a client retrying from its outbox). The
+report gives the consultations created and the latency of each attempt,
+without and with a key.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session
+from app.main import app
+from app.models.consultation import Consultation
+from app.models.idempotency_key import IdempotencyKey
+from app.schemas.user import CurrentUser
+
+
+async def post_at(client: httpx.AsyncClient, delay: float, audio: bytes, key: str | None) -> tuple[float, bool]:
+    await asyncio.sleep(delay)
+    headers = {"Idempotency-Key": key} if key else {}
+    start = time.perf_counter()
+    resp = await client.post(
+        "/api/v1/consultations/transcribe",
+        files={"file": ("visit.webm", audio, "audio/webm")},
+        headers=headers,
+    )
+    resp.raise_for_status()
+    return time.perf_counter() - start, resp.headers.get("Idempotent-Replayed") == "true"
+
+
+async def run_mode(client: httpx.AsyncClient, args: argparse.Namespace, user: CurrentUser, with_key: bool) -> dict:
+    async def visit(i: int) -> list[tuple[float, bool]]:
+        audio = f"visit-{i}".encode() + bytes(4096)
+        key = str(uuid.uuid4()) if with_key else None
+        return await asyncio.gather(*(
+            post_at(client, delay, audio, key) for delay in (0, args.retry_after, args.late_retry_after)
+        ))
+
+    attempts = await asyncio.gather(*(visit(i) for i in range(args.visits)))
+    async with async_session() as db:
+        created = await db.scalar(select(func.count()).where(Consultation.doctor_id == user.id))
+        await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user.id))
+        await db.commit()
+
+    def p50(index: int) -> int:
+        return round(statistics.median(a[index][0] for a in attempts) * 1000)
+
+    return {
+        "consultations_created": created,
+        "original_ms": p50(0),
+        "in_flight_retry_ms": p50(1),
+        "late_retry_ms": p50(2),
+        "replayed": sum(replayed for a in attempts for _, replayed in a),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency.parse(args.llm), whisper=Latency.parse(args.whisper), geo=Latency(0), per_agent={},
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    # The recordings are placeholders, not decodable audio
+    settings.AUDIO_TRIM_SILENCE = False
+    user = CurrentUser(id=uuid.uuid4(), email="retries@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return {
+                "without_key": await run_mode(client, args, user, with_key=False),
+                "with_key": await run_mode(client, args, user, with_key=True),
+            }
+    finally:
+        stack.close()
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visits", type=int, default=5)
+    parser.add_argument("--retry-after", type=float, default=2.0)
+    parser.add_argument("--late-retry-after", type=float, default=10.0)
+    parser.add_argument("--whisper", default="1500", help="Whisper latency, median_ms[:sigma]")
+    parser.add_argument("--llm", default="3000", help="Agent latency, median_ms[:sigma]")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Wait after the end of a visit: upload-then-transcribe versus live transcription.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.live_transcription --segments 30 --segment-kb 160 --interval-ms 1000
+
+Records a simulated visit of ``--segments`` audio segments, one every
+``--interval-ms``, against the fake Whisper and agents from
+``benchmarks.fakes``. Fake Whisper latency grows with the upload size
+(``--whisper-ms-per-mb``), so one long recording costs more than one segment.
+
+* ``upload``: the whole recording is posted to ``/consultations/transcribe``
+  after the visit, as the app does today.
+* ``live``: segments stream over ``/consultations/live`` while recording,
+  then ``stop`` is sent.
+
+Reports the wait from the end of recording to the finished consultation in
+each mode, and checks that the live draft ended up completed with the full
+transcript.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from starlette.testclient import TestClient
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.main import app
+
+
+def _register(client: TestClient) -> tuple[str, str]:
+    email = f"live-{uuid.uuid4().hex[:12]}@example.com"
+    resp = client.post("/api/v1/auth/register", json={"email": email, "password": "benchmark-pass", "name": "Live"})
+    resp.raise_for_status()
+    return resp.json()["user"]["id"], resp.cookies["session_token"]
+
+
+def run_upload(client: TestClient, segments: list[bytes], cookie: str) -> dict:
+    start = time.perf_counter()
+    resp = client.post(
+        "/api/v1/consultations/transcribe",
+        files={"file": ("visit.webm", b"".join(segments), "audio/webm")},
+        headers={"cookie": f"session_token={cookie}"},
+    )
+    resp.raise_for_status()
+    return {"wait_after_stop_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def run_live(client: TestClient, segments: list[bytes], cookie: str, user_id: str, interval: float) -> dict:
+    with client.websocket_connect("/api/v1/consultations/live", headers={"cookie": f"session_token={cookie}"}) as ws:
+        ws.send_json({"patient_id": user_id, "consent_given_at": datetime.now(timezone.utc).isoformat()})
+        consultation_id = ws.receive_json()["consultation_id"]
+        for segment in segments:
+            ws.send_bytes(segment)
+            time.sleep(interval)
+        start = time.perf_counter()
+        ws.send_json({"type": "stop"})
+        settled = 0
+        while True:
+            frame = ws.receive_json()
+            if frame["type"] == "segments":
+                settled = frame["first"] + len(frame["texts"])
+            elif frame["type"] == "done":
+                break
+        wait = time.perf_counter() - start
+
+    detail = client.get(
+        f"/api/v1/consultations/{consultation_id}", headers={"cookie": f"session_token={cookie}"}
+    ).json()
+    return {
+        "wait_after_stop_ms": round(wait * 1000, 1),
+        "segments_settled": settled,
+        "failed_segments": frame["failed_segments"],
+        "status": detail["status"],
+        "transcript_chars": len(detail["transcript"] or ""),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=30)
+    parser.add_argument("--segment-kb", type=int, default=160, help="About 10 s of Opus audio")
+    parser.add_argument("--interval-ms", type=float, default=1000, help="Time between segments (compressed)")
+    parser.add_argument("--whisper", default="400", help="Whisper base latency, median_ms[:sigma]")
+    parser.add_argument("--whisper-ms-per-mb", type=float, default=3000)
+    parser.add_argument("--llm", default="800", help="Agent latency, median_ms[:sigma]")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        llm=Latency.parse(args.llm), whisper=Latency.parse(args.whisper), geo=Latency(0),
+        per_agent={}, whisper_per_mb=args.whisper_ms_per_mb / 1000,
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    segments = [bytes([i % 256]) * (args.segment_kb * 1024) for i in range(args.segments)]
+    try:
+        # https so the Secure session cookie is kept
+        with TestClient(app, base_url="https://testserver") as client:
+            user_id, cookie = _register(client)
+            report = {
+                "upload": run_upload(client, segments, cookie),
+                "live": run_live(client, segments, cookie, user_id, args.interval_ms / 1000),
+            }
+    finally:
+        stack.close()
+    report["wait_saved_ms"] = round(
+        report["upload"]["wait_after_stop_ms"] - report["live"]["wait_after_stop_ms"], 1
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""End-to-end load test of the API against fake LLM, Whisper and geo backends.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable Postgres
+that has been migrated with ``alembic upgrade head``):
+
+    python -m benchmarks.load_test run --users 50 --duration 60 --output run.json
+
+``run`` boots ``app.main:app`` under uvicorn in a subprocess (``serve``) with
+every external call replaced by the fakes in ``benchmarks.fakes``, drives a
+weighted mix of auth/chat/transcribe/scan/nearby traffic from an asyncio
+load generator, and prints throughput and p50/p95/p99 per route as JSON.
+Pass ``--url`` to target an already running ``serve`` process instead.
+
+Latencies are log-normal, given as ``median_ms[:sigma]``; ``--agent NAME=SPEC``
+overrides the LLM latency for one agent (names as in ``benchmarks.fakes.AGENTS``).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+ROUTE_WEIGHTS: dict[str, int] = {
+    "auth.login": 5,
+    "auth.me": 10,
+    "chat": 35,
+    "transcribe": 10,
+    "scan": 10,
+    "nearby": 30,
+}
+
+CHAT_MESSAGES = [
+    "What is bronchitis?",
+    "How long does a dry cough usually last?",
+    "What is paracetamol generally used for?",
+    "Can you summarize my consultation?",
+]
+
+# Smallest valid PNG (1x1 transparent pixel)
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+def _add_latency_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm", default="800:0.4", help="Default agent latency")
+    parser.add_argument("--whisper", default="3000:0.3", help="Transcription latency")
+    parser.add_argument("--geo", default="150:0.5", help="Nominatim/Overpass latency")
+    parser.add_argument("--agent", action="append", default=[], metavar="NAME=SPEC")
+
+
+def _latency_argv(args: argparse.Namespace) -> list[str]:
+    argv = ["--llm", args.llm, "--whisper", args.whisper, "--geo", args.geo]
+    for spec in args.agent:
+        argv += ["--agent", spec]
+    return argv
+
+
+async def serve(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    from benchmarks.fakes import FakeConfig, Latency, geo_stub_app, install_fakes
+
+    config = FakeConfig(
+        llm=Latency.parse(args.llm),
+        whisper=Latency.parse(args.whisper),
+        geo=Latency.parse(args.geo),
+        per_agent={
+            name: Latency.parse(spec)
+            for name, _, spec in (a.partition("=") for a in args.agent)
+        },
+    )
+    geo_port = args.port + 1
+    install_fakes(config, f"http://127.0.0.1:{geo_port}")
+
+    from app.main import app
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(
+            geo_stub_app(config.geo), host="127.0.0.1", port=geo_port, log_level="warning"
+        )),
+    ]
+    await asyncio.gather(*(s.serve() for s in servers))
+
+
+# ---------------------------------------------------------------------------
+# Load generator
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def timed(self, route: str, request) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            resp = await request
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.samples[route].append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.errors[route] += 1
+        return resp
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route in sorted(set(self.samples) | set(self.errors)):
+            lat = sorted(self.samples.get(route, []))
+            routes[route] = {
+                "count": len(lat),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(lat) / elapsed, 2),
+                **{f"p{q}_ms": _percentile_ms(lat, q) for q in (50, 95, 99)},
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {"elapsed_s": round(elapsed, 2), "total_rps": round(total / elapsed, 2), "routes": routes}
+
+
+def _percentile_ms(sorted_values: list[float], q: int) -> float | None:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, round(q / 100 * (len(sorted_values) - 1)))
+    return round(sorted_values[idx] * 1000, 1)
+
+
+async def virtual_user(
+    idx: int, base_url: str, run_id: str, deadline: float, rec: Recorder, rng: random.Random
+) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        email = f"load-{run_id}-{idx}@example.com"
+        password = "load-test-password"
+        resp = await rec.timed("auth.register", client.post(
+            "/api/v1/auth/register", json={"email": email, "password": password, "name": f"User {idx}"}
+        ))
+        if resp is None or resp.status_code != 200:
+            return
+        # The session cookie is Secure; send it by hand over plain http
+        client.headers["Cookie"] = f"session_token={resp.cookies['session_token']}"
+
+        session_id: str | None = None
+        routes, weights = list(ROUTE_WEIGHTS), list(ROUTE_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            route = rng.choices(routes, weights)[0]
+            if route == "auth.login":
+                await rec.timed(route, client.post(
+                    "/api/v1/auth/login", json={"email": email, "password": password}
+                ))
+            elif route == "auth.me":
+                await rec.timed(route, client.get("/api/v1/auth/me"))
+            elif route == "chat":
+                resp = await rec.timed(route, client.post("/api/v1/chat/", json={
+                    "message": rng.choice(CHAT_MESSAGES), "session_id": session_id,
+                }))
+                if resp is not None and resp.status_code == 200:
+                    session_id = resp.json()["sessionId"]
+            elif route == "transcribe":
+                audio = rng.randbytes(64 * 1024)
+                await rec.timed(route, client.post(
+                    "/api/v1/consultations/transcribe", files={"file": ("visit.webm", audio, "audio/webm")}
+                ))
+            elif route == "scan":
+                await rec.timed(route, client.post(
+                    "/api/v1/prescriptions/scan-image", files={"file": ("rx.png", TINY_PNG, "image/png")}
+                ))
+            elif route == "nearby":
+                await rec.timed(route, client.get(
+                    "/api/v1/pharmacies/nearby", params={"lat": 28.61, "lon": 77.21, "radius": 5000}
+                ))
+
+
+async def _wait_healthy(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    server: subprocess.Popen | None = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.load_test", "serve", "--port", str(args.port),
+             *_latency_argv(args)],
+            env=os.environ.copy(),
+        )
+    try:
+        await _wait_healthy(base_url)
+        rec = Recorder()
+        rng = random.Random(args.seed)
+        run_id = uuid.uuid4().hex[:8]
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            virtual_user(i, base_url, run_id, deadline, rec, random.Random(rng.random()))
+            for i in range(args.users)
+        ))
+        report = rec.report(time.monotonic() - start)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report["commit"] = _git_commit()
+    report["config"] = {
+        "users": args.users, "duration_s": args.duration, "seed": args.seed,
+        "llm": args.llm, "whisper": args.whisper, "geo": args.geo, "agent": args.agent,
+        "weights": ROUTE_WEIGHTS,
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_p = sub.add_parser("serve", help="Run the API with all external services faked")
+    serve_p.add_argument("--port", type=int, default=8765)
+    _add_latency_args(serve_p)
+
+    run_p = sub.add_parser("run", help="Drive mixed traffic and report per-route latency")
+    run_p.add_argument("--url", help="Target an already running 'serve' instance")
+    run_p.add_argument("--port", type=int, default=8765)
+    run_p.add_argument("--users", type=int, default=20)
+    run_p.add_argument("--duration", type=float, default=30.0)
+    run_p.add_argument("--seed", type=int, default=0)
+    run_p.add_argument("--output", help="Also write the JSON report here")
+    _add_latency_args(run_p)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args))
+        return
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Extraction latency on long transcripts: one call per agent versus map-reduce over chunks.
+
+Usage (from backend/):
+
+    python -m benchmarks.long_transcript --tokens 6000 12000 24000 48000 --llm 2000 --per-1k 250
+
+Builds synthetic consultation transcripts of roughly the given token
+counts out of varied doctor/patient turns, and runs ``run_extraction``
+(prescription, summary and title agents) on each against the fakes in
+``benchmarks.fakes``. Agent latency is ``--llm`` plus ``--per-1k`` for
+every thousand prompt tokens, since model time grows with input.
+
+``single`` raises the long-transcript threshold so each agent gets the
+whole transcript. ``map_reduce`` uses the configured chunking, and
+``map_reduce+reduce`` adds the consolidating summary call. The report
+also checks that merging the identical canned chunk outputs gives back
+exactly one copy of each item.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.fakes import SAMPLE_PRESCRIPTION, SAMPLE_SUMMARY, FakeConfig, Latency, install_fakes
+from app.core.config import settings
+from app.services.extraction import run_extraction
+from app.services.long_transcript import estimate_tokens, split_transcript
+
+DOCTOR_TURNS = [
+    "Doctor: How long have you had the {symptom}?",
+    "Doctor: Does anything make the {symptom} better or worse?",
+    "Doctor: Are you still taking the {medicine} we started last time?",
+    "Doctor: Let me listen to your chest. Take a deep breath for me.",
+    "Doctor: I'd like to check your blood pressure again before we finish.",
+    "Doctor: We can increase the {medicine} to twice a day for the next two weeks.",
+]
+PATIENT_TURNS = [
+    "Patient: The {symptom} started about {n} days ago and gets worse at night.",
+    "Patient: I tried resting, but the {symptom} keeps coming back after meals.",
+    "Patient: Yes, I take the {medicine} every morning, though I missed a few doses.",
+    "Patient: My sister had something similar last year and it took weeks to settle.",
+    "Patient: I'm also sleeping badly, maybe four or five hours a night.",
+    "Patient: No new allergies that I know of, just the penicillin one.",
+]
+SYMPTOMS = ["dry cough", "headache", "lower back pain", "heartburn", "dizziness", "fatigue"]
+MEDICINES = ["paracetamol", "omeprazole", "ibuprofen", "amlodipine", "cetirizine", "metformin"]
+
+
+def synth_transcript(tokens: int, seed: int) -> str:
+    rng = random.Random(seed)
+    turns: list[str] = []
+    size = 0
+    while size < tokens:
+        fields = {"symptom": rng.choice(SYMPTOMS), "medicine": rng.choice(MEDICINES), "n": rng.randint(2, 14)}
+        pool = DOCTOR_TURNS if len(turns) % 2 == 0 else PATIENT_TURNS
+        turn = rng.choice(pool).format(**fields)
+        turns.append(turn)
+        size += estimate_tokens(turn) + 1
+    return "\n".join(turns)
+
+
+async def timed_extraction(transcript: str) -> tuple[float, tuple]:
+    start = time.perf_counter()
+    result = await run_extraction(transcript)
+    return time.perf_counter() - start, result
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency.parse(args.llm), whisper=Latency(0), geo=Latency(0), per_agent={},
+        llm_per_1k_tokens=args.per_1k / 1000,
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    threshold, reduce = settings.LONG_TRANSCRIPT_TOKENS, settings.LONG_TRANSCRIPT_REDUCE
+    report: dict = {
+        "chunk_tokens": settings.LONG_TRANSCRIPT_CHUNK_TOKENS,
+        "overlap_tokens": settings.LONG_TRANSCRIPT_OVERLAP_TOKENS,
+        "concurrency": settings.LONG_TRANSCRIPT_CONCURRENCY,
+    }
+    try:
+        for i, tokens in enumerate(args.tokens):
+            transcript = synth_transcript(tokens, seed=i)
+            chunks = split_transcript(
+                transcript, settings.LONG_TRANSCRIPT_CHUNK_TOKENS, settings.LONG_TRANSCRIPT_OVERLAP_TOKENS
+            )
+            row: dict = {
+                "tokens": estimate_tokens(transcript),
+                "chunks": len(chunks),
+                "largest_chunk_tokens": max(estimate_tokens(c) for c in chunks),
+            }
+
+            settings.LONG_TRANSCRIPT_TOKENS = 10**9
+            row["single_ms"] = round((await timed_extraction(transcript))[0] * 1000)
+
+            settings.LONG_TRANSCRIPT_TOKENS = 0
+            elapsed, (prescription, summary, _) = await timed_extraction(transcript)
+            row["map_reduce_ms"] = round(elapsed * 1000)
+            row["merged_like_single"] = prescription == SAMPLE_PRESCRIPTION and summary == SAMPLE_SUMMARY
+
+            settings.LONG_TRANSCRIPT_REDUCE = True
+            row["map_reduce+reduce_ms"] = round((await timed_extraction(transcript))[0] * 1000)
+            settings.LONG_TRANSCRIPT_REDUCE = reduce
+
+            row["speedup"] = round(row["single_ms"] / row["map_reduce_ms"], 2)
+            report[str(tokens)] = row
+    finally:
+        settings.LONG_TRANSCRIPT_TOKENS, settings.LONG_TRANSCRIPT_REDUCE = threshold, reduce
+        stack.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, nargs="+", default=[6000, 12000, 24000, 48000])
+    parser.add_argument("--llm", default="2000", help="Agent base latency, median_ms[:sigma]")
+    parser.add_argument("--per-1k", type=float, default=250, help="Extra agent ms per 1k prompt tokens")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Overhead of MetricsMiddleware and stage timing per request.
+
+Usage (from backend/):
+    python -m benchmarks.metrics_overhead [--requests 20000]
+
+Drives a trivial FastAPI route directly over ASGI (no network) with and
+without the middleware, and times raw ``stage()`` / ``Histogram.observe``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+
+from app.core.metrics import MetricsMiddleware, STAGE_LATENCY, stage
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        with stage("db.execute"):
+            pass
+        return {"ok": True}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, n: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/ping", "raw_path": b"/ping",
+        "query_string": b"", "headers": [], "server": ("bench", 80), "client": ("bench", 1),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    baseline = asyncio.run(drive(build_app(False), args.requests))
+    instrumented = asyncio.run(drive(build_app(True), args.requests))
+
+    n = 200_000
+    start = time.perf_counter()
+    for _ in range(n):
+        STAGE_LATENCY.observe(0.0123, "bench")
+    observe_ns = (time.perf_counter() - start) / n * 1e9
+
+    print(json.dumps({
+        "baseline_us_per_request": round(baseline * 1e6, 2),
+        "instrumented_us_per_request": round(instrumented * 1e6, 2),
+        "overhead_us_per_request": round((instrumented - baseline) * 1e6, 2),
+        "overhead_pct": round((instrumented / baseline - 1) * 100, 1),
+        "histogram_observe_ns": round(observe_ns, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
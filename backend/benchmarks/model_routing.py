@@ -0,0 +1,179 @@
+"""Latency and cost by route: today's fixed models versus size-based routing with fallbacks.
+
+Usage (from backend/):
+
+    python -m benchmarks.model_routing --visits 200 --errors openai:gpt-4o-mini=0.03
+
+Runs the prescription, summary and title agents, as ``/transcribe`` does,
+over ``--visits`` synthetic transcripts of lognormally distributed length
+(median ``--median-tokens``) against the fakes in ``benchmarks.fakes``.
+Each model gets its own latency (``--latency model=median_ms[:sigma]``),
+plus ``--per-1k`` ms per thousand prompt tokens, and a share of its calls
+fail (``--errors``).
+
+``fixed`` is ``DEFAULT_MODEL_ROUTES``: one model per agent, no fallbacks.
+``routed`` sends transcripts up to ``--short-tokens`` to gpt-4o-mini and
+longer ones to the default models, each with a fallback, and gives the long
+summary route a latency target. Per agent and route the report gives
+calls, the models that answered, failed attempts, p50/p95 latency and the
+cost estimated from ``MODEL_PRICES`` (abandoned and failed attempts are
+not priced).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import statistics
+import time
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from benchmarks.long_transcript import synth_transcript
+from app.core.config import DEFAULT_MODEL_ROUTES, ModelRoute, settings
+from app.services import model_routing
+from app.services.long_transcript import opening
+from app.services.prescription_agent import extract_prescription
+from app.services.summary_agent import generate_summary
+from app.services.title_agent import generate_title
+
+MINI, LARGE, REASONING = "openai:gpt-4o-mini", "openai:gpt-4o", "openai:gpt-5-mini"
+
+# agent -> (call, the prompt it sends for a transcript)
+AGENTS = {
+    "prescription": (extract_prescription, lambda t: t),
+    "summary": (generate_summary, lambda t: t),
+    "title": (generate_title, opening),
+}
+
+
+def routed_config(short_tokens: int, target_s: float) -> dict[str, list[ModelRoute]]:
+    return {
+        **DEFAULT_MODEL_ROUTES,
+        "prescription": [
+            ModelRoute(name="short", model=MINI, max_input_tokens=short_tokens, fallbacks=[LARGE]),
+            ModelRoute(name="long", model=LARGE, fallbacks=[REASONING]),
+        ],
+        "summary": [
+            ModelRoute(name="short", model=MINI, max_input_tokens=short_tokens, fallbacks=[REASONING]),
+            ModelRoute(name="long", model=REASONING, fallbacks=[LARGE], latency_target_s=target_s),
+        ],
+        "title": [ModelRoute(name="default", model=MINI, fallbacks=[REASONING])],
+    }
+
+
+def transcripts(n: int, median_tokens: int) -> list[str]:
+    rng = random.Random(3)
+    # Under LONG_TRANSCRIPT_TOKENS, so every agent makes one call
+    sizes = [min(7500, max(100, int(rng.lognormvariate(0, 0.8) * median_tokens))) for _ in range(n)]
+    return [synth_transcript(size, seed=i) for i, size in enumerate(sizes)]
+
+
+async def run_config(texts: list[str], concurrency: int) -> dict:
+    calls_before = dict(model_routing.LLM_CALLS._values)
+    cost_before = dict(model_routing.LLM_COST._values)
+    latencies: dict[tuple[str, str], list[float]] = collections.defaultdict(list)
+    failed: collections.Counter = collections.Counter()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(agent: str, transcript: str) -> None:
+        call, prompt = AGENTS[agent]
+        chosen = model_routing.route(agent, model_routing.input_tokens(prompt(transcript)))
+        start = time.perf_counter()
+        try:
+            await call(transcript)
+        except model_routing.FALLBACK_ERRORS:
+            failed[agent, chosen.name] += 1
+            return
+        latencies[agent, chosen.name].append(time.perf_counter() - start)
+
+    async def visit(transcript: str) -> None:
+        async with gate:
+            await asyncio.gather(*(one(agent, transcript) for agent in AGENTS))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(visit(t) for t in texts))
+    elapsed = time.perf_counter() - start
+
+    routes: dict[str, dict] = {}
+    for (agent, route, model, outcome), n in model_routing.LLM_CALLS._values.items():
+        n -= calls_before.get((agent, route, model, outcome), 0)
+        if n and agent in AGENTS:
+            entry = routes.setdefault(f"{agent}:{route}", {"served_by": {}, "failed_attempts": {}, "cost_usd": 0.0})
+            if outcome in ("ok", "slow"):
+                entry["served_by"][model] = entry["served_by"].get(model, 0) + n
+            else:
+                entry["failed_attempts"][f"{model}:{outcome}"] = n
+    for (agent, route, model), cost in model_routing.LLM_COST._values.items():
+        cost -= cost_before.get((agent, route, model), 0)
+        if cost and agent in AGENTS:
+            routes[f"{agent}:{route}"]["cost_usd"] += cost
+    for (agent, route), values in latencies.items():
+        values.sort()
+        entry = routes[f"{agent}:{route}"]
+        entry["calls"] = len(values) + failed[agent, route]
+        entry["failed_calls"] = failed[agent, route]
+        entry["p50_ms"] = round(statistics.median(values) * 1000)
+        entry["p95_ms"] = round(values[int(0.95 * (len(values) - 1))] * 1000)
+        entry["cost_usd"] = round(entry["cost_usd"], 4)
+
+    total_cost = sum(entry["cost_usd"] for entry in routes.values())
+    return {
+        "elapsed_s": round(elapsed, 1),
+        "failed_calls": sum(failed.values()),
+        "cost_usd": round(total_cost, 4),
+        "cost_per_1000_visits_usd": round(total_cost / len(texts) * 1000, 2),
+        "routes": dict(sorted(routes.items())),
+    }
+
+
+def parse_pairs(specs: list[str], parse) -> dict:
+    return {model: parse(value) for model, _, value in (spec.rpartition("=") for spec in specs)}
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency(1000),
+        whisper=Latency(0),
+        geo=Latency(0),
+        per_agent={},
+        llm_per_1k_tokens=args.per_1k / 1000,
+        per_model=parse_pairs(args.latency, Latency.parse),
+        model_errors=parse_pairs(args.errors, float),
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    routes = settings.MODEL_ROUTES
+    texts = transcripts(args.visits, args.median_tokens)
+    report = {"visits": args.visits, "short_tokens": args.short_tokens}
+    try:
+        settings.MODEL_ROUTES = dict(DEFAULT_MODEL_ROUTES)
+        report["fixed"] = await run_config(texts, args.concurrency)
+        settings.MODEL_ROUTES = routed_config(args.short_tokens, args.target)
+        report["routed"] = await run_config(texts, args.concurrency)
+    finally:
+        settings.MODEL_ROUTES = routes
+        stack.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visits", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Visits in flight")
+    parser.add_argument("--median-tokens", type=int, default=1500)
+    parser.add_argument("--short-tokens", type=int, default=2000, help="Largest transcript on the short routes")
+    parser.add_argument("--target", type=float, default=6.0, help="Latency target of the long summary route")
+    parser.add_argument(
+        "--latency", nargs="*",
+        default=[f"{MINI}=700:0.3", f"{LARGE}=1800:0.4", f"{REASONING}=3500:0.5"],
+        help="Per-model latency, model=median_ms[:sigma]",
+    )
+    parser.add_argument("--per-1k", type=float, default=200, help="Extra ms per 1k prompt tokens")
+    parser.add_argument("--errors", nargs="*", default=[f"{MINI}=0.03"], help="Per-model failure rate, model=rate")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Memory/latency benchmark: buffered vs streaming Overpass parsing.
+
+Usage (from backend/):
+    python -m benchmarks.overpass_parse [--payload recorded.json ...] [--limit 50]
+
+Record a payload with e.g.
+    curl -s -d 'data=[out:json];node["amenity"="pharmacy"](around:50000,28.61,77.21);out center body;' \\
+        https://overpass-api.de/api/interpreter > delhi_50km.json
+
+Without ``--payload`` a synthetic response of ``--elements`` POIs is used.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.services.pharmacy_lookup import _NearestCollector, _stream_elements
+
+CENTER = (28.61, 77.21)
+CHUNK_SIZE = 64 * 1024
+
+
+def synthetic_payload(n: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n):
+        tags = {"amenity": rng.choice(["pharmacy", "hospital", "clinic", "doctors"])}
+        if rng.random() < 0.7:
+            tags.update({
+                "name": f"Location {i}",
+                "addr:street": "Some Road",
+                "addr:city": "New Delhi",
+                "opening_hours": "Mo-Su 09:00-21:00",
+            })
+        elements.append({
+            "type": "node",
+            "id": i,
+            "lat": CENTER[0] + rng.uniform(-0.4, 0.4),
+            "lon": CENTER[1] + rng.uniform(-0.4, 0.4),
+            "tags": tags,
+        })
+    return json.dumps({"version": 0.6, "elements": elements}).encode()
+
+
+def buffered(body: bytes, limit: int) -> list:
+    """The pre-streaming behaviour: load everything, build everything, sort."""
+    collector = _NearestCollector(*CENTER, limit=len(body))
+    for el in json.loads(body).get("elements", []):
+        collector.add(el)
+    return collector.results()[:limit]
+
+
+def streaming(body: bytes, limit: int) -> list:
+    async def chunks():
+        for i in range(0, len(body), CHUNK_SIZE):
+            yield body[i:i + CHUNK_SIZE]
+
+    collector = _NearestCollector(*CENTER, limit=limit)
+    asyncio.run(_stream_elements(chunks(), collector.add))
+    return collector.results()
+
+
+def measure(fn, body: bytes, limit: int) -> dict:
+    # Time and memory are measured in separate runs: tracemalloc skews latency
+    start = time.perf_counter()
+    results = fn(body, limit)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(body, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(elapsed * 1000, 1), "peak_mib": round(peak / 2**20, 2), "results": len(results)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payload", action="append", type=Path, default=[])
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {p.name: p.read_bytes() for p in args.payload}
+    if not payloads:
+        payloads[f"synthetic-{args.elements}"] = synthetic_payload(args.elements)
+
+    report = {}
+    for name, body in payloads.items():
+        report[name] = {
+            "bytes": len(body),
+            "buffered": measure(buffered, body, args.limit),
+            "streaming": measure(streaming, body, args.limit),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Query-plan regression suite for the routes' SQL.
+
+Usage (from backend/, after ``python -m benchmarks.dataset``):
+
+    python -m benchmarks.query_plans [--output plans.json] [--max-seq-rows 1000]
+
+Builds the same statements the routes issue, binds them to the heaviest
+doctor, the longest chat session, etc. in the loaded dataset, and runs
+``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` on each. Timings, buffer counts
+and plans are written as JSON. The exit status is 1 if any plan contains a
+sequential scan reading more than ``--max-seq-rows`` rows.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+import asyncpg
+from sqlalchemy import Select, select
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+from app.models.chat_message import ChatMessage
+from app.models.chat_session import ChatSession
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.models.user import User
+from app.models.user_profile import UserProfile
+from benchmarks.dataset import _asyncpg_dsn
+
+
+@dataclass
+class Params:
+    doctor_id: str
+    email: str
+    consultation_id: str
+    prescription_id: str
+    patient_id: str
+    session_id: str
+
+
+# Route query -> statement builder; keep in sync with app/api/v1
+QUERIES: dict[str, Callable[[Params], Select]] = {
+    "auth.login": lambda p: select(User).where(User.email == p.email),
+    "auth.current_user": lambda p: select(User).where(User.id == p.doctor_id),
+    "users.profile": lambda p: select(UserProfile).where(UserProfile.user_id == p.doctor_id),
+    "consultations.list": lambda p: (
+        select(Consultation)
+        .where((Consultation.doctor_id == p.doctor_id) | (Consultation.patient_id == p.doctor_id))
+        .order_by(Consultation.created_at.desc())
+    ),
+    "consultations.get": lambda p: select(Consultation).where(Consultation.id == p.consultation_id),
+    "consultations.get.prescriptions": lambda p: (
+        select(Prescription).where(Prescription.consultation_id.in_([p.consultation_id]))
+    ),
+    "prescriptions.get": lambda p: select(Prescription).where(Prescription.id == p.prescription_id),
+    "chat.history": lambda p: (
+        select(ChatMessage.id, ChatMessage.seq, ChatMessage.role, ChatMessage.content)
+        .where(ChatMessage.patient_id == p.patient_id, ChatMessage.session_id == p.session_id)
+        .order_by(ChatMessage.seq.desc())
+    ),
+    "chat.history.page": lambda p: (
+        select(ChatMessage.id, ChatMessage.seq, ChatMessage.role, ChatMessage.content)
+        .where(ChatMessage.patient_id == p.patient_id, ChatMessage.session_id == p.session_id)
+        .order_by(ChatMessage.seq.desc())
+        .limit(50)
+    ),
+    "chat.sessions": lambda p: (
+        select(ChatSession)
+        .where(ChatSession.owner_id == p.patient_id, ChatSession.last_message_at.is_not(None))
+        .order_by(ChatSession.last_message_at.desc(), ChatSession.id.desc())
+        .limit(21)
+    ),
+}
+
+
+async def pick_params(conn: asyncpg.Connection) -> Params:
+    """Bind queries to the most expensive entities in the dataset."""
+    doctor_id = await conn.fetchval(
+        "SELECT doctor_id FROM consultations GROUP BY doctor_id ORDER BY count(*) DESC LIMIT 1"
+    )
+    email = await conn.fetchval("SELECT email FROM users WHERE id = $1", doctor_id)
+    consultation_id = await conn.fetchval(
+        "SELECT id FROM consultations WHERE doctor_id = $1 LIMIT 1", doctor_id
+    )
+    prescription_id = await conn.fetchval("SELECT id FROM prescriptions LIMIT 1")
+    session = await conn.fetchrow(
+        "SELECT owner_id AS patient_id, session_id FROM chat_sessions ORDER BY message_count DESC LIMIT 1"
+    )
+    return Params(
+        doctor_id=str(doctor_id),
+        email=email,
+        consultation_id=str(consultation_id),
+        prescription_id=str(prescription_id),
+        patient_id=str(session["patient_id"]),
+        session_id=session["session_id"],
+    )
+
+
+def _to_sql(stmt: Select) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def _walk(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def seq_scan_violations(plan: dict, max_rows: int) -> list[str]:
+    violations = []
+    for node in _walk(plan):
+        if node["Node Type"] != "Seq Scan":
+            continue
+        rows_read = node.get("Actual Rows", 0) * node.get("Actual Loops", 1) + node.get(
+            "Rows Removed by Filter", 0
+        )
+        if rows_read > max_rows:
+            violations.append(f"Seq Scan on {node.get('Relation Name')} reading {rows_read} rows")
+    return violations
+
+
+async def run(max_seq_rows: int) -> dict:
+    conn = await asyncpg.connect(_asyncpg_dsn(settings.DATABASE_URL))
+    try:
+        params = await pick_params(conn)
+        report: dict = {"params": params.__dict__, "queries": {}}
+        for name, build in QUERIES.items():
+            sql = _to_sql(build(params))
+            raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+            explain = json.loads(raw)[0]
+            plan = explain["Plan"]
+            report["queries"][name] = {
+                "planning_ms": explain.get("Planning Time"),
+                "execution_ms": explain.get("Execution Time"),
+                "shared_hit_blocks": plan.get("Shared Hit Blocks"),
+                "shared_read_blocks": plan.get("Shared Read Blocks"),
+                "violations": seq_scan_violations(plan, max_seq_rows),
+                "sql": sql,
+                "plan": plan,
+            }
+    finally:
+        await conn.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Write the full JSON report here")
+    parser.add_argument("--max-seq-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.max_seq_rows))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    for name, q in report["queries"].items():
+        status = "FAIL" if q["violations"] else "ok"
+        failed |= bool(q["violations"])
+        print(f"{status:4} {name:34} {q['execution_ms']:>9.2f} ms  {'; '.join(q['violations'])}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
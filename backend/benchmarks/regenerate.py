@@ -0,0 +1,145 @@
+"""Cost of refreshing fields after a transcript edit: targeted regeneration versus ``/transcribe``.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.regenerate --visits 5 --prescription 3000 --summary 2500 --title 800
+
+Drives the app in-process against the fakes in ``benchmarks.fakes``. Each
+visit is transcribed, its transcript is corrected with ``PATCH``, and its
+fields are refreshed: by posting the recording to ``/transcribe`` again
+(what clients do today), and through ``/consultations/{id}/regenerate``
+for just the title, for every field, and for every field again with
+nothing changed. The report gives the latency and agent calls of each,
+and the prescriptions the consultation ends up with.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session
+from app.main import app
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.schemas.user import CurrentUser
+from app.services import extraction
+
+AUDIO = b"OK" + bytes(4096)
+
+
+def count_calls() -> collections.Counter:
+    calls: collections.Counter = collections.Counter()
+    for agent, call in list(extraction.AGENT_CALLS.items()):
+        async def counted(transcript: str, _agent=agent, _call=call):
+            calls[_agent] += 1
+            return await _call(transcript)
+        extraction.AGENT_CALLS[agent] = counted
+    return calls
+
+
+async def timed(request) -> tuple[float, httpx.Response]:
+    start = time.perf_counter()
+    resp = await request
+    resp.raise_for_status()
+    return time.perf_counter() - start, resp
+
+
+async def one_visit(client: httpx.AsyncClient, calls: collections.Counter) -> dict:
+    _, resp = await timed(client.post("/api/v1/consultations/transcribe", files={"file": ("v.webm", AUDIO)}))
+    cid = resp.json()["consultation_id"]
+    transcript = resp.json()["transcript"]
+    await timed(client.patch(f"/api/v1/consultations/{cid}", json={"transcript": transcript + " Corrected."}))
+
+    transcribe_again, _ = await timed(
+        client.post("/api/v1/consultations/transcribe", files={"file": ("v.webm", AUDIO)})
+    )
+    results = {"transcribe_again": {"ms": transcribe_again * 1000, "agent_calls": 3}}
+    for case, query in (
+        ("regenerate_title", "fields=title"),
+        ("regenerate_all", ""),
+        ("regenerate_all_unchanged", ""),
+    ):
+        calls.clear()
+        elapsed, resp = await timed(client.post(f"/api/v1/consultations/{cid}/regenerate?{query}"))
+        results[case] = {
+            "ms": elapsed * 1000,
+            "agent_calls": sum(calls.values()),
+            "regenerated": resp.json()["regenerated"],
+        }
+    async with async_session() as db:
+        results["prescriptions_after"] = await db.scalar(
+            select(func.count()).where(Prescription.consultation_id == uuid.UUID(cid))
+        )
+    return results
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency(0),
+        whisper=Latency.parse(args.whisper),
+        geo=Latency(0),
+        per_agent={
+            "prescription": Latency.parse(args.prescription),
+            "summary": Latency.parse(args.summary),
+            "title": Latency.parse(args.title),
+        },
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    originals = dict(extraction.AGENT_CALLS)
+    calls = count_calls()
+    # The recordings are placeholders, not decodable audio
+    settings.AUDIO_TRIM_SILENCE = False
+    settings.BLOB_STORE_UPLOADS = False
+    for agent in ("PRESCRIPTION", "SUMMARY", "TITLE"):
+        setattr(settings, f"TRANSCRIBE_{agent}_DEADLINE_S", 0)
+    user = CurrentUser(id=uuid.uuid4(), email="regenerate@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            visits = [await one_visit(client, calls) for _ in range(args.visits)]
+    finally:
+        extraction.AGENT_CALLS.update(originals)
+        stack.close()
+        app.dependency_overrides.pop(get_current_user, None)
+        async with async_session() as db:
+            await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+            await db.commit()
+
+    report = {}
+    for case in ("transcribe_again", "regenerate_title", "regenerate_all", "regenerate_all_unchanged"):
+        report[case] = {
+            "p50_ms": round(statistics.median(v[case]["ms"] for v in visits)),
+            "agent_calls": visits[0][case]["agent_calls"],
+        }
+        if "regenerated" in visits[0][case]:
+            report[case]["regenerated"] = visits[0][case]["regenerated"]
+    report["prescriptions_per_consultation"] = visits[0]["prescriptions_after"]
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visits", type=int, default=5)
+    parser.add_argument("--whisper", default="1500", help="Whisper latency, median_ms[:sigma]")
+    parser.add_argument("--prescription", default="3000", help="Prescription agent latency")
+    parser.add_argument("--summary", default="2500", help="Summary agent latency")
+    parser.add_argument("--title", default="800", help="Title agent latency")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
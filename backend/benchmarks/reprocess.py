@@ -0,0 +1,215 @@
+"""Bulk reprocessing over a synthetic dataset, against fake agents.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.reprocess --consultations 2000 --llm 300 --crash-after 4
+
+Seeds ``--consultations`` consultations for a throwaway doctor, with
+outputs that differ from what the fakes in ``benchmarks.fakes`` return and
+a prescription on half of them, then:
+
+- dry-runs the first 100 and counts the fields that would change;
+- runs every agent, killing the run after ``--crash-after`` seconds and
+  starting it again, and checks every consultation was written exactly
+  once and that a transcript edited mid-run was left alone;
+- dry-runs 200 consultations at several concurrency limits, and once with
+  ``--rate`` agent calls per second, for throughput.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+
+from benchmarks.dataset import ICD_CODES, NOW, SENTENCES, _text
+from benchmarks.fakes import SAMPLE_SUMMARY, SAMPLE_TITLE, FakeConfig, Latency, install_fakes
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.models.reprocess_run import ReprocessRun
+from app.services import extraction
+from app.services.reprocessing import reprocess
+
+AGENTS = ["prescription", "summary", "title"]
+
+
+async def seed(doctor_id: uuid.UUID, n: int) -> list[uuid.UUID]:
+    rng = random.Random(7)
+    ids = [uuid.uuid4() for _ in range(n)]
+    consultations, prescriptions = [], []
+    for cid in ids:
+        created = NOW - timedelta(days=rng.randrange(1, 700))
+        code, desc = rng.choice(ICD_CODES)
+        consultations.append({
+            "id": cid,
+            "doctor_id": doctor_id,
+            "patient_id": uuid.uuid4(),
+            "title": f"Consultation: {desc}",
+            "transcript": _text(rng, 40),
+            "status": "completed",
+            "summary": {"chiefComplaint": rng.choice(SENTENCES), "history": "", "assessment": [], "plan": []},
+            "key_points": {"symptoms": [], "diagnosis": [desc], "allergies": [], "notes": []},
+            "consent_given_at": created,
+            "created_at": created,
+        })
+        if rng.random() < 0.5:
+            prescriptions.append({
+                "id": uuid.uuid4(), "consultation_id": cid, "diagnosis": desc, "medicines": [], "instructions": [],
+            })
+    async with async_session() as db:
+        await db.execute(insert(Consultation), consultations)
+        await db.execute(insert(Prescription), prescriptions)
+        await db.commit()
+    return ids
+
+
+def count_calls() -> collections.Counter:
+    calls: collections.Counter = collections.Counter()
+    for agent, call in list(extraction.AGENT_CALLS.items()):
+        async def counted(transcript: str, _agent=agent, _call=call):
+            calls[_agent] += 1
+            return await _call(transcript)
+        extraction.AGENT_CALLS[agent] = counted
+    return calls
+
+
+async def dry_run(doctor_id: uuid.UUID) -> dict:
+    fields: collections.Counter = collections.Counter()
+    report = await reprocess(
+        async_session, AGENTS, dry_run=True, limit=100, doctor_id=doctor_id,
+        on_change=lambda change: fields.update([change.field]),
+    )
+    async with async_session() as db:
+        title_changes = await db.scalar(
+            select(func.count()).where(Consultation.doctor_id == doctor_id, Consultation.title == SAMPLE_TITLE)
+        )
+    return {"processed": report.processed, "changes_by_field": dict(fields), "rows_written": title_changes}
+
+
+async def crash_and_resume(doctor_id: uuid.UUID, ids: list[uuid.UUID], args: argparse.Namespace) -> dict:
+    calls = count_calls()
+    edited_id = ids[len(ids) // 2]
+    summary = extraction.AGENT_CALLS["summary"]
+
+    async def summary_with_edit(transcript: str):
+        output = await summary(transcript)
+        if transcript == edited[0]:
+            # The doctor edits this transcript while its agents are running
+            async with async_session() as db:
+                await db.execute(
+                    update(Consultation).where(Consultation.id == edited_id).values(transcript=transcript + " Edited.")
+                )
+                await db.commit()
+        return output
+
+    async with async_session() as db:
+        edited = [await db.scalar(select(Consultation.transcript).where(Consultation.id == edited_id))]
+    extraction.AGENT_CALLS["summary"] = summary_with_edit
+
+    name = f"bench-{uuid.uuid4().hex[:8]}"
+    options = dict(run=name, batch_size=args.batch_size, concurrency=args.concurrency, doctor_id=doctor_id)
+    start = time.perf_counter()
+    crashed = asyncio.create_task(reprocess(async_session, AGENTS, **options))
+    await asyncio.sleep(args.crash_after)
+    crashed.cancel()
+    try:
+        await crashed
+    except asyncio.CancelledError:
+        pass
+    async with async_session() as db:
+        checkpoint = (await db.execute(select(ReprocessRun).where(ReprocessRun.name == name))).scalar_one()
+        at_crash = checkpoint.processed
+    calls_at_crash = sum(calls.values())
+
+    report = await reprocess(async_session, AGENTS, **options)
+    elapsed = time.perf_counter() - start
+    again = await reprocess(async_session, AGENTS, **options)
+
+    async with async_session() as db:
+        regenerated = await db.scalar(
+            select(func.count()).where(
+                Consultation.doctor_id == doctor_id,
+                Consultation.title == SAMPLE_TITLE,
+                Consultation.summary == SAMPLE_SUMMARY.model_dump(mode="json"),
+            )
+        )
+        with_prescription = await db.scalar(
+            select(func.count(func.distinct(Prescription.consultation_id))).where(Prescription.consultation_id.in_(ids))
+        )
+        edited_title = await db.scalar(select(Consultation.title).where(Consultation.id == edited_id))
+        await db.execute(delete(ReprocessRun).where(ReprocessRun.name == name))
+        await db.commit()
+
+    return {
+        "processed_at_crash": at_crash,
+        "agent_calls_at_crash": calls_at_crash,
+        "report": {k: v for k, v in report.__dict__.items() if k != "cursor"},
+        "elapsed_s": round(elapsed, 2),
+        "agent_calls": sum(calls.values()),
+        "redone_agent_calls": sum(calls.values()) - len(ids) * len(AGENTS),
+        "rows_regenerated": regenerated,
+        "rows_with_prescription": with_prescription,
+        "edited_row_left_alone": edited_title != SAMPLE_TITLE,
+        "rerun_of_finished_run": {"processed": again.processed, "finished": again.finished},
+    }
+
+
+async def throughput(doctor_id: uuid.UUID, concurrency: int, rate: float) -> dict:
+    calls = count_calls()
+    start = time.perf_counter()
+    report = await reprocess(
+        async_session, AGENTS, dry_run=True, limit=200, concurrency=concurrency, rate=rate, doctor_id=doctor_id,
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "rate": rate or None,
+        "consultations_per_s": round(report.processed / elapsed, 1),
+        "agent_calls_per_s": round(sum(calls.values()) / elapsed, 1),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(llm=Latency.parse(args.llm), whisper=Latency(0), geo=Latency(0), per_agent={})
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    originals = dict(extraction.AGENT_CALLS)
+    doctor_id = uuid.uuid4()
+    try:
+        ids = await seed(doctor_id, args.consultations)
+        results = {"dry_run": await dry_run(doctor_id)}
+        results["crash_and_resume"] = await crash_and_resume(doctor_id, ids, args)
+        results["throughput"] = []
+        for concurrency, rate in ((4, 0), (16, 0), (32, 0), (32, args.rate)):
+            extraction.AGENT_CALLS.update(originals)
+            results["throughput"].append(await throughput(doctor_id, concurrency, rate))
+        return results
+    finally:
+        extraction.AGENT_CALLS.update(originals)
+        stack.close()
+        async with async_session() as db:
+            await db.execute(delete(Consultation).where(Consultation.doctor_id == doctor_id))
+            await db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--consultations", type=int, default=2000)
+    parser.add_argument("--llm", default="300", help="Agent latency, median_ms[:sigma]")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--crash-after", type=float, default=4.0, help="Seconds before the first run is killed")
+    parser.add_argument("--rate", type=float, default=50.0, help="Agent calls per second for the rate-limited run")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
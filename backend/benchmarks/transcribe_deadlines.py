@@ -0,0 +1,109 @@
+"""Time to first useful response from ``/transcribe`` when one agent is slow.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.transcribe_deadlines --requests 5 --summary 12000 --summary-deadline 3
+
+Drives the app in-process against the fakes in ``benchmarks.fakes``, with
+the summary agent made slow. ``wait_all`` sets every deadline to 0, so the
+response waits for all three agents as before. ``deadlines`` gives the
+summary ``--summary-deadline`` seconds: the response comes back without it,
+and the summary is picked up from ``/consultations/{id}/events``. The report
+gives the response latency, the fields pending in the response, and the
+time until the consultation was complete.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session
+from app.main import app
+from app.models.consultation import Consultation
+from app.schemas.user import CurrentUser
+
+
+async def one_visit(client: httpx.AsyncClient) -> dict:
+    start = time.perf_counter()
+    resp = await client.post(
+        "/api/v1/consultations/transcribe", files={"file": ("visit.webm", b"OK" + bytes(4096), "audio/webm")}
+    )
+    resp.raise_for_status()
+    body = resp.json()
+    responded = time.perf_counter() - start
+
+    complete = responded
+    if body["pending"]:
+        async with client.stream("GET", f"/api/v1/consultations/{body['consultation_id']}/events") as events:
+            async for line in events.aiter_lines():
+                if line == "event: done":
+                    complete = time.perf_counter() - start
+                    break
+        detail = (await client.get(f"/api/v1/consultations/{body['consultation_id']}")).json()
+        assert detail["summary"] and not detail["pending_fields"], detail
+    return {"response_s": responded, "complete_s": complete, "pending": body["pending"]}
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency.parse(args.llm),
+        whisper=Latency.parse(args.whisper),
+        geo=Latency(0),
+        per_agent={"summary": Latency.parse(args.summary), "title": Latency.parse(args.title)},
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    # The recordings are placeholders, not decodable audio
+    settings.AUDIO_TRIM_SILENCE = False
+    user = CurrentUser(id=uuid.uuid4(), email="deadlines@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    modes = {
+        "wait_all": {"PRESCRIPTION": 0, "SUMMARY": 0, "TITLE": 0},
+        "deadlines": {"PRESCRIPTION": 0, "SUMMARY": args.summary_deadline, "TITLE": args.summary_deadline},
+    }
+    report = {}
+    try:
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for mode, deadlines in modes.items():
+                for agent, seconds in deadlines.items():
+                    setattr(settings, f"TRANSCRIBE_{agent}_DEADLINE_S", seconds)
+                runs = [await one_visit(client) for _ in range(args.requests)]
+                report[mode] = {
+                    "response_p50_ms": round(statistics.median(r["response_s"] for r in runs) * 1000),
+                    "complete_p50_ms": round(statistics.median(r["complete_s"] for r in runs) * 1000),
+                    "pending": sorted({f for r in runs for f in r["pending"]}),
+                }
+    finally:
+        stack.close()
+        app.dependency_overrides.pop(get_current_user, None)
+        async with async_session() as db:
+            await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+            await db.commit()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--whisper", default="1000", help="Whisper latency, median_ms[:sigma]")
+    parser.add_argument("--llm", default="2500", help="Prescription latency, median_ms[:sigma]")
+    parser.add_argument("--summary", default="12000", help="Summary latency, median_ms[:sigma]")
+    parser.add_argument("--title", default="800", help="Title latency, median_ms[:sigma]")
+    parser.add_argument("--summary-deadline", type=float, default=3.0, help="Summary/title deadline, seconds")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Model calls spent keeping fields current while a doctor corrects a transcript.
+
+Usage (from backend/, with DATABASE_URL pointing at a disposable, migrated
+database):
+
+    python -m benchmarks.transcript_edits --edits 8 --interval 0.5 --debounce 2
+
+Drives the app in-process against the fakes in ``benchmarks.fakes``. A
+consultation is transcribed, then corrected with ``--edits`` PATCHes
+``--interval`` seconds apart:
+
+- ``regenerate_each_edit``: the client calls ``/regenerate`` after every
+  edit and waits for it, as doctors do today;
+- ``debounced``: ``TRANSCRIPT_REDERIVE`` is on and the client only edits;
+- ``cosmetic``: as ``debounced``, but the edits only change case, spacing
+  and quote style;
+- ``edit_during_run``: one more edit lands while the debounced run's
+  agents are working.
+
+The report gives agent calls, and the seconds from the last edit until
+the title, summary and key points match the final transcript.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, select
+
+from benchmarks.dataset import SENTENCES
+from benchmarks.fakes import FakeConfig, Latency, install_fakes
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.database.session import async_session
+from app.main import app
+from app.models.consultation import Consultation
+from app.schemas.user import CurrentUser
+from app.services import extraction, rederivation
+from app.services.extraction import input_hash
+
+FIELDS = ("title", "summary", "key_points")
+
+
+def count_calls() -> collections.Counter:
+    calls: collections.Counter = collections.Counter()
+    for agent, call in list(extraction.AGENT_CALLS.items()):
+        async def counted(transcript: str, _agent=agent, _call=call):
+            calls[_agent] += 1
+            return await _call(transcript)
+        extraction.AGENT_CALLS[agent] = counted
+    return calls
+
+
+async def new_consultation(client: httpx.AsyncClient) -> tuple[str, str]:
+    resp = await client.post(
+        "/api/v1/consultations/transcribe", files={"file": ("visit.webm", b"OK" + bytes(4096), "audio/webm")}
+    )
+    resp.raise_for_status()
+    return resp.json()["consultation_id"], resp.json()["transcript"]
+
+
+async def settled(cid: str, transcript: str, timeout: float = 60) -> float:
+    """Seconds until every field was derived from ``transcript``."""
+    start = time.perf_counter()
+    expected = input_hash(transcript)
+    while time.perf_counter() - start < timeout:
+        async with async_session() as db:
+            hashes = await db.scalar(select(Consultation.input_hashes).where(Consultation.id == uuid.UUID(cid)))
+        if all(hashes.get(f) == expected for f in FIELDS):
+            return time.perf_counter() - start
+        await asyncio.sleep(0.05)
+    return float("inf")
+
+
+def cosmetic(transcript: str, i: int) -> str:
+    variants = (str.upper, str.lower, lambda t: t.replace(" ", "  "), lambda t: t.replace("'", "\u2019"))
+    return variants[i % len(variants)](transcript)
+
+
+async def edit_session(client: httpx.AsyncClient, calls: collections.Counter, args, mode: str) -> dict:
+    settings.TRANSCRIPT_REDERIVE = mode != "regenerate_each_edit"
+    cid, transcript = await new_consultation(client)
+    calls.clear()
+    rng = random.Random(1)
+    for i in range(args.edits):
+        transcript = cosmetic(transcript, i) if mode == "cosmetic" else f"{transcript} {rng.choice(SENTENCES)}"
+        (await client.patch(f"/api/v1/consultations/{cid}", json={"transcript": transcript})).raise_for_status()
+        if mode == "regenerate_each_edit":
+            (await client.post(f"/api/v1/consultations/{cid}/regenerate?fields={','.join(FIELDS)}")).raise_for_status()
+        else:
+            await asyncio.sleep(args.interval)
+    if mode == "edit_during_run":
+        # Into the run the edits above lead to, once its agents have started
+        await asyncio.sleep(args.debounce - args.interval + 0.3)
+        transcript = f"{transcript} {rng.choice(SENTENCES)}"
+        (await client.patch(f"/api/v1/consultations/{cid}", json={"transcript": transcript})).raise_for_status()
+    if mode == "cosmetic":
+        await asyncio.sleep(args.debounce + 0.5)
+        lag = 0.0
+    else:
+        lag = await settled(cid, transcript)
+    return {"agent_calls": sum(calls.values()), "settled_after_last_edit_s": round(lag, 2)}
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    config = FakeConfig(
+        llm=Latency(0),
+        whisper=Latency(200),
+        geo=Latency(0),
+        per_agent={
+            "prescription": Latency.parse(args.prescription),
+            "summary": Latency.parse(args.summary),
+            "title": Latency.parse(args.title),
+        },
+    )
+    stack = install_fakes(config, "http://127.0.0.1:9")
+    originals = dict(extraction.AGENT_CALLS)
+    calls = count_calls()
+    settings.AUDIO_TRIM_SILENCE = False
+    settings.BLOB_STORE_UPLOADS = False
+    for agent in ("PRESCRIPTION", "SUMMARY", "TITLE"):
+        setattr(settings, f"TRANSCRIBE_{agent}_DEADLINE_S", 0)
+    settings.TRANSCRIPT_REDERIVE_DEBOUNCE_S = args.debounce
+    settings.TRANSCRIPT_REDERIVE_FIELDS = list(FIELDS)
+    rederivation._debouncer = None
+    user = CurrentUser(id=uuid.uuid4(), email="edits@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return {
+                mode: await edit_session(client, calls, args, mode)
+                for mode in ("regenerate_each_edit", "debounced", "cosmetic", "edit_during_run")
+            }
+    finally:
+        await rederivation.drain_rederivations(30)
+        extraction.AGENT_CALLS.update(originals)
+        stack.close()
+        app.dependency_overrides.pop(get_current_user, None)
+        async with async_session() as db:
+            await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+            await db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--edits", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between edits")
+    parser.add_argument("--debounce", type=float, default=2.0, help="TRANSCRIPT_REDERIVE_DEBOUNCE_S")
+    parser.add_argument("--prescription", default="3000", help="Prescription agent latency")
+    parser.add_argument("--summary", default="2500", help="Summary agent latency")
+    parser.add_argument("--title", default="800", help="Title agent latency")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
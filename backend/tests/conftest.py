@@ -0,0 +1,55 @@
+import os
+
+# Settings are read at import time and need these
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import uuid  # noqa: E402
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import delete, text  # noqa: E402
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+
+from app.api.deps import get_current_user  # noqa: E402
+from app.database.session import async_session, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.consultation import Consultation  # noqa: E402
+from app.schemas.user import CurrentUser  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """The app's engine, on a migrated DATABASE_URL; the test is skipped when it is unreachable."""
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except (OSError, SQLAlchemyError) as exc:
+        pytest.skip(f"Database unavailable: {exc}")
+    yield
+    # Pooled connections belong to this test's event loop
+    await engine.dispose()
+
+
+@pytest.fixture
+async def doctor(database):
+    """A signed-in doctor; their consultations are deleted afterwards."""
+    user = CurrentUser(id=uuid.uuid4(), email=f"{uuid.uuid4().hex[:8]}@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
+    async with async_session() as db:
+        await db.execute(delete(Consultation).where(Consultation.doctor_id == user.id))
+        await db.commit()
+
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test") as client:
+        yield client
+
@@ -0,0 +1,32 @@
+"""Rows for tests to work on."""
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.schemas.user import CurrentUser
+
+
+async def add_consultation(doctor: CurrentUser, **values) -> Consultation:
+    values.setdefault("status", "completed")
+    consultation = Consultation(
+        doctor_id=doctor.id, patient_id=uuid.uuid4(), consent_given_at=datetime.now(timezone.utc), **values
+    )
+    async with async_session() as db:
+        db.add(consultation)
+        await db.commit()
+    return consultation
+
+
+async def add_prescription(consultation: Consultation, **values) -> Prescription:
+    values.setdefault("diagnosis", "Acute bronchitis")
+    values.setdefault("medicines", [])
+    values.setdefault("instructions", [])
+    prescription = Prescription(consultation_id=consultation.id, **values)
+    async with async_session() as db:
+        db.add(prescription)
+        await db.commit()
+    return prescription
@@ -0,0 +1,99 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.models.prescription import Prescription
+from app.schemas.consultation import SummaryData
+from app.services import batch_transcription
+from app.services.batch_transcription import BatchItem, transcribe_batch
+from app.services.prescription_agent import PrescriptionAgentResult
+
+pytestmark = pytest.mark.anyio
+
+
+class InFlight:
+    """Counts calls running at once, and the most seen."""
+
+    def __init__(self) -> None:
+        self.now = self.most = 0
+
+    async def hold(self, seconds: float) -> None:
+        self.now += 1
+        self.most = max(self.most, self.now)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.now -= 1
+
+
+@pytest.fixture
+def services(monkeypatch):
+    whisper, extraction = InFlight(), InFlight()
+
+    async def transcribe_audio(audio: bytes, mime_type: str) -> str:
+        await whisper.hold(0.02)
+        if audio == b"unreadable":
+            raise RuntimeError("Whisper rejected the file")
+        return audio.decode()
+
+    async def run_extraction(transcript: str):
+        await extraction.hold(0.03)
+        if transcript == "garbled":
+            raise RuntimeError("the model refused")
+        prescription = PrescriptionAgentResult(
+            symptoms=[], diagnosis=["Migraine"], allergies=[], notes=[], medicines=[], instructions=[]
+        )
+        return prescription, SummaryData(chiefComplaint=transcript), f"Visit: {transcript}"
+
+    monkeypatch.setattr(batch_transcription, "transcribe_audio", transcribe_audio)
+    monkeypatch.setattr(batch_transcription, "run_extraction", run_extraction)
+    monkeypatch.setattr(settings, "BLOB_STORE_UPLOADS", False)
+    return whisper, extraction
+
+
+def item(audio: bytes) -> BatchItem:
+    async def load() -> bytes:
+        return audio
+
+    return BatchItem(filename=f"{audio.decode()}.webm", mime_type="audio/webm", patient_id=uuid.uuid4(), load=load)
+
+
+async def test_failing_items_leave_the_rest_of_the_batch_alone(doctor, services):
+    audio = [b"visit 0", b"unreadable", b"visit 2", b"garbled", *(f"visit {i}".encode() for i in range(4, 10))]
+
+    results = await transcribe_batch(
+        [item(a) for a in audio], doctor.id, async_session,
+        whisper_concurrency=2, extraction_concurrency=3, save_group_size=3,
+    )
+
+    assert [r.status for r in results] == ["completed", "failed", "completed", "failed", *["completed"] * 6]
+    assert (results[1].error, results[3].error) == ("Transcription failed", "Extraction failed")
+    assert results[1].consultation_id is None and results[3].consultation_id is None
+    assert results[0].title == "Visit: visit 0"
+
+    saved = [r.consultation_id for r in results if r.status == "completed"]
+    async with async_session() as db:
+        stored = await db.scalar(
+            select(func.count()).select_from(Consultation).where(Consultation.doctor_id == doctor.id)
+        )
+        prescriptions = await db.scalar(
+            select(func.count()).select_from(Prescription).where(Prescription.consultation_id.in_(saved))
+        )
+    assert (stored, prescriptions) == (8, 8)
+
+
+async def test_whisper_and_extraction_are_bounded_separately(doctor, services):
+    whisper, extraction = services
+
+    results = await transcribe_batch(
+        [item(f"visit {i}".encode()) for i in range(12)], doctor.id, async_session,
+        whisper_concurrency=2, extraction_concurrency=3, save_group_size=5,
+    )
+
+    assert all(r.status == "completed" for r in results)
+    assert (whisper.most, extraction.most) == (2, 3)
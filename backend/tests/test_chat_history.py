@@ -0,0 +1,92 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.database.session import async_session
+from app.models.chat_message import ChatMessage
+from app.services import chat_history
+from app.services.chat_history import CachedHistory, FileBackend, StoredMessage
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_CACHE", "memory")
+    chat_history._get_backend.cache_clear()
+    yield
+    chat_history._get_backend.cache_clear()
+
+
+@pytest.fixture
+async def patient(database):
+    patient_id = uuid.uuid4()
+    yield patient_id
+    async with async_session() as db:
+        await db.execute(delete(ChatMessage).where(ChatMessage.patient_id == patient_id))
+        await db.commit()
+
+
+async def save(db, patient_id: uuid.UUID, role: str, content: str) -> StoredMessage:
+    msg = ChatMessage(patient_id=patient_id, session_id="s", role=role, content=content)
+    db.add(msg)
+    await db.commit()
+    return StoredMessage(msg.id, msg.seq, role, content)
+
+
+async def test_file_backend_round_trip_and_eviction(tmp_path):
+    backend = FileBackend(str(tmp_path), max_sessions=10)
+    entry = CachedHistory().extended([StoredMessage(uuid.uuid4(), 7, "user", "Dry cough")])
+    for i in range(10):
+        await backend.set(f"p:{i}", entry)
+        os.utime(backend._path(f"p:{i}"), (i, i))
+    assert await backend.get("p:9") == entry
+    assert len(list(tmp_path.glob("*.json"))) == 10
+
+    await backend.set("p:new", entry)
+    # Trimmed to nine, least recently used first (reading p:9 refreshed it)
+    left = {p.stem for p in tmp_path.glob("*.json")}
+    assert left == {"p_new", *(f"p_{i}" for i in range(2, 10))}
+    assert await backend.get("p:0") is None
+
+
+async def test_turn_is_appended_to_the_cached_history(memory_cache, patient):
+    async with async_session() as db:
+        await save(db, patient, "user", "Hello")
+        history = await chat_history.load_history(db, patient, "s")
+        ours = [await save(db, patient, "user", "Dry cough"), await save(db, patient, "assistant", "Since when?")]
+        appended = await chat_history.append_history(db, patient, "s", history, ours)
+    assert [m.parts[0].content for m in appended.messages] == ["Hello", "Dry cough", "Since when?"]
+    assert await chat_history.peek_history(patient, "s") == appended
+
+
+async def test_without_a_cache_a_turn_costs_no_query(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_CACHE", "off")
+    chat_history._get_backend.cache_clear()
+    history = CachedHistory().extended([StoredMessage(uuid.uuid4(), 1, "user", "Hello")])
+    reply = StoredMessage(uuid.uuid4(), 2, "assistant", "Hi")
+
+    try:
+        # No session: any query would fail
+        appended = await chat_history.append_history(None, uuid.uuid4(), "s", history, [reply])
+    finally:
+        chat_history._get_backend.cache_clear()
+    assert [m.parts[0].content for m in appended.messages] == ["Hello", "Hi"]
+
+
+async def test_message_from_another_turn_between_our_saves_is_not_lost(memory_cache, patient):
+    async with async_session() as db:
+        await save(db, patient, "user", "Hello")
+        history = await chat_history.load_history(db, patient, "s")
+        user_row = await save(db, patient, "user", "Dry cough")
+        await save(db, patient, "user", "Also a fever")  # a concurrent turn on the same session
+        assistant_row = await save(db, patient, "assistant", "Since when?")
+        appended = await chat_history.append_history(db, patient, "s", history, [user_row, assistant_row])
+        reloaded = await chat_history.load_history(db, patient, "s")
+
+    contents = ["Hello", "Dry cough", "Also a fever", "Since when?"]
+    assert [m.parts[0].content for m in appended.messages] == contents
+    assert [m.parts[0].content for m in reloaded.messages] == contents
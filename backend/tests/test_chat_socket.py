@@ -0,0 +1,92 @@
+import json
+import time
+import uuid
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from app.api.v1 import chat
+from app.services.chat_history import CachedHistory, StoredMessage
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSocket:
+    def __init__(self, *frames: str) -> None:
+        self.frames = list(frames)
+        self.sent: list[dict] = []
+
+    async def accept(self) -> None:
+        pass
+
+    async def receive_text(self) -> str:
+        if not self.frames:
+            raise WebSocketDisconnect()
+        return self.frames.pop(0)
+
+    async def send_json(self, data: dict) -> None:
+        self.sent.append(data)
+
+
+async def test_failed_turn_sends_an_error_and_keeps_the_socket_open(monkeypatch):
+    user = chat.CurrentUser(id=uuid.uuid4(), email="doctor@example.com")
+    turns: list[str] = []
+
+    async def authenticate(websocket):
+        return user, time.time() + 60
+
+    async def socket_turn(websocket, conn, body):
+        turns.append(body.message)
+        if len(turns) == 1:
+            raise RuntimeError("model provider down")
+        await websocket.send_json({"type": "done"})
+
+    monkeypatch.setattr(chat, "authenticate_websocket", authenticate)
+    monkeypatch.setattr(chat, "_socket_turn", socket_turn)
+    socket = FakeSocket(json.dumps({"message": "Hello"}), json.dumps({"message": "Again"}))
+
+    await chat.chat_socket(socket)
+
+    assert turns == ["Hello", "Again"]
+    assert socket.sent == [{"type": "error", "status": 500, "detail": "Chat turn failed"}, {"type": "done"}]
+
+
+async def test_only_a_malformed_frame_is_reported_as_one(monkeypatch):
+    user = chat.CurrentUser(id=uuid.uuid4(), email="doctor@example.com")
+
+    async def authenticate(websocket):
+        return user, time.time() + 60
+
+    async def socket_turn(websocket, conn, body):
+        raise ValueError("invalid input syntax for type uuid")
+
+    monkeypatch.setattr(chat, "authenticate_websocket", authenticate)
+    monkeypatch.setattr(chat, "_socket_turn", socket_turn)
+    socket = FakeSocket("not json", json.dumps({"nothing": "here"}), json.dumps({"message": "Hello"}))
+
+    await chat.chat_socket(socket)
+
+    malformed = {"type": "error", "status": 422, "detail": "Expected a JSON chat request"}
+    assert socket.sent == [malformed, malformed, {"type": "error", "status": 500, "detail": "Chat turn failed"}]
+
+
+@pytest.mark.parametrize("cached_matches", [True, False, None])
+async def test_connection_history_is_reused_only_while_the_cache_agrees(monkeypatch, cached_matches):
+    ours = CachedHistory().extended([StoredMessage(uuid.uuid4(), 1, "user", "Hello")])
+    loaded = CachedHistory().extended([StoredMessage(uuid.uuid4(), 2, "user", "Hello")])
+
+    async def peek_history(user_id, session_id):
+        if cached_matches is None:
+            return None  # evicted, or the cache is off
+        return ours if cached_matches else loaded
+
+    async def load_history(db, user_id, session_id):
+        return loaded
+
+    monkeypatch.setattr(chat, "peek_history", peek_history)
+    monkeypatch.setattr(chat, "load_history", load_history)
+    conn = chat._ChatConnection(uuid.uuid4(), time.time() + 60)
+    conn.switch_session("s")
+    conn.history = ours
+
+    assert await conn.current_history(db=None) is (ours if cached_matches else loaded)
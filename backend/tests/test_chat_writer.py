@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.services.chat_writer import ChatMessageWriter
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakySessions:
+    """Session factory whose message INSERTs fail as scripted, one outcome per INSERT."""
+
+    def __init__(self, *outcomes: Exception | None) -> None:
+        self.outcomes = list(outcomes)
+        self.stored: list[uuid.UUID] = []
+
+    def __call__(self) -> "FlakySessions":
+        return self
+
+    async def __aenter__(self) -> "FlakySessions":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def execute(self, stmt, rows=None) -> None:
+        if stmt.table.name != "chat_messages":
+            return
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if outcome is not None:
+            raise outcome
+        self.stored.extend(row["id"] for row in rows)
+
+    async def commit(self) -> None:
+        pass
+
+
+def enqueue(writer: ChatMessageWriter, count: int) -> list[dict]:
+    patient = uuid.uuid4()
+    return [writer.enqueue(patient_id=patient, session_id="s", role="user", content=f"m{i}") for i in range(count)]
+
+
+async def test_rows_left_when_the_per_row_fallback_fails_are_requeued():
+    constraint = IntegrityError("INSERT", {}, Exception("foreign key"))
+    sessions = FlakySessions(constraint, constraint, None, OSError("connection lost"))
+    writer = ChatMessageWriter(sessions, flush_interval=1, max_batch=10)
+    rows = enqueue(writer, 4)
+
+    with pytest.raises(OSError):
+        await writer.flush()
+
+    # The first row is dropped as unstorable, the second stored, the rest kept
+    assert sessions.stored == [rows[1]["id"]]
+    assert writer._pending == rows[2:]
+    assert writer.pending_for(rows[0]["patient_id"], "s") == rows[2:]
+
+    await writer.flush()
+    assert sessions.stored == [row["id"] for row in rows[1:]]
+    assert writer._pending == []
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.api.v1.consultations import _extract_into
+from app.core.config import settings
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.services import deferred_extraction, extraction
+from app.services.prescription_agent import PrescriptionAgentResult
+from app.schemas.consultation import SummaryData
+from tests.factories import add_consultation
+
+pytestmark = pytest.mark.anyio
+
+TRANSCRIPT = "Doctor: What brings you in? Patient: A dry cough for a week."
+
+
+class SlowSummary:
+    """A summary agent that answers (or fails) when the test says so."""
+
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+        self.error: Exception | None = None
+
+    async def __call__(self, transcript: str) -> SummaryData:
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return SummaryData(chiefComplaint="Dry cough")
+
+
+@pytest.fixture
+def summary(monkeypatch):
+    async def prescription(transcript: str) -> PrescriptionAgentResult:
+        return PrescriptionAgentResult(
+            symptoms=["cough"], diagnosis=["Bronchitis"], allergies=[], notes=[], medicines=[], instructions=[]
+        )
+
+    async def title(transcript: str) -> str:
+        return "Dry cough"
+
+    slow = SlowSummary()
+    monkeypatch.setitem(extraction.AGENT_CALLS, "prescription", prescription)
+    monkeypatch.setitem(extraction.AGENT_CALLS, "summary", slow)
+    monkeypatch.setitem(extraction.AGENT_CALLS, "title", title)
+    monkeypatch.setattr(settings, "TRANSCRIBE_PRESCRIPTION_DEADLINE_S", 0)
+    monkeypatch.setattr(settings, "TRANSCRIBE_SUMMARY_DEADLINE_S", 0.05)
+    monkeypatch.setattr(settings, "TRANSCRIBE_TITLE_DEADLINE_S", 0.05)
+    monkeypatch.setattr(settings, "TRANSCRIBE_EVENTS_POLL_S", 0.05)
+    return slow
+
+
+async def transcribe(doctor) -> uuid.UUID:
+    consultation = Consultation(
+        doctor_id=doctor.id, patient_id=uuid.uuid4(), consent_given_at=datetime.now(timezone.utc)
+    )
+    async with async_session() as db:
+        response = await _extract_into(db, consultation, TRANSCRIPT, "Asha")
+    assert response.pending == ["summary"]
+    assert response.title == "Dry cough"
+    return response.consultation_id
+
+
+async def stored(consultation_id: uuid.UUID) -> Consultation:
+    async with async_session() as db:
+        return await db.get(Consultation, consultation_id)
+
+
+async def background_done() -> None:
+    while deferred_extraction._background:
+        await asyncio.sleep(0.01)
+
+
+def parse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def test_late_agent_is_stored_and_streamed(client, doctor, summary):
+    consultation_id = await transcribe(doctor)
+    consultation = await stored(consultation_id)
+    assert (consultation.status, consultation.pending_fields) == ("processing", ["summary"])
+    assert "summary" not in consultation.input_hashes
+
+    async def finish_later():
+        await asyncio.sleep(0.1)
+        summary.release.set()
+
+    finishing = asyncio.create_task(finish_later())
+    resp = await client.get(f"/api/v1/consultations/{consultation_id}/events")
+    await finishing
+    events = parse_events(resp.text)
+    assert events[0][0] == "update" and events[0][1]["pending_fields"] == ["summary"]
+    assert events[-2][0] == "update" and events[-2][1]["pending_fields"] == []
+    assert events[-2][1]["summary"]["chiefComplaint"] == "Dry cough"
+    assert events[-1][0] == "done"
+
+    consultation = await stored(consultation_id)
+    assert consultation.status == "completed"
+    assert consultation.input_hashes["summary"] == extraction.input_hash(TRANSCRIPT)
+
+
+async def test_late_failure_stops_the_fields_being_pending(doctor, summary):
+    consultation_id = await transcribe(doctor)
+    summary.error = RuntimeError("model provider down")
+    summary.release.set()
+    await background_done()
+
+    consultation = await stored(consultation_id)
+    assert (consultation.status, consultation.pending_fields, consultation.summary) == ("completed", [], None)
+    assert "summary" not in consultation.input_hashes
+    assert consultation.title == "Dry cough"
+
+
+async def test_cancelled_at_shutdown_stops_the_fields_being_pending(doctor, summary):
+    consultation_id = await transcribe(doctor)
+    await deferred_extraction.drain_deferred_extractions(timeout=0.05)
+
+    consultation = await stored(consultation_id)
+    assert (consultation.status, consultation.pending_fields) == ("completed", [])
+
+
+async def test_fields_left_pending_by_a_dead_worker_expire(client, doctor, summary):
+    consultation = await add_consultation(
+        doctor, status="processing", transcript=TRANSCRIPT, pending_fields=["summary"],
+        pending_since=datetime.now(timezone.utc) - timedelta(hours=1),
+    )
+    assert extraction.still_pending(consultation) == []
+
+    resp = await client.get(f"/api/v1/consultations/{consultation.id}/events")
+    assert [name for name, _ in parse_events(resp.text)] == ["update", "done"]
+
+    summary.release.set()
+    resp = await client.post(f"/api/v1/consultations/{consultation.id}/regenerate?fields=summary")
+    assert resp.status_code == 200
+    assert resp.json()["regenerated"] == ["summary"]
@@ -0,0 +1,132 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import delete, insert, select
+
+from app.api.deps import get_current_user
+from app.api.idempotency import IdempotentRoute, idempotent
+from app.database.session import async_session
+from app.models.idempotency_key import IdempotencyKey
+from app.schemas.user import CurrentUser
+from app.services.idempotency import purge_expired_keys
+
+pytestmark = pytest.mark.anyio
+
+
+class Order(BaseModel):
+    item: str
+
+
+class Endpoint:
+    """What the endpoint does: count runs, optionally wait to be let go, optionally fail."""
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.started = asyncio.Event()
+        self.release: asyncio.Event | None = None
+        self.fail = False
+
+    async def __call__(self, order: Order) -> dict:
+        self.runs += 1
+        self.started.set()
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise HTTPException(status_code=503, detail="Upstream unavailable")
+        return {"item": order.item, "run": self.runs}
+
+
+@pytest.fixture
+async def user(database):
+    user = CurrentUser(id=uuid.uuid4(), email=f"{uuid.uuid4().hex[:8]}@example.com")
+    yield user
+    async with async_session() as db:
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user.id))
+        await db.commit()
+
+
+@pytest.fixture
+def endpoint() -> Endpoint:
+    return Endpoint()
+
+
+@pytest.fixture
+async def client(user, endpoint):
+    router = APIRouter(route_class=IdempotentRoute)
+    router.add_api_route("/orders", endpoint, methods=["POST"], dependencies=[Depends(idempotent)])
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = lambda: user
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test") as client:
+        yield client
+
+
+def order(client: httpx.AsyncClient, item: str = "amoxicillin", key: str = "key-1"):
+    return client.post("/orders", json={"item": item}, headers={"Idempotency-Key": key})
+
+
+async def test_a_completed_response_is_replayed(client, endpoint):
+    first = await order(client)
+    again = await order(client)
+
+    assert endpoint.runs == 1
+    assert (again.status_code, again.json()) == (200, first.json())
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+
+async def test_a_retry_during_the_first_attempt_waits_for_its_result(client, endpoint):
+    endpoint.release = asyncio.Event()
+    first = asyncio.create_task(order(client))
+    await endpoint.started.wait()
+    retry = asyncio.create_task(order(client))
+    await asyncio.sleep(0.1)
+    assert not retry.done()
+
+    endpoint.release.set()
+    first, retry = await first, await retry
+
+    assert endpoint.runs == 1
+    assert retry.json() == first.json() == {"item": "amoxicillin", "run": 1}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+async def test_a_key_reused_for_a_different_request_is_refused(client, endpoint):
+    await order(client, "amoxicillin")
+    resp = await order(client, "ibuprofen")
+
+    assert resp.status_code == 422
+    assert endpoint.runs == 1
+
+
+async def test_a_failed_attempt_releases_the_key(client, endpoint, user):
+    endpoint.fail = True
+    assert (await order(client)).status_code == 503
+    async with async_session() as db:
+        assert await db.scalar(select(IdempotencyKey).where(IdempotencyKey.user_id == user.id)) is None
+
+    endpoint.fail = False
+    retry = await order(client)
+    assert (retry.status_code, retry.json()["run"]) == (200, 2)
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+async def test_expired_keys_are_purged(user):
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=25)
+    async with async_session() as db:
+        await db.execute(insert(IdempotencyKey), [
+            {"user_id": user.id, "key": "old", "fingerprint": "f", "status": "completed", "created_at": long_ago},
+            {"user_id": user.id, "key": "new", "fingerprint": "f", "status": "completed"},
+        ])
+        await db.commit()
+
+    assert await purge_expired_keys(async_session, timedelta(hours=24)) >= 1
+
+    async with async_session() as db:
+        keys = await db.scalars(select(IdempotencyKey.key).where(IdempotencyKey.user_id == user.id))
+        assert keys.all() == ["new"]
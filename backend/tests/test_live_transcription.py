@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from app.services import live_transcription
+from app.services.live_transcription import LiveTranscript
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def whisper(monkeypatch):
+    """Segments finish when the test releases them; each one transcribes to its own bytes."""
+    release: dict[bytes, asyncio.Event] = {}
+
+    async def transcribe_audio(audio: bytes, mime_type: str) -> str:
+        await release.setdefault(audio, asyncio.Event()).wait()
+        return audio.decode()
+
+    monkeypatch.setattr(live_transcription, "transcribe_audio", transcribe_audio)
+
+    def done(audio: bytes) -> None:
+        release.setdefault(audio, asyncio.Event()).set()
+
+    return done
+
+
+async def test_transcript_settles_in_recording_order(whisper):
+    reported: list[tuple[int, list[str]]] = []
+
+    async def on_segments(first: int, texts: list[str]) -> None:
+        reported.append((first, texts))
+
+    live = LiveTranscript("audio/webm", on_segments, concurrency=2, max_pending_bytes=100)
+    for audio in (b"one", b"two", b"three"):
+        await live.add(audio)
+
+    whisper(b"two")
+    await asyncio.sleep(0)
+    assert live.transcript == ""  # "one" is still outstanding
+    whisper(b"one")
+    whisper(b"three")
+    assert await live.finish() == "one two three"
+    assert reported == [(0, ["one", "two"]), (2, ["three"])]
+
+
+async def test_add_waits_while_too_much_audio_is_pending(whisper):
+    async def on_segments(first: int, texts: list[str]) -> None:
+        pass
+
+    live = LiveTranscript("audio/webm", on_segments, concurrency=4, max_pending_bytes=8)
+    await live.add(b"aaaa")
+    await live.add(b"bbbb")
+    third = asyncio.create_task(live.add(b"cccc"))
+    await asyncio.sleep(0.01)
+    assert not third.done()
+
+    whisper(b"aaaa")
+    assert await asyncio.wait_for(third, 1) == 2
+
+    # Even a segment over the limit is taken once nothing is pending
+    whisper(b"bbbb")
+    whisper(b"cccc")
+    await live.finish()
+    whisper(b"x" * 20)
+    await live.add(b"x" * 20)
+    assert await live.finish() == "aaaa bbbb cccc " + "x" * 20
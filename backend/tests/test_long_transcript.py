@@ -0,0 +1,29 @@
+from app.services.long_transcript import estimate_tokens, split_transcript
+
+VISIT = (
+    "Doctor: How long has the cough lasted? Patient: About a week, worse at night. "
+    "Doctor: Any fever? Patient: A little, on and off.\nNurse: Temperature is 37.9."
+)
+
+
+def test_chunks_fit_the_budget_even_for_a_single_huge_word():
+    chunks = split_transcript("a" * 10000, 100)
+    assert len(chunks) == 25
+    assert max(estimate_tokens(c) for c in chunks) <= 100
+    assert "".join(chunks) == "a" * 10000
+
+
+def test_turns_split_apart_stay_on_their_own_lines():
+    chunks = split_transcript(VISIT * 20, 60, overlap_tokens=15)
+    assert len(chunks) > 1
+    assert max(estimate_tokens(c) for c in chunks) <= 60
+    for chunk in chunks:
+        for line in chunk.splitlines():
+            assert line.startswith(("Doctor:", "Patient:", "Nurse:"))
+
+
+def test_words_of_one_sentence_are_rejoined_with_spaces():
+    sentence = "Patient: " + " ".join(["cough"] * 60) + "."
+    chunks = split_transcript(sentence, 40)
+    assert all("\n" not in c for c in chunks)
+    assert " ".join(chunks) == sentence
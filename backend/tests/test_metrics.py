@@ -0,0 +1,17 @@
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metrics_need_the_scrape_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test") as client:
+        assert (await client.get("/metrics")).status_code == 401
+        assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+        resp = await client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert resp.status_code == 200
+    assert "helio_request_duration_seconds" in resp.text
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from app.core.config import ModelRoute, settings
+from app.services import model_routing
+from app.services.agent_runner import run_agent, stream_agent_text
+
+pytestmark = pytest.mark.anyio
+
+AGENT = "routed"
+
+
+class Fake:
+    """A model that answers ``text`` after ``delay`` seconds, or fails with ``error``."""
+
+    def __init__(self, name: str, text: str = "", *, delay: float = 0, error: bool = False) -> None:
+        self.name, self.text, self.delay, self.error = name, text, delay, error
+        self.calls = 0
+
+    async def _wait(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise ModelHTTPError(503, self.name, {"error": "overloaded"})
+
+    async def respond(self, messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await self._wait()
+        return ModelResponse(parts=[TextPart(content=self.text)])
+
+    async def stream(self, messages: list[ModelMessage], info: AgentInfo):
+        await self._wait()
+        for i, word in enumerate(self.text.split(" ")):
+            yield word if i == 0 else " " + word
+
+    def model(self) -> FunctionModel:
+        return FunctionModel(self.respond, stream_function=self.stream)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """Routes ``AGENT`` to the first fake given, falling back to the others in order."""
+
+    def install(*fakes: Fake, latency_target_s: float = 0) -> None:
+        by_name = {fake.name: fake.model() for fake in fakes}
+        monkeypatch.setattr(model_routing, "get_model", by_name.__getitem__)
+        monkeypatch.setitem(settings.MODEL_ROUTES, AGENT, [
+            ModelRoute(
+                name="default",
+                model=fakes[0].name,
+                fallbacks=[fake.name for fake in fakes[1:]],
+                latency_target_s=latency_target_s,
+            ),
+        ])
+
+    return install
+
+
+def calls(model: str, outcome: str) -> float:
+    return model_routing.LLM_CALLS._values.get((AGENT, "default", model, outcome), 0)
+
+
+def test_route_takes_the_first_rule_covering_the_input(monkeypatch):
+    monkeypatch.setitem(settings.MODEL_ROUTES, AGENT, [
+        ModelRoute(name="short", model="small", max_input_tokens=100, fallbacks=["large"]),
+        ModelRoute(name="medium", model="large", max_input_tokens=1000),
+        ModelRoute(name="long", model="reasoning", max_input_tokens=5000),
+    ])
+
+    assert model_routing.route(AGENT, 100).models == ("small", "large")
+    assert model_routing.route(AGENT, 101).name == "medium"
+    assert model_routing.route(AGENT, 4000).name == "long"
+    # Larger than every rule: the last one
+    assert model_routing.route(AGENT, 10_000).name == "long"
+
+
+async def test_a_failing_model_falls_back_to_the_next(models):
+    primary, fallback = Fake("primary", error=True), Fake("fallback", "From the fallback")
+    models(primary, fallback)
+    before = calls("primary", "error"), calls("fallback", "ok")
+
+    assert await run_agent(AGENT, Agent(output_type=str), "hello") == "From the fallback"
+    assert (calls("primary", "error"), calls("fallback", "ok")) == (before[0] + 1, before[1] + 1)
+
+
+async def test_a_model_past_the_latency_target_is_given_up_on(models):
+    slow, fallback = Fake("slow", "Too late", delay=5), Fake("fallback", "In time")
+    models(slow, fallback, latency_target_s=0.05)
+    before = calls("slow", "timeout")
+
+    assert await run_agent(AGENT, Agent(output_type=str), "hello") == "In time"
+    assert calls("slow", "timeout") == before + 1
+
+
+async def test_the_last_model_gets_as_long_as_it_takes(models):
+    only = Fake("only", "Eventually", delay=0.1)
+    models(only, latency_target_s=0.01)
+
+    assert await run_agent(AGENT, Agent(output_type=str), "hello") == "Eventually"
+
+
+async def test_when_every_model_fails_the_last_error_is_raised(models):
+    first, second = Fake("first", error=True), Fake("second", error=True)
+    models(first, second)
+
+    with pytest.raises(ModelHTTPError) as raised:
+        await run_agent(AGENT, Agent(output_type=str), "hello")
+    assert raised.value.model_name == "second"
+    assert (first.calls, second.calls) == (1, 1)
+
+
+async def stream(prompt: str = "hello") -> list[str]:
+    return [chunk async for chunk in stream_agent_text(AGENT, Agent(output_type=str), prompt)]
+
+
+async def test_a_stream_falls_back_before_its_first_text(models):
+    failing, slow, fallback = Fake("failing", error=True), Fake("slow", "Late", delay=5), Fake("fallback", "Take rest")
+    models(failing, slow, fallback, latency_target_s=0.05)
+
+    assert "".join(await stream()) == "Take rest"
+    assert (failing.calls, slow.calls, fallback.calls) == (1, 1, 1)
+
+
+async def test_a_stream_that_fails_on_every_model_raises(models):
+    models(Fake("first", error=True), Fake("second", error=True))
+
+    with pytest.raises(ModelHTTPError):
+        await stream()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app.services import overpass_mirrors, pharmacy_lookup
+from app.services.overpass_mirrors import OverpassMirrorPool, OverpassUnavailableError
+from tests.stubs import serving
+
+pytestmark = pytest.mark.anyio
+
+CENTER = (28.61, 77.21)
+
+
+class Mirror:
+    """An Overpass stand-in whose latency and failures the test controls."""
+
+    def __init__(self, delay: float = 0.0, failing: bool = False) -> None:
+        self.delay = delay
+        self.failing = failing
+        self.hits = 0
+        self.url = ""
+        self.app = FastAPI()
+        self.app.post("/api/interpreter")(self.interpreter)
+
+    async def interpreter(self):
+        self.hits += 1
+        await asyncio.sleep(self.delay)
+        if self.failing:
+            return JSONResponse({"error": "overloaded"}, status_code=504)
+        elements = [
+            {"type": "node", "id": i, "lat": CENTER[0] + i / 1000, "lon": CENTER[1],
+             "tags": {"amenity": "pharmacy", "name": f"Pharmacy {i}"}}
+            for i in range(1, 4)
+        ]
+        return {"version": 0.6, "elements": elements}
+
+
+async def start(stack: AsyncExitStack, *mirrors: Mirror) -> None:
+    for mirror in mirrors:
+        mirror.url = await stack.enter_async_context(serving(mirror.app)) + "/api/interpreter"
+
+
+def pool(*mirrors: Mirror, hedge_delay: float = 5.0, threshold: int = 3, cooldown: float = 30.0):
+    return OverpassMirrorPool(
+        [m.url for m in mirrors], hedge_delay=hedge_delay, failure_threshold=threshold, cooldown=cooldown
+    )
+
+
+async def fetch_url(url: str) -> str:
+    async with httpx.AsyncClient() as client:
+        resp = await client.post(url, data={"data": "query"})
+        resp.raise_for_status()
+    return url
+
+
+async def test_slow_mirror_is_hedged_after_the_delay():
+    slow, fast = Mirror(delay=1.0), Mirror()
+    async with AsyncExitStack() as stack:
+        await start(stack, slow, fast)
+        mirrors = pool(slow, fast, hedge_delay=0.1)
+
+        started = time.monotonic()
+        assert await mirrors.run(fetch_url) == fast.url
+        assert time.monotonic() - started < 0.5
+        assert (slow.hits, fast.hits) == (1, 1)
+        # Losing the race is not held against the slow mirror
+        assert mirrors.mirrors[0].consecutive_failures == 0
+
+
+async def test_failure_fails_over_without_waiting_for_the_hedge():
+    broken, healthy = Mirror(failing=True), Mirror()
+    async with AsyncExitStack() as stack:
+        await start(stack, broken, healthy)
+        mirrors = pool(broken, healthy, hedge_delay=5.0)
+
+        started = time.monotonic()
+        assert await mirrors.run(fetch_url) == healthy.url
+        assert time.monotonic() - started < 1.0
+        assert mirrors.mirrors[0].consecutive_failures == 1
+        # The healthy mirror now ranks first
+        assert mirrors.ranked()[0].url == healthy.url
+
+
+async def test_breaker_opens_then_half_opens_after_the_cooldown():
+    flaky, backup = Mirror(failing=True), Mirror(failing=True)
+    async with AsyncExitStack() as stack:
+        await start(stack, flaky, backup)
+        mirrors = pool(flaky, backup, threshold=2, cooldown=0.3)
+
+        for _ in range(2):
+            with pytest.raises(OverpassUnavailableError):
+                await mirrors.run(fetch_url)
+        assert mirrors.ranked() == []
+        with pytest.raises(OverpassUnavailableError, match="circuit-open"):
+            await mirrors.run(fetch_url)
+        assert (flaky.hits, backup.hits) == (2, 2)
+
+        # Half-open: one more failure re-opens the breaker at once
+        await asyncio.sleep(0.35)
+        assert len(mirrors.ranked()) == 2
+        with pytest.raises(OverpassUnavailableError):
+            await mirrors.run(fetch_url)
+        assert mirrors.ranked() == []
+
+        # A success closes it
+        await asyncio.sleep(0.35)
+        flaky.failing = False
+        assert await mirrors.run(fetch_url) == flaky.url
+        health = mirrors.mirrors[0]
+        assert (health.consecutive_failures, health.opened_at) == (0, None)
+
+
+async def test_last_good_result_is_served_stale_when_every_mirror_fails(monkeypatch):
+    first, second = Mirror(), Mirror()
+    async with AsyncExitStack() as stack:
+        await start(stack, first, second)
+        monkeypatch.setattr(overpass_mirrors, "_pool", pool(first, second, hedge_delay=0.1))
+        monkeypatch.setattr(pharmacy_lookup, "_result_cache", OrderedDict())
+
+        fresh = await pharmacy_lookup.find_nearby_locations(lat=CENTER[0], lon=CENTER[1])
+        assert not fresh["stale"]
+        assert [r.name for r in fresh["results"]] == ["Pharmacy 1", "Pharmacy 2", "Pharmacy 3"]
+
+        first.failing = second.failing = True
+        stale = await pharmacy_lookup.find_nearby_locations(lat=CENTER[0], lon=CENTER[1])
+        assert stale["stale"]
+        assert stale["results"] == fresh["results"]
+
+        # Nothing to fall back on for a search never answered
+        with pytest.raises(OverpassUnavailableError):
+            await pharmacy_lookup.find_nearby_locations(lat=CENTER[0] + 1, lon=CENTER[1])
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+import httpx
+import pytest
+
+from app.services import pharmacy_lookup
+from app.services.pharmacy_lookup import _NearestCollector
+
+CENTER = (28.6139, 77.2090)
+
+
+def element(eid: int, offset: float, name: str | None = "Pharmacy") -> dict:
+    tags = {"amenity": "pharmacy"}
+    if name:
+        tags["name"] = f"{name} {eid}"
+    return {"type": "node", "id": eid, "lat": CENTER[0] + offset, "lon": CENTER[1], "tags": tags}
+
+
+def test_collector_keeps_the_nearest_and_only_their_ids():
+    collector = _NearestCollector(*CENTER, limit=3)
+    for eid in range(100):
+        collector.add(element(eid, 0.001 * (100 - eid)))
+    collector.add(element(1000, 0.0001, name=None))
+
+    assert [r.id for r in collector.results()] == ["99", "98", "97"]
+    assert collector._kept == {99, 98, 97}
+
+
+def test_collector_drops_a_repeated_element():
+    collector = _NearestCollector(*CENTER, limit=None)
+    for eid in (1, 2, 1, 3, 2):
+        collector.add(element(eid, 0.001 * eid))
+
+    assert [r.id for r in collector.results()] == ["1", "2", "3"]
+
+
+@pytest.mark.anyio
+async def test_geocode_cache_keeps_the_most_recent_zipcodes(monkeypatch):
+    monkeypatch.setattr(pharmacy_lookup, "_geocode_cache", OrderedDict())
+    monkeypatch.setattr(pharmacy_lookup, "_GEOCODE_CACHE_SIZE", 3)
+    lookups: list[str] = []
+
+    def nominatim(request: httpx.Request) -> httpx.Response:
+        zipcode = request.url.params["postalcode"]
+        lookups.append(zipcode)
+        return httpx.Response(200, json=[{"lat": "28.6", "lon": zipcode[-2:]}])
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(nominatim)) as client:
+        for zipcode in ("110001", "110002", "110003", "110001", "110004"):
+            await pharmacy_lookup.geocode_indian_zipcode(zipcode, client)
+        assert list(pharmacy_lookup._geocode_cache) == ["110003", "110001", "110004"]
+
+        # Evicted as least recently used, so it is looked up again
+        await pharmacy_lookup.geocode_indian_zipcode("110002", client)
+    assert lookups == ["110001", "110002", "110003", "110004", "110002"]
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from app.database.instrumentation import assert_max_queries
+from app.database.session import engine
+from tests.factories import add_consultation, add_prescription
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_get_prescription(client, doctor):
+    prescription = await add_prescription(await add_consultation(doctor))
+    with assert_max_queries(2):
+        resp = await client.get(f"/api/v1/prescriptions/{prescription.id}")
+    assert resp.status_code == 200
+
+
+async def test_update_prescription(client, doctor):
+    prescription = await add_prescription(await add_consultation(doctor))
+    with assert_max_queries(4):
+        resp = await client.patch(f"/api/v1/prescriptions/{prescription.id}", json={"diagnosis": "Asthma"})
+    assert resp.status_code == 200
+    assert resp.json()["diagnosis"] == "Asthma"
+
+
+async def test_get_consultation(client, doctor):
+    consultation = await add_consultation(doctor, transcript="Dry cough for a week.")
+    await add_prescription(consultation)
+    with assert_max_queries(2):
+        resp = await client.get(f"/api/v1/consultations/{consultation.id}")
+    assert resp.status_code == 200
+
+
+async def test_failed_statements_are_not_left_timing(database):
+    async with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(ProgrammingError):
+                await conn.execute(text("SELECT no_such_column"))
+            await conn.rollback()
+        assert conn.sync_connection.info.get("query_start") == []
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.schemas.consultation import SummaryData
+from app.services import extraction, rederivation
+from app.services.extraction import input_hash
+from app.services.prescription_agent import PrescriptionAgentResult
+from app.services.rederivation import REDERIVATIONS, Debouncer, rederive
+from tests.factories import add_consultation
+
+pytestmark = pytest.mark.anyio
+
+TRANSCRIPT = "Doctor: Any chest pain? Patient: No pain."
+
+
+def outcomes(name: str) -> float:
+    return REDERIVATIONS._values.get((name,), 0)
+
+
+def test_cosmetic_edits_keep_the_hash_and_punctuation_does_not():
+    assert input_hash(TRANSCRIPT) == input_hash("doctor:  ANY chest pain?\nPatient: No pain.")
+    assert input_hash("Patient: it’s fine — mostly") == input_hash("Patient: it's fine - mostly")
+    assert input_hash("Patient: No pain?") != input_hash("Patient: No pain.")
+    assert input_hash("Take 2.5 mg, then 5") != input_hash("Take 2 5 mg then 5")
+
+
+async def test_debouncer_runs_the_latest_action_once_edits_pause():
+    debouncer = Debouncer(0.05)
+    ran: list[str] = []
+
+    def action(name: str):
+        async def run() -> None:
+            ran.append(name)
+        return run
+
+    assert debouncer.touch("c1", action("first")) is True
+    await asyncio.sleep(0.02)
+    assert debouncer.touch("c1", action("second")) is False
+    assert debouncer.touch("c2", action("other")) is True
+    await asyncio.sleep(0.1)
+
+    assert sorted(ran) == ["other", "second"]
+
+
+async def test_debouncer_runs_again_after_a_touch_during_a_run():
+    debouncer = Debouncer(0.01)
+    release = asyncio.Event()
+    ran: list[str] = []
+
+    async def slow() -> None:
+        ran.append("slow")
+        await release.wait()
+
+    async def again() -> None:
+        ran.append("again")
+
+    debouncer.touch("c1", slow)
+    await asyncio.sleep(0.05)
+    assert ran == ["slow"]
+    # Waits for the run going now instead of starting beside it
+    assert debouncer.touch("c1", again) is True
+    await asyncio.sleep(0.05)
+    assert ran == ["slow"]
+
+    release.set()
+    await debouncer.drain(1)
+    await asyncio.sleep(0.05)
+    assert ran == ["slow", "again"]
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    calls: list[str] = []
+
+    async def prescription(transcript: str) -> PrescriptionAgentResult:
+        calls.append("prescription")
+        return PrescriptionAgentResult(
+            symptoms=[], diagnosis=["Reflux"], allergies=[], notes=[], medicines=[], instructions=[]
+        )
+
+    async def summary(transcript: str) -> SummaryData:
+        calls.append("summary")
+        return SummaryData(chiefComplaint="Chest pain")
+
+    async def title(transcript: str) -> str:
+        calls.append("title")
+        return "Chest pain"
+
+    monkeypatch.setitem(extraction.AGENT_CALLS, "prescription", prescription)
+    monkeypatch.setitem(extraction.AGENT_CALLS, "summary", summary)
+    monkeypatch.setitem(extraction.AGENT_CALLS, "title", title)
+    return calls
+
+
+async def test_rederive_calls_no_model_when_the_hashes_are_current(doctor, agents):
+    current = input_hash(TRANSCRIPT)
+    consultation = await add_consultation(
+        doctor, transcript=TRANSCRIPT, input_hashes=dict.fromkeys(extraction.EXTRACTED_FIELDS, current)
+    )
+    before = outcomes("unchanged")
+
+    await rederive(consultation.id, async_session)
+
+    assert agents == []
+    assert outcomes("unchanged") == before + 1
+
+
+async def test_rederive_is_superseded_by_an_edit_while_its_agents_run(doctor, agents, monkeypatch):
+    consultation = await add_consultation(doctor, transcript=TRANSCRIPT)
+    summary = extraction.AGENT_CALLS["summary"]
+
+    async def edited_meanwhile(transcript: str) -> SummaryData:
+        async with async_session() as db:
+            await db.execute(
+                update(Consultation)
+                .where(Consultation.id == consultation.id)
+                .values(transcript="Doctor: Any chest pain? Patient: Yes, at night.")
+            )
+            await db.commit()
+        return await summary(transcript)
+
+    monkeypatch.setitem(extraction.AGENT_CALLS, "summary", edited_meanwhile)
+    scheduled: list = []
+    monkeypatch.setattr(rederivation, "schedule_rederivation", lambda *args: scheduled.append(args))
+    before = outcomes("superseded")
+
+    await rederive(consultation.id, async_session)
+
+    assert outcomes("superseded") == before + 1
+    async with async_session() as db:
+        stored = await db.get(Consultation, consultation.id)
+    assert (stored.title, stored.summary, stored.input_hashes) == (None, None, {})
+    # The edit schedules its own run; this one does not
+    assert scheduled == []
@@ -0,0 +1,158 @@
+import uuid
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.database.session import async_session
+from app.models.consultation import Consultation
+from app.models.reprocess_run import ReprocessRun
+from app.services import extraction, reprocessing
+from app.schemas.consultation import SummaryData
+from tests.factories import add_consultation
+
+pytestmark = pytest.mark.anyio
+
+
+class Crash(BaseException):
+    """Stands in for the process dying: nothing in reprocessing catches it."""
+
+
+class Summaries:
+    """A summary agent that records its transcripts and misbehaves on chosen ones."""
+
+    def __init__(self) -> None:
+        self.seen: list[str] = []
+        self.fail: set[str] = set()
+        self.crash: set[str] = set()
+        self.on_call = None
+
+    async def __call__(self, transcript: str) -> SummaryData:
+        self.seen.append(transcript)
+        if transcript in self.crash:
+            raise Crash()
+        if transcript in self.fail:
+            raise RuntimeError("model unavailable")
+        if self.on_call is not None:
+            await self.on_call(transcript)
+        return SummaryData(chiefComplaint=f"Summary of {transcript}")
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    agent = Summaries()
+    monkeypatch.setitem(extraction.AGENT_CALLS, "summary", agent)
+    return agent
+
+
+@pytest.fixture
+async def run_name(database):
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    yield name
+    async with async_session() as db:
+        await db.execute(delete(ReprocessRun).where(ReprocessRun.name == name))
+        await db.commit()
+
+
+async def seed(doctor, count: int) -> list[Consultation]:
+    rows = [await add_consultation(doctor, transcript=f"visit {i}") for i in range(count)]
+    return sorted(rows, key=lambda c: c.id)
+
+
+async def stored_summaries(doctor) -> dict[str, dict | None]:
+    async with async_session() as db:
+        rows = await db.execute(
+            select(Consultation.transcript, Consultation.summary).where(Consultation.doctor_id == doctor.id)
+        )
+        return dict(rows.all())
+
+
+def run_with(doctor, **kwargs):
+    kwargs.setdefault("batch_size", 2)
+    return reprocessing.reprocess(async_session, ["summary"], doctor_id=doctor.id, **kwargs)
+
+
+async def test_a_run_that_dies_resumes_after_its_last_written_page(doctor, summaries, run_name):
+    rows = await seed(doctor, 5)
+    summaries.crash = {rows[2].transcript}
+
+    with pytest.raises(Crash):
+        await run_with(doctor, run=run_name)
+    async with async_session() as db:
+        run = await db.scalar(select(ReprocessRun).where(ReprocessRun.name == run_name))
+    assert (run.cursor, run.processed, run.finished_at) == (rows[1].id, 2, None)
+
+    summaries.crash, summaries.seen = set(), []
+    report = await run_with(doctor, run=run_name)
+
+    assert sorted(summaries.seen) == sorted(r.transcript for r in rows[2:])
+    assert (report.processed, report.changed, report.failed, report.finished) == (5, 5, 0, True)
+    assert all(summary is not None for summary in (await stored_summaries(doctor)).values())
+
+    # Finished: running it again does nothing
+    summaries.seen = []
+    assert (await run_with(doctor, run=run_name)).processed == 5
+    assert summaries.seen == []
+
+
+async def test_failed_consultations_are_kept_and_retried(doctor, summaries, run_name):
+    rows = await seed(doctor, 3)
+    summaries.fail = {rows[1].transcript}
+
+    report = await run_with(doctor, run=run_name)
+    assert (report.processed, report.changed, report.failed, report.finished) == (3, 2, 1, True)
+    async with async_session() as db:
+        assert await db.scalar(select(ReprocessRun.failed_ids).where(ReprocessRun.name == run_name)) == [
+            str(rows[1].id)
+        ]
+
+    # Still failing: it stays listed
+    summaries.seen = []
+    report = await run_with(doctor, run=run_name, retry_failed=True)
+    assert summaries.seen == [rows[1].transcript]
+    assert report.failed == 1
+
+    summaries.fail, summaries.seen = set(), []
+    report = await run_with(doctor, run=run_name, retry_failed=True)
+    assert summaries.seen == [rows[1].transcript]
+    assert (report.processed, report.changed, report.failed) == (3, 3, 0)
+    retried = (await stored_summaries(doctor))[rows[1].transcript]
+    assert retried["chiefComplaint"] == f"Summary of {rows[1].transcript}"
+    async with async_session() as db:
+        assert await db.scalar(select(ReprocessRun.failed_ids).where(ReprocessRun.name == run_name)) == []
+
+
+async def test_dry_run_reports_diffs_and_writes_nothing(doctor, summaries):
+    rows = await seed(doctor, 2)
+    done = SummaryData(chiefComplaint="Summary of already done").model_dump(mode="json")
+    await add_consultation(doctor, transcript="already done", summary=done)
+    changes = []
+
+    report = await run_with(doctor, dry_run=True, on_change=changes.append)
+
+    assert (report.processed, report.changed, report.finished) == (3, 2, True)
+    assert sorted((c.consultation_id, c.field, c.before) for c in changes) == sorted(
+        (r.id, "summary", None) for r in rows
+    )
+    assert {c.after["chiefComplaint"] for c in changes} == {"Summary of visit 0", "Summary of visit 1"}
+    assert (await stored_summaries(doctor))["visit 0"] is None
+
+
+async def test_transcript_edited_while_its_agents_ran_is_left_stale(doctor, summaries, run_name):
+    rows = await seed(doctor, 2)
+    edited = rows[0]
+
+    async def edit(transcript: str) -> None:
+        if transcript == edited.transcript:
+            async with async_session() as db:
+                await db.execute(
+                    update(Consultation).where(Consultation.id == edited.id).values(transcript="corrected")
+                )
+                await db.commit()
+
+    summaries.on_call = edit
+    report = await run_with(doctor, run=run_name)
+
+    assert (report.processed, report.changed, report.stale) == (2, 1, 1)
+    stored = await stored_summaries(doctor)
+    assert stored["corrected"] is None
+    assert stored[rows[1].transcript] is not None
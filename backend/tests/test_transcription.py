@@ -0,0 +1,25 @@
+import pytest
+
+from app.core.config import settings
+from app.services import transcription
+from app.services.audio_preprocess import TrimmedAudio
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_silent_recording_is_recorded_and_replayed(monkeypatch, tmp_path):
+    async def all_silence(audio: bytes, mime_type: str) -> TrimmedAudio:
+        return TrimmedAudio(data=b"", mime_type="audio/wav", input_seconds=3.0, kept_seconds=0.0)
+
+    monkeypatch.setattr(transcription, "preprocess_for_transcription", all_silence)
+    monkeypatch.setattr(settings, "AUDIO_TRIM_SILENCE", True)
+    monkeypatch.setattr(settings, "CASSETTE_DIR", str(tmp_path))
+
+    monkeypatch.setattr(settings, "CASSETTE_MODE", "record")
+    assert await transcription.transcribe_audio(b"silence", "audio/webm") == ""
+    assert len(list(tmp_path.glob("transcription/*.json"))) == 1
+
+    # Replay finds it without trimming or calling Whisper
+    monkeypatch.setattr(transcription, "preprocess_for_transcription", None)
+    monkeypatch.setattr(settings, "CASSETTE_MODE", "replay")
+    assert await transcription.transcribe_audio(b"silence", "audio/webm") == ""
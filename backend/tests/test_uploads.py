@@ -0,0 +1,60 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.database.session import async_session
+from app.models.blob import Blob, ConsultationBlob
+from app.services import uploads
+from app.services.blob_store import LocalBlobBackend, iter_chunks
+from tests.factories import add_consultation
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_content_published_by_a_failed_commit_is_left_for_gc(doctor, monkeypatch, tmp_path):
+    backend = LocalBlobBackend(str(tmp_path))
+    monkeypatch.setattr(uploads, "get_blob_backend", lambda: backend)
+    consultation = await add_consultation(doctor)
+    staged = await backend.stage(iter_chunks(uuid.uuid4().bytes * 64))
+    upload = uploads.Upload(consultation.id, staged, "audio", "audio/webm", "visit.webm")
+
+    try:
+        async with async_session() as db:
+            commit = db.commit
+
+            async def fail_once() -> None:
+                monkeypatch.setattr(db, "commit", commit)
+                raise OSError("connection lost")
+
+            monkeypatch.setattr(db, "commit", fail_once)
+            with pytest.raises(OSError):
+                await uploads.keep_uploads(db, [upload])
+
+        assert os.path.exists(backend._path(staged.sha256))
+        async with async_session() as db:
+            assert await db.scalar(select(Blob.size).where(Blob.sha256 == staged.sha256)) == staged.size
+            links = await db.scalars(select(ConsultationBlob).where(ConsultationBlob.sha256 == staged.sha256))
+            assert links.all() == []
+    finally:
+        async with async_session() as db:
+            await db.execute(delete(Blob).where(Blob.sha256 == staged.sha256))
+            await db.commit()
+
+
+async def test_staged_copies_are_dropped_when_attaching_fails(doctor, monkeypatch, tmp_path):
+    backend = LocalBlobBackend(str(tmp_path))
+    monkeypatch.setattr(uploads, "get_blob_backend", lambda: backend)
+    staged = await backend.stage(iter_chunks(b"never linked"))
+    # No such consultation: the link insert fails before anything is published
+    upload = uploads.Upload(uuid.uuid4(), staged, "image", "image/png", None)
+
+    async with async_session() as db:
+        with pytest.raises(Exception):
+            await uploads.keep_uploads(db, [upload])
+
+    assert not os.path.exists(staged.location)
+    assert not os.path.exists(backend._path(staged.sha256))
+    async with async_session() as db:
+        assert await db.scalar(select(Blob).where(Blob.sha256 == staged.sha256)) is None